@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_asgi_application()
+
+## Redirects for live short codes are answered on the event loop ahead of the middleware
+## stack and DRF; everything else falls through to Django.
+from url_app.fastpath import AsyncRedirectFastPath
+application = AsyncRedirectFastPath(application=application)
@@ -0,0 +1,3 @@
+"""
+Database backends and connection management referenced from settings.DATABASES.
+"""
@@ -0,0 +1,261 @@
+from collections import deque
+from os import getpid
+from threading import Condition, Lock
+from time import monotonic
+from typing import Callable, Dict, Tuple
+
+from core.metrics import registry
+
+from core import logger
+
+
+class PoolTimeout(Exception):
+    """
+    No connection became available within the pool's checkout timeout.
+    """
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of DB-API connections of one worker process.
+
+    `getconn()` hands out an idle connection, opens a new one while fewer than `max_size` exist,
+    or waits up to `timeout` seconds for one to be returned. Idle connections are health-checked
+    with `check(connection)` before reuse once they have been idle for `check_after` seconds,
+    and are replaced after `max_lifetime` seconds (0 disables either).
+    """
+
+    def __init__(self, connect: Callable = None, check: Callable = None, reset: Callable = None,
+                 min_size: int = 0, max_size: int = 10, timeout: float = 10.0, check_after: float = 30.0,
+                 max_lifetime: float = 0.0, name: str = "default") -> None:
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError("Pool sizes must satisfy 0 <= min_size <= max_size and max_size >= 1.")
+
+        self.connect = connect
+        self.check = check
+        self.reset = reset
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_after = check_after
+        self.max_lifetime = max_lifetime
+        self.name = name
+
+        ## (connection, opened at, returned at); the most recently returned connection is reused first.
+        self._idle: deque = deque()
+        self._opened: Dict[int, float] = {}
+        self._condition = Condition(Lock())
+        self.size: int = 0
+        self.waiting: int = 0
+        self.waits: int = 0
+        self.timeouts: int = 0
+        self.discarded: int = 0
+        self.wait_seconds: float = 0.0
+
+    @property
+    def in_use(self) -> int:
+        return self.size - len(self._idle)
+
+    def _open(self):
+        try:
+            connection = self.connect()
+        except Exception:
+            with self._condition:
+                self.size -= 1
+                self._condition.notify()
+            raise
+
+        self._opened[id(connection)] = monotonic()
+        return connection
+
+    def _discard(self, connection=None) -> None:
+        self._opened.pop(id(connection), None)
+        try:
+            connection.close()
+        except Exception as ex:
+            logger.warning(f"Closing pooled connection of '{self.name}' failed: {ex}")
+
+    def fill(self) -> None:
+        """
+        Opens connections until `min_size` exist.
+        """
+        while True:
+            with self._condition:
+                if self.size >= self.min_size:
+                    return
+                self.size += 1
+            connection = self._open()
+            self.putconn(connection)
+
+    def getconn(self):
+        deadline = None
+        while True:
+            with self._condition:
+                if not self._idle and self.size >= self.max_size:
+                    started = monotonic()
+                    if deadline is None:
+                        deadline = started + self.timeout
+                        self.waits += 1
+                    self.waiting += 1
+                    try:
+                        while not self._idle and self.size >= self.max_size:
+                            remaining = deadline - monotonic()
+                            if remaining <= 0:
+                                self.timeouts += 1
+                                raise PoolTimeout(
+                                    f"No connection of '{self.name}' available within {self.timeout}s "
+                                    f"({self.size} of {self.max_size} in use)."
+                                )
+                            self._condition.wait(remaining)
+                    finally:
+                        self.waiting -= 1
+                        self.wait_seconds += monotonic() - started
+
+                if self._idle:
+                    connection, opened, returned = self._idle.pop()
+                else:
+                    self.size += 1
+                    connection = None
+
+            if connection is None:
+                return self._open()
+
+            if self.usable(connection, opened, returned):
+                return connection
+
+            self._discard(connection)
+            with self._condition:
+                self.size -= 1
+                self.discarded += 1
+                self._condition.notify()
+
+    def usable(self, connection=None, opened: float = 0.0, returned: float = 0.0) -> bool:
+        now = monotonic()
+        if getattr(connection, "closed", False):
+            return False
+        if self.max_lifetime and now - opened > self.max_lifetime:
+            return False
+        if self.check and self.check_after >= 0 and now - returned >= self.check_after:
+            try:
+                return bool(self.check(connection))
+            except Exception as ex:
+                logger.warning(f"Pooled connection of '{self.name}' failed its health check: {ex}")
+                return False
+
+        return True
+
+    def putconn(self, connection=None, discard: bool = False) -> None:
+        if not discard and not getattr(connection, "closed", False) and self.reset:
+            try:
+                self.reset(connection)
+            except Exception as ex:
+                logger.warning(f"Resetting pooled connection of '{self.name}' failed: {ex}")
+                discard = True
+
+        if discard or getattr(connection, "closed", False):
+            self._discard(connection)
+            with self._condition:
+                self.size -= 1
+                self.discarded += 1
+                self._condition.notify()
+            return
+
+        with self._condition:
+            self._idle.append((connection, self._opened.get(id(connection), monotonic()), monotonic()))
+            self._condition.notify()
+
+    def close(self) -> None:
+        with self._condition:
+            idle, self._idle = list(self._idle), deque()
+            self.size -= len(idle)
+            self._condition.notify_all()
+        for connection, _, _ in idle:
+            self._discard(connection)
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "size": self.size,
+                "idle": len(self._idle),
+                "inUse": self.in_use,
+                "waiting": self.waiting,
+                "minSize": self.min_size,
+                "maxSize": self.max_size,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+                "discarded": self.discarded,
+                "waitSeconds": round(self.wait_seconds, 6)
+            }
+
+
+class PoolRegistry:
+    """
+    Pools of the current worker process, one per database alias and connection parameters
+    (e.g. the test database gets its own). Pooled connections must not be shared with a
+    forked child, so a new pid gets pools of its own.
+    """
+
+    _pools: Dict[Tuple[str, str, int], ConnectionPool] = {}
+    _lock = Lock()
+
+    @classmethod
+    def get(cls, alias: str = None, signature: str = "", factory: Callable = None) -> ConnectionPool:
+        key = (alias, signature, getpid())
+        pool = cls._pools.get(key)
+        if pool is not None:
+            return pool
+
+        with cls._lock:
+            pool = cls._pools.get(key)
+            if pool is None:
+                for stale in [other for other in cls._pools if other[2] != key[2]]:
+                    ## Inherited from the parent process; the parent still owns those sockets.
+                    del cls._pools[stale]
+                pool = cls._pools[key] = factory()
+        return pool
+
+    @classmethod
+    def stats(cls) -> Dict[str, dict]:
+        """
+        Summed stats of the current process's pools by alias.
+        """
+        pid = getpid()
+        totals: Dict[str, dict] = {}
+        for (alias, _, owner), pool in list(cls._pools.items()):
+            if owner != pid:
+                continue
+            total = totals.setdefault(alias, {})
+            for key, value in pool.stats().items():
+                total[key] = total.get(key, 0) + value
+
+        return totals
+
+    @classmethod
+    def collect_metrics(cls) -> None:
+        for alias, stats in cls.stats().items():
+            db_pool_connections.set(stats["inUse"], alias=alias, state="in_use")
+            db_pool_connections.set(stats["idle"], alias=alias, state="idle")
+            db_pool_max_connections.set(stats["maxSize"], alias=alias)
+            db_pool_waiting.set(stats["waiting"], alias=alias)
+            db_pool_waits_total.set_total(stats["waits"], alias=alias)
+            db_pool_timeouts_total.set_total(stats["timeouts"], alias=alias)
+            db_pool_discarded_total.set_total(stats["discarded"], alias=alias)
+            db_pool_wait_seconds_total.set_total(stats["waitSeconds"], alias=alias)
+
+
+## Starved when in_use sits at db_pool_max_connections and db_pool_waits_total keeps growing.
+db_pool_connections = registry.gauge(
+    "db_pool_connections", "Pooled database connections by state: in_use or idle.", ("alias", "state"))
+db_pool_max_connections = registry.gauge(
+    "db_pool_max_connections", "Upper bound of pooled database connections.", ("alias",))
+db_pool_waiting = registry.gauge(
+    "db_pool_waiting", "Threads currently waiting for a pooled database connection.", ("alias",))
+db_pool_waits_total = registry.counter(
+    "db_pool_waits_total", "Checkouts that had to wait for a connection to be returned.", ("alias",))
+db_pool_timeouts_total = registry.counter(
+    "db_pool_timeouts_total", "Checkouts that gave up after the pool timeout.", ("alias",))
+db_pool_discarded_total = registry.counter(
+    "db_pool_discarded_total", "Pooled connections closed as broken, expired or failing health checks.", ("alias",))
+db_pool_wait_seconds_total = registry.counter(
+    "db_pool_wait_seconds_total", "Seconds spent waiting for pooled connections.", ("alias",))
+registry.add_collector(PoolRegistry.collect_metrics)
@@ -0,0 +1,3 @@
+"""
+PostgreSQL backend that checks connections out of a per-process pool instead of opening one per request.
+"""
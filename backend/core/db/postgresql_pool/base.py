@@ -0,0 +1,100 @@
+import json
+
+import psycopg2
+from psycopg2 import extensions
+from django.db.backends.postgresql.base import DatabaseWrapper as PostgresDatabaseWrapper
+
+from core.db.pool import ConnectionPool, PoolRegistry, PoolTimeout
+
+from core import logger
+
+
+class DatabaseWrapper(PostgresDatabaseWrapper):
+    """
+    django.db.backends.postgresql, except that connections are checked out of a ConnectionPool
+    and handed back to it when Django closes them (end of request with CONN_MAX_AGE = 0,
+    or once CONN_MAX_AGE has passed).
+
+    Pool settings live in the database's "POOL" dict: MIN_SIZE, MAX_SIZE, TIMEOUT (seconds a
+    checkout waits), CHECK_AFTER (idle seconds before a reused connection is probed with
+    SELECT 1) and MAX_LIFETIME (seconds before a connection is replaced; 0 keeps it).
+    """
+
+    POOL_DEFAULTS: dict = {
+        "MIN_SIZE": 0,
+        "MAX_SIZE": 10,
+        "TIMEOUT": 10.0,
+        "CHECK_AFTER": 30.0,
+        "MAX_LIFETIME": 0.0,
+    }
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.pool: ConnectionPool = None
+
+    @property
+    def pool_settings(self) -> dict:
+        return {**self.POOL_DEFAULTS, **self.settings_dict.get("POOL", {})}
+
+    @classmethod
+    def ping(cls, connection=None) -> bool:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        ## Leave no transaction open behind the probe when autocommit is off.
+        connection.rollback()
+        return True
+
+    @classmethod
+    def reset(cls, connection=None) -> None:
+        status = connection.get_transaction_status()
+        if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            raise psycopg2.InterfaceError("connection is broken")
+        if status != extensions.TRANSACTION_STATUS_IDLE:
+            connection.rollback()
+
+    def create_pool(self, conn_params: dict = None) -> ConnectionPool:
+        options = self.pool_settings
+        pool = ConnectionPool(
+            connect=lambda: super(DatabaseWrapper, self).get_new_connection(conn_params),
+            check=self.ping,
+            reset=self.reset,
+            min_size=int(options["MIN_SIZE"]),
+            max_size=int(options["MAX_SIZE"]),
+            timeout=float(options["TIMEOUT"]),
+            check_after=float(options["CHECK_AFTER"]),
+            max_lifetime=float(options["MAX_LIFETIME"]),
+            name=self.alias
+        )
+        try:
+            pool.fill()
+        except psycopg2.Error as ex:
+            logger.warning(f"Could not open the {pool.min_size} initial connections of '{self.alias}': {ex}")
+
+        return pool
+
+    def get_new_connection(self, conn_params: dict = None):
+        signature = json.dumps(conn_params, sort_keys=True, default=str)
+        self.pool = PoolRegistry.get(
+            alias=self.alias, signature=signature, factory=lambda: self.create_pool(conn_params))
+        try:
+            connection = self.pool.getconn()
+        except PoolTimeout as ex:
+            ## Raised as a driver error so Django wraps it into django.db.OperationalError.
+            raise psycopg2.OperationalError(str(ex)) from ex
+
+        options = self.settings_dict["OPTIONS"]
+        self.isolation_level = options.get("isolation_level", connection.isolation_level)
+        if self.isolation_level != connection.isolation_level:
+            connection.set_session(isolation_level=self.isolation_level)
+
+        return connection
+
+    def _close(self) -> None:
+        if self.connection is None:
+            return
+
+        if self.pool is None:
+            return super()._close()
+
+        with self.wrap_database_errors:
+            self.pool.putconn(self.connection)
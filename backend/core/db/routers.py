@@ -0,0 +1,137 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from random import choice
+
+from django.conf import settings
+from django.core import signing
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.http import HttpRequest, HttpResponse
+
+from core.timing import AsyncCapableMiddleware
+
+## Routing state of the current request: {"pinned": reads go to the primary, "wrote": a routed model was written}.
+## None outside of requests (management commands, background threads), where writes do not pin.
+_routing_state: ContextVar = ContextVar("db_routing_state", default=None)
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends reads of DATABASE_REPLICA_MODELS to a random alias of DATABASE_REPLICAS and every
+    write to the primary (`default`).
+
+    Reads stay on the primary inside transactions, under `use_primary()`, and for the rest of
+    a request once it has written a routed model. ReplicaStickinessMiddleware extends that to
+    the client's following requests for DB_STICKY_SECONDS, so a link is never read back from a
+    replica that has not caught up with its creation yet.
+    """
+
+    @classmethod
+    def routed(cls, model=None) -> bool:
+        return bool(settings.DATABASE_REPLICAS) and model._meta.label_lower in settings.DATABASE_REPLICA_MODELS
+
+    @classmethod
+    @contextmanager
+    def use_primary(cls):
+        """
+        Read from the primary within the block, e.g. for reads that must not miss recent writes.
+        """
+        token = _routing_state.set({"pinned": True, "wrote": False})
+        try:
+            yield
+        finally:
+            _routing_state.reset(token)
+
+    def db_for_read(self, model=None, **hints) -> str:
+        if not self.routed(model):
+            return None
+
+        state = _routing_state.get()
+        if state and (state["pinned"] or state["wrote"]):
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+
+        return choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model=None, **hints) -> str:
+        if not self.routed(model):
+            return None
+
+        state = _routing_state.get()
+        if state is not None:
+            state["wrote"] = True
+
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1=None, obj2=None, **hints) -> bool:
+        ## Replicas hold the same rows as the primary.
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+
+        return None
+
+
+class ReplicaStickinessMiddleware(AsyncCapableMiddleware):
+    """
+    Pins a client's reads to the primary for DB_STICKY_SECONDS after one of its requests wrote a
+    routed model, through a signed cookie. Does nothing when no replicas are configured.
+    """
+
+    SALT: str = "core.db.routers.sticky"
+
+    def handle(self, request: HttpRequest) -> HttpResponse:
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        state, token = self.pin(request=request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing_state.reset(token)
+
+        return self.stick(response=response, state=state)
+
+    async def ahandle(self, request: HttpRequest) -> HttpResponse:
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+
+        ## sync_to_async copies the context into its threads, so the views see (and update) this state.
+        state, token = self.pin(request=request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _routing_state.reset(token)
+
+        return self.stick(response=response, state=state)
+
+    @classmethod
+    def is_sticky(cls, cookies: dict = None) -> bool:
+        """
+        Whether the cookies carry a valid, unexpired sticky cookie. Checked the way
+        `HttpRequest.get_signed_cookie` does, for callers that run ahead of the request object.
+        """
+        value = (cookies or {}).get(settings.DB_STICKY_COOKIE)
+        if not value:
+            return False
+
+        try:
+            signing.get_cookie_signer(salt=settings.DB_STICKY_COOKIE + cls.SALT).unsign(
+                value, max_age=settings.DB_STICKY_SECONDS)
+        except signing.BadSignature:
+            return False
+
+        return True
+
+    def pin(self, request: HttpRequest = None):
+        state = {"pinned": self.is_sticky(cookies=request.COOKIES), "wrote": False}
+        return state, _routing_state.set(state)
+
+    def stick(self, response: HttpResponse = None, state: dict = None) -> HttpResponse:
+        if state["wrote"]:
+            response.set_signed_cookie(
+                settings.DB_STICKY_COOKIE, "1", salt=self.SALT, max_age=settings.DB_STICKY_SECONDS,
+                httponly=True, samesite="Lax"
+            )
+
+        return response
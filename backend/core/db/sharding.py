@@ -0,0 +1,142 @@
+from bisect import bisect
+from hashlib import blake2b
+from threading import Lock
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+class HashRing:
+    """
+    Consistent hash ring over database aliases. Every node owns `vnodes` points on a 64-bit
+    ring and a key belongs to the first point at or after its own hash, so adding or removing
+    a node only moves the keys of the points it gains or loses (about 1/N of them).
+
+    Placement depends on the node names only: renaming an alias moves its keys.
+    """
+
+    def __init__(self, nodes: Iterable[str] = None, vnodes: int = 128) -> None:
+        self.nodes: Tuple[str, ...] = tuple(nodes or ())
+        if not self.nodes:
+            raise ValueError("A hash ring needs at least one node.")
+
+        self.vnodes = vnodes
+        points = sorted(
+            (self.hash(f"{node}#{index}"), node) for node in self.nodes for index in range(vnodes)
+        )
+        self._hashes: List[int] = [point for point, _ in points]
+        self._owners: List[str] = [node for _, node in points]
+
+    @classmethod
+    def hash(cls, key: str = None) -> int:
+        return int.from_bytes(blake2b(key.encode(), digest_size=8).digest(), "big")
+
+    def get(self, key: str = None) -> str:
+        if len(self.nodes) == 1:
+            return self.nodes[0]
+
+        index = bisect(self._hashes, self.hash(key))
+        return self._owners[index % len(self._owners)]
+
+    def distribution(self, keys: Iterable[str] = None) -> Dict[str, int]:
+        counts = {node: 0 for node in self.nodes}
+        for key in keys:
+            counts[self.get(key)] += 1
+
+        return counts
+
+
+class ShardHelper:
+    """
+    Placement of sharded rows on DATABASE_SHARDS.
+
+    Without shards (a single entry), `for_key` returns None and `databases` returns [None]:
+    querysets `.using(None)` are left to the routers, so replica routing keeps working.
+    """
+
+    _ring: HashRing = None
+    _lock = Lock()
+
+    @classmethod
+    def sharded(cls) -> bool:
+        return len(settings.DATABASE_SHARDS) > 1
+
+    @classmethod
+    def ring(cls) -> HashRing:
+        ring = cls._ring
+        if ring is None or ring.nodes != tuple(settings.DATABASE_SHARDS) or ring.vnodes != settings.DATABASE_SHARD_VNODES:
+            with cls._lock:
+                ring = cls._ring = HashRing(nodes=settings.DATABASE_SHARDS, vnodes=settings.DATABASE_SHARD_VNODES)
+
+        return ring
+
+    @classmethod
+    def for_key(cls, key: str = None) -> str:
+        """
+        Alias of the shard that owns `key`, or None when unsharded.
+        """
+        if not cls.sharded():
+            return None
+
+        return cls.ring().get(key)
+
+    @classmethod
+    def databases(cls) -> List[str]:
+        """
+        Aliases to scatter a query over.
+        """
+        if not cls.sharded():
+            return [None]
+
+        return list(settings.DATABASE_SHARDS)
+
+    @classmethod
+    def group(cls, items: Iterable = None, key: Callable = None) -> Dict[str, list]:
+        """
+        Items grouped by the shard owning `key(item)` (the item itself by default).
+        """
+        groups: Dict[str, list] = {}
+        for item in items:
+            groups.setdefault(cls.for_key(key(item) if key else item), []).append(item)
+
+        return groups
+
+
+class ShardRouter:
+    """
+    Routes reads and writes of DATABASE_SHARDED_MODELS instances to the shard owning their
+    shard key (e.g. `save()` of a ShortenedURL goes to the shard of its short code). Models
+    listed without a key live on the shard of the row they hang off.
+
+    Queries carry no instance, so code reading sharded models picks the shard itself through
+    ShardHelper; without shards this router has no opinion.
+    """
+
+    def shard_for(self, model=None, instance=None) -> str:
+        if instance is None or not ShardHelper.sharded():
+            return None
+
+        label = model._meta.label_lower
+        if label not in settings.DATABASE_SHARDED_MODELS:
+            ## Unsharded models related to a sharded row (a link's user) only exist on the primary.
+            if instance._meta.label_lower in settings.DATABASE_SHARDED_MODELS:
+                return DEFAULT_DB_ALIAS
+            return None
+
+        field = settings.DATABASE_SHARDED_MODELS[label]
+        key = getattr(instance, field, None) if field and isinstance(instance, model) else None
+        return ShardHelper.for_key(str(key)) if key else None
+
+    def db_for_read(self, model=None, **hints) -> str:
+        return self.shard_for(model=model, instance=hints.get("instance"))
+
+    def db_for_write(self, model=None, **hints) -> str:
+        return self.shard_for(model=model, instance=hints.get("instance"))
+
+    def allow_relation(self, obj1=None, obj2=None, **hints) -> bool:
+        ## Links live on their shard while their users stay on the primary.
+        if ShardHelper.sharded() and {obj1._state.db, obj2._state.db} <= set(settings.DATABASE_SHARDS):
+            return True
+
+        return None
@@ -0,0 +1,24 @@
+from functools import wraps
+from typing import Callable
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+
+def database_sync_to_async(func: Callable = None) -> Callable:
+    """
+    sync_to_async for ORM work called from the event loop. The call runs on any thread of the
+    executor (thread_sensitive=False), so concurrent calls are not serialised onto the one
+    shared thread, and that thread's connections are closed (or handed back to the pool)
+    around it, as request_started/request_finished would do for a request thread.
+    """
+
+    @wraps(func)
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(run, thread_sensitive=False)
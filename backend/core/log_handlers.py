@@ -0,0 +1,346 @@
+"""
+Logging handlers and filters referenced from settings.LOGGING.
+
+Request threads only put records on a bounded queue; a background listener thread formats
+and writes them in batches to the real handlers.
+"""
+import atexit
+import gzip
+import logging
+import re
+import shutil
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from os import fstat, getpid, kill, listdir, path, register_at_fork, remove, stat
+from queue import Empty, Full, Queue
+from random import random
+from threading import Lock
+from time import time
+from typing import Dict, List, Tuple
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps only a fraction of the records below `max_level` per logger, e.g. {"logger.core": 0.01}.
+    The most specific logger prefix wins; loggers without a rate are never sampled.
+    """
+
+    def __init__(self, rates: Dict[str, float] = None, max_level: str = "INFO") -> None:
+        super().__init__()
+        self.rates = dict(rates or {})
+        self.max_level = logging.getLevelName(max_level) if isinstance(max_level, str) else max_level
+        self._resolved: Dict[str, float] = {}
+
+    def rate_for(self, name: str = None) -> float:
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate = 1.0
+            for prefix in sorted(self.rates, key=len, reverse=True):
+                if name == prefix or name.startswith(f"{prefix}."):
+                    rate = self.rates[prefix]
+                    break
+            self._resolved[name] = rate
+
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level:
+            return True
+
+        rate = self.rate_for(record.name)
+        return rate >= 1.0 or random() < rate
+
+
+class BatchedRotatingFileHandler(RotatingFileHandler):
+    """
+    File handler that writes a whole batch of records with one write and one flush.
+
+    With `rotation="external"` the file is rotated by another tool (logrotate with `create`,
+    not `copytruncate`): like WatchedFileHandler, the handler reopens the file once it has
+    been moved or removed, so any number of processes can share it. With `rotation="size"` the
+    handler rotates the file itself past `max_bytes`, optionally gzipping rotated files; every
+    process then writes its own `<name>.<pid><ext>`, since processes rotating one shared file
+    rename it from under each other and lose the lines written in between. Each rotation also
+    removes the files (current and rotated) of processes that are gone, once they have not
+    been written to for DEAD_PROCESS_GRACE seconds, so worker restarts do not pile them up.
+    """
+
+    EXTERNAL: str = "external"
+    SIZE: str = "size"
+    ROTATIONS = (EXTERNAL, SIZE)
+    DEAD_PROCESS_GRACE: float = 3600
+
+    def __init__(self, filename: str = None, rotation: str = EXTERNAL, max_bytes: int = 0, backup_count: int = 0,
+                 compress: bool = False, encoding: str = "utf-8") -> None:
+        if rotation not in self.ROTATIONS:
+            raise ValueError(f"rotation must be one of: {', '.join(self.ROTATIONS)}.")
+
+        self.rotation = rotation
+        self.filename = filename
+        super().__init__(
+            self.process_filename(filename=filename), maxBytes=max_bytes if rotation == self.SIZE else 0,
+            backupCount=backup_count, encoding=encoding, delay=True
+        )
+        self.compress = compress and rotation == self.SIZE
+        if self.compress:
+            self.namer = self.gzip_namer
+            self.rotator = self.gzip_rotator
+        self.opened: Tuple[int, int] = None
+        if rotation == self.SIZE:
+            register_at_fork(after_in_child=self.reopen_in_child)
+
+    def process_filename(self, filename: str = None) -> str:
+        if self.rotation != self.SIZE:
+            return filename
+
+        root, ext = path.splitext(filename)
+        return f"{root}.{getpid()}{ext}"
+
+    def process_files(self) -> Dict[int, List[str]]:
+        """
+        The files written by every process in size mode, current and rotated, by pid.
+        """
+        root, ext = path.splitext(self.filename)
+        directory, prefix = path.split(root)
+        pattern = re.compile(rf'^{re.escape(prefix)}\.(\d+){re.escape(ext)}(\.\d+)?(\.gz)?$')
+        files: Dict[int, List[str]] = {}
+        for name in listdir(directory or "."):
+            match = pattern.match(name)
+            if match:
+                files.setdefault(int(match.group(1)), []).append(path.join(directory, name))
+
+        return files
+
+    @staticmethod
+    def is_alive(pid: int = None) -> bool:
+        try:
+            kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            ## Someone else's process reusing the pid.
+            return True
+
+        return True
+
+    def remove_dead_process_files(self) -> None:
+        now = time()
+        for pid, file_paths in self.process_files().items():
+            if pid == getpid() or self.is_alive(pid=pid):
+                continue
+
+            try:
+                if now - max(path.getmtime(file_path) for file_path in file_paths) < self.DEAD_PROCESS_GRACE:
+                    continue
+                for file_path in file_paths:
+                    remove(file_path)
+            except OSError:
+                ## Removed by another process rotating at the same time.
+                continue
+
+    def doRollover(self) -> None:
+        super().doRollover()
+        if self.rotation == self.SIZE:
+            self.remove_dead_process_files()
+
+    def reopen_in_child(self) -> None:
+        ## A forked worker writes to a file of its own, not to the one inherited from its parent.
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        self.baseFilename = path.abspath(self.process_filename(filename=self.filename))
+
+    def _open(self):
+        stream = super()._open()
+        status = fstat(stream.fileno())
+        self.opened = (status.st_dev, status.st_ino)
+        return stream
+
+    def reopen_if_moved(self) -> None:
+        if self.stream is None:
+            return
+
+        try:
+            status = stat(self.baseFilename)
+            moved = (status.st_dev, status.st_ino) != self.opened
+        except FileNotFoundError:
+            moved = True
+        if moved:
+            self.stream.flush()
+            self.stream.close()
+            self.stream = None
+
+    @staticmethod
+    def gzip_namer(name: str) -> str:
+        return f"{name}.gz"
+
+    @staticmethod
+    def gzip_rotator(source: str, destination: str) -> None:
+        with open(source, "rb") as plain, gzip.open(destination, "wb") as compressed:
+            shutil.copyfileobj(plain, compressed)
+        remove(source)
+
+    def emit_batch(self, records: List[logging.LogRecord] = None) -> None:
+        lines = []
+        for record in records:
+            if record.levelno < self.level or not self.filter(record):
+                continue
+            try:
+                lines.append(self.format(record) + self.terminator)
+            except Exception:
+                self.handleError(record)
+        if not lines:
+            return
+
+        self.acquire()
+        try:
+            if self.rotation == self.EXTERNAL:
+                self.reopen_if_moved()
+            if self.stream is None:
+                self.stream = self._open()
+            ## Rollover is checked per batch, so a file may overshoot max_bytes by one batch.
+            if self.maxBytes > 0 and self.stream.tell() + sum(len(line) for line in lines) >= self.maxBytes \
+                    and self.stream.tell() > 0:
+                self.doRollover()
+                if self.stream is None:
+                    self.stream = self._open()
+            self.stream.write("".join(lines))
+            self.stream.flush()
+        except Exception:
+            self.handleError(records[-1])
+        finally:
+            self.release()
+
+
+class BatchingQueueListener(QueueListener):
+    """
+    QueueListener that drains up to `batch_size` records per wakeup and hands them to
+    handlers supporting `emit_batch` in one call.
+    """
+
+    def __init__(self, queue: Queue = None, *handlers: logging.Handler, batch_size: int = 256) -> None:
+        super().__init__(queue, *handlers, respect_handler_level=True)
+        self.batch_size = batch_size
+
+    def enqueue_sentinel(self) -> None:
+        ## The queue is bounded, so stopping waits for room instead of failing when it is full.
+        self.queue.put(self._sentinel)
+
+    def _monitor(self) -> None:
+        while True:
+            record = self.dequeue(True)
+            batch = []
+            stop = record is self._sentinel
+            if not stop:
+                batch.append(record)
+
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    record = self.dequeue(False)
+                except Empty:
+                    break
+                if record is self._sentinel:
+                    stop = True
+                    break
+                batch.append(record)
+
+            if batch:
+                self.handle_batch(batch)
+            for _ in range(len(batch) + (1 if stop else 0)):
+                if hasattr(self.queue, "task_done"):
+                    self.queue.task_done()
+            if stop:
+                break
+
+    def handle_batch(self, records: List[logging.LogRecord] = None) -> None:
+        records = [self.prepare(record) for record in records]
+        for handler in self.handlers:
+            if hasattr(handler, "emit_batch"):
+                handler.emit_batch(records)
+                continue
+
+            for record in records:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Puts records on a bounded in-memory queue served by a BatchingQueueListener that writes
+    to `handlers`. When the queue is full the drop policy decides:
+
+        drop_new     discard the incoming record (default; never blocks the caller)
+        drop_oldest  discard the oldest queued record to make room
+        block        wait for room, as a plain QueueHandler on an unbounded queue would
+    """
+
+    DROP_NEW: str = "drop_new"
+    DROP_OLDEST: str = "drop_oldest"
+    BLOCK: str = "block"
+    DROP_POLICIES = (DROP_NEW, DROP_OLDEST, BLOCK)
+
+    def __init__(self, handlers: List[logging.Handler] = None, queue_size: int = 10000,
+                 drop_policy: str = DROP_NEW, batch_size: int = 256) -> None:
+        if drop_policy not in self.DROP_POLICIES:
+            raise ValueError(f"drop_policy must be one of: {', '.join(self.DROP_POLICIES)}.")
+
+        super().__init__(Queue(maxsize=queue_size))
+        ## dictConfig hands over a ConvertingList, which only resolves "cfg://" entries on indexing.
+        self.handlers = [handlers[index] for index in range(len(handlers or []))]
+        self.drop_policy = drop_policy
+        self.batch_size = batch_size
+        self.dropped: int = 0
+        self._drop_lock = Lock()
+
+        self.listener: BatchingQueueListener = None
+        self.start()
+        atexit.register(self.stop)
+        ## The listener thread does not survive a fork; forked workers start their own.
+        register_at_fork(after_in_child=self.restart_in_child)
+
+    def start(self) -> None:
+        self.listener = BatchingQueueListener(self.queue, *self.handlers, batch_size=self.batch_size)
+        self.listener.start()
+
+    def stop(self) -> None:
+        ## Writes out whatever is still queued.
+        if self.listener and self.listener._thread:
+            self.listener.stop()
+
+    def restart_in_child(self) -> None:
+        self.queue = Queue(maxsize=self.queue.maxsize)
+        self._drop_lock = Lock()
+        self.dropped = 0
+        self.start()
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.drop_policy == self.BLOCK:
+            self.queue.put(record)
+            return
+
+        try:
+            self.queue.put_nowait(record)
+            return
+        except Full:
+            pass
+
+        with self._drop_lock:
+            self.dropped += 1
+            if self.drop_policy == self.DROP_OLDEST:
+                try:
+                    self.queue.get_nowait()
+                    self.queue.task_done()
+                    self.queue.put_nowait(record)
+                except (Empty, Full):
+                    pass
+
+    def close(self) -> None:
+        self.stop()
+        super().close()
+
+    def stats(self) -> dict:
+        return {
+            "queueDepth": self.queue.qsize(),
+            "queueSize": self.queue.maxsize,
+            "dropPolicy": self.drop_policy,
+            "dropped": self.dropped
+        }
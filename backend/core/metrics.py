@@ -0,0 +1,381 @@
+import atexit
+import json
+from bisect import bisect_left
+from ipaddress import ip_address
+from os import getpid, listdir, makedirs, path, register_at_fork, remove, replace
+from threading import Event, Lock, Thread
+from time import perf_counter, time
+from typing import Callable, Dict, List, Tuple
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+
+from core.timing import AsyncCapableMiddleware, QueryTimer
+
+from core import logger
+
+
+class Metric:
+    """
+    A named family of samples keyed by label values.
+    """
+
+    TYPE: str = None
+
+    def __init__(self, name: str = None, documentation: str = None, labelnames: Tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = Lock()
+
+    def key(self, labels: dict = None) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[list]:
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def reset(self) -> None:
+        self._lock = Lock()
+        self._values = {}
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self.key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set_total(self, value: float = 0.0, **labels) -> None:
+        ## For collectors mirroring a counter kept elsewhere in the process.
+        with self._lock:
+            self._values[self.key(labels)] = float(value)
+
+
+class Gauge(Metric):
+    """
+    Gauges of different workers are summed, so only additive values (sizes, depths) belong here.
+    """
+
+    TYPE = "gauge"
+
+    def set(self, value: float = 0.0, **labels) -> None:
+        with self._lock:
+            self._values[self.key(labels)] = float(value)
+
+
+class Histogram(Metric):
+    """
+    Fixed-bucket histogram; stored per label set as [per-bucket counts..., +Inf count, sum].
+    """
+
+    TYPE = "histogram"
+
+    def __init__(self, name: str = None, documentation: str = None, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = ()) -> None:
+        super().__init__(name=name, documentation=documentation, labelnames=labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float = 0.0, **labels) -> None:
+        key = self.key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self) -> List[list]:
+        with self._lock:
+            return [[list(key), list(value)] for key, value in self._values.items()]
+
+
+class MetricsRegistry:
+    """
+    In-process metrics of one worker, shared with the other workers through snapshot files.
+
+    Every process writes its samples to `<directory>/<pid>.json` every `flush_interval` seconds
+    (and at exit). The process serving the exposition merges its live samples with every other
+    snapshot younger than `stale_after` seconds: counters, histograms and gauges are summed.
+    """
+
+    def __init__(self, directory: str = None, flush_interval: float = None, stale_after: float = None) -> None:
+        self.directory = directory if directory is not None else settings.METRICS_DIR
+        self.flush_interval = flush_interval if flush_interval is not None else settings.METRICS_FLUSH_INTERVAL
+        self.stale_after = stale_after if stale_after is not None else settings.METRICS_STALE_AFTER
+
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable] = []
+        self._lock = Lock()
+        self._wakeup = Event()
+        self._writer: Thread = None
+        self._pid: int = None
+
+    def register(self, metric: Metric = None) -> Metric:
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str = None, documentation: str = None, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name=name, documentation=documentation, labelnames=labelnames))
+
+    def gauge(self, name: str = None, documentation: str = None, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name=name, documentation=documentation, labelnames=labelnames))
+
+    def histogram(self, name: str = None, documentation: str = None, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = None) -> Histogram:
+        return self.register(Histogram(
+            name=name, documentation=documentation, labelnames=labelnames,
+            buckets=buckets if buckets is not None else settings.METRICS_LATENCY_BUCKETS
+        ))
+
+    def reset(self) -> None:
+        """
+        Forget every sample; a forked worker must not report its parent's counts again.
+        """
+        self._lock = Lock()
+        for metric in self._metrics.values():
+            metric.reset()
+
+    def add_collector(self, collector: Callable = None) -> None:
+        """
+        `collector()` is called before every snapshot to refresh values kept outside the registry.
+        """
+        self._collectors.append(collector)
+
+    def collect(self) -> None:
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as ex:
+                logger.error(f"Metrics collector {collector} failed: {ex}")
+
+    def snapshot(self) -> dict:
+        self.collect()
+        return {
+            name: {
+                "type": metric.TYPE,
+                "help": metric.documentation,
+                "labels": list(metric.labelnames),
+                "buckets": list(getattr(metric, "buckets", ())),
+                "samples": metric.samples()
+            }
+            for name, metric in list(self._metrics.items())
+        }
+
+    def snapshot_path(self, pid: int = None) -> str:
+        return path.join(self.directory, f"{pid}.json")
+
+    def write_snapshot(self) -> None:
+        makedirs(self.directory, exist_ok=True)
+        destination = self.snapshot_path(getpid())
+        temporary = f"{destination}.tmp"
+        with open(temporary, "w") as snapshot:
+            json.dump({"pid": getpid(), "time": time(), "metrics": self.snapshot()}, snapshot)
+        replace(temporary, destination)
+
+    def read_snapshots(self) -> List[dict]:
+        if not path.isdir(self.directory):
+            return []
+
+        snapshots = []
+        for name in listdir(self.directory):
+            if not name.endswith(".json") or name == f"{getpid()}.json":
+                continue
+
+            file_path = path.join(self.directory, name)
+            try:
+                if time() - path.getmtime(file_path) > self.stale_after:
+                    ## Left behind by a worker that is gone; its counters reset like a restart would.
+                    remove(file_path)
+                    continue
+                with open(file_path) as snapshot:
+                    snapshots.append(json.load(snapshot)["metrics"])
+            except (OSError, ValueError, KeyError):
+                continue
+
+        return snapshots
+
+    def aggregate(self) -> dict:
+        merged = self.snapshot()
+        for snapshot in self.read_snapshots():
+            for name, family in snapshot.items():
+                target = merged.setdefault(name, {**family, "samples": []})
+                if target["type"] != family["type"] or target["buckets"] != family["buckets"]:
+                    continue
+
+                values = {tuple(labels): value for labels, value in target["samples"]}
+                for labels, value in family["samples"]:
+                    labels = tuple(labels)
+                    current = values.get(labels)
+                    if current is None:
+                        values[labels] = value
+                    elif isinstance(value, list):
+                        values[labels] = [a + b for a, b in zip(current, value)]
+                    else:
+                        values[labels] = current + value
+                target["samples"] = [[list(labels), value] for labels, value in values.items()]
+
+        return merged
+
+    @classmethod
+    def escape(cls, value: str = None) -> str:
+        return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+    @classmethod
+    def format_labels(cls, names: List[str] = None, values: List[str] = None, extra: Tuple[str, str] = None) -> str:
+        pairs = list(zip(names, values)) + ([extra] if extra else [])
+        if not pairs:
+            return ""
+
+        return "{" + ",".join(f'{name}="{cls.escape(value)}"' for name, value in pairs) + "}"
+
+    @classmethod
+    def format_value(cls, value: float = 0.0) -> str:
+        return repr(float(value)) if value != int(value) else str(int(value))
+
+    def exposition(self) -> str:
+        """
+        All workers' metrics in the Prometheus text exposition format (0.0.4).
+        """
+        lines = []
+        for name, family in sorted(self.aggregate().items()):
+            lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['type']}")
+            for labels, value in sorted(family["samples"]):
+                if family["type"] != Histogram.TYPE:
+                    lines.append(f"{name}{self.format_labels(family['labels'], labels)} {self.format_value(value)}")
+                    continue
+
+                cumulative = 0
+                bounds = [self.format_value(bound) for bound in family["buckets"]] + ["+Inf"]
+                for bound, count in zip(bounds, value[:-1]):
+                    cumulative += count
+                    lines.append(
+                        f"{name}_bucket{self.format_labels(family['labels'], labels, ('le', bound))} {cumulative}")
+                lines.append(f"{name}_sum{self.format_labels(family['labels'], labels)} {self.format_value(value[-1])}")
+                lines.append(f"{name}_count{self.format_labels(family['labels'], labels)} {cumulative}")
+
+        return "\n".join(lines) + "\n"
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(timeout=self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.write_snapshot()
+            except Exception as ex:
+                logger.error(f"Metrics snapshot failed: {ex}")
+
+    def ensure_writer(self) -> None:
+        ## Threads do not survive a fork, so every worker process starts its own writer.
+        if self._pid == getpid() and self._writer and self._writer.is_alive():
+            return
+
+        with self._lock:
+            if self._pid == getpid() and self._writer and self._writer.is_alive():
+                return
+
+            self._pid = getpid()
+            self._writer = Thread(target=self._run, name="metrics-writer", daemon=True)
+            self._writer.start()
+
+
+## One registry per worker process; the metric families below are shared by every app.
+registry = MetricsRegistry()
+atexit.register(lambda: registry._pid == getpid() and registry.write_snapshot())
+register_at_fork(after_in_child=registry.reset)
+
+request_latency = registry.histogram(
+    "http_request_duration_seconds", "Request latency by route name.", ("route", "method"))
+requests_total = registry.counter(
+    "http_requests_total", "Requests by route name and status code.", ("route", "method", "status"))
+db_queries_total = registry.counter(
+    "db_queries_total", "SQL statements executed, by route name.", ("route",))
+redirects_total = registry.counter(
+    "redirects_total", "Short link resolutions by outcome: redirect, not_found or expired.", ("outcome",))
+## Hit ratio: rate of result="hit" over the rate of all lookups.
+redirect_cache_lookups_total = registry.counter(
+    "redirect_cache_lookups_total", "Resolution cache lookups by result: hit or miss.", ("result",))
+redirect_cache_evictions_total = registry.counter(
+    "redirect_cache_evictions_total", "Resolution cache entries evicted to stay within its size.")
+redirect_cache_entries = registry.gauge(
+    "redirect_cache_entries", "Entries held by the resolution caches.")
+slug_filter_rejections_total = registry.counter(
+    "slug_filter_rejections_total", "Unknown slugs rejected by the slug filter without a lookup.")
+slug_filter_forced_syncs_total = registry.counter(
+    "slug_filter_forced_syncs_total", "Slug filter syncs run on the request path because the filter was stale.")
+click_buffer_pending = registry.gauge(
+    "click_buffer_pending", "Clicks buffered and not yet written.")
+click_flushes_total = registry.counter(
+    "click_flushes_total", "Click buffer flushes by result: ok or failed.", ("result",))
+## A histogram rather than last/max gauges: gauges are summed across workers.
+click_flush_seconds = registry.histogram(
+    "click_flush_duration_seconds", "Click buffer flush duration by result: ok or failed.", ("result",))
+click_dropped_total = registry.counter(
+    "click_dropped_total", "Clicks dropped after failed flushes to keep the buffer within CLICK_BUFFER_MAX_PENDING.")
+
+
+class MetricsMiddleware(AsyncCapableMiddleware):
+    """
+    Records latency, status and SQL statement count of every request under its route name.
+    """
+
+    UNMATCHED: str = "unmatched"
+
+    def handle(self, request: HttpRequest) -> HttpResponse:
+        registry.ensure_writer()
+
+        start = perf_counter()
+        with QueryTimer().track() as timer:
+            response = self.get_response(request)
+
+        return self.record(request=request, response=response, timer=timer, elapsed=perf_counter() - start)
+
+    async def ahandle(self, request: HttpRequest) -> HttpResponse:
+        registry.ensure_writer()
+
+        start = perf_counter()
+        with QueryTimer().track() as timer:
+            response = await self.get_response(request)
+
+        return self.record(request=request, response=response, timer=timer, elapsed=perf_counter() - start)
+
+    def record(self, request: HttpRequest = None, response: HttpResponse = None, timer: QueryTimer = None,
+               elapsed: float = 0.0) -> HttpResponse:
+        match = getattr(request, "resolver_match", None)
+        route = (match.url_name if match else None) or self.UNMATCHED
+        request_latency.observe(elapsed, route=route, method=request.method)
+        requests_total.inc(route=route, method=request.method, status=response.status_code)
+        if timer.count:
+            db_queries_total.inc(timer.count, route=route)
+
+        return response
+
+
+def is_local(request: HttpRequest = None) -> bool:
+    """
+    Whether a request comes straight from the same host: a loopback address and no proxy hop,
+    since a reverse proxy on the host connects from loopback on behalf of remote clients.
+    """
+    if "HTTP_X_FORWARDED_FOR" in request.META or "HTTP_FORWARDED" in request.META:
+        return False
+
+    try:
+        return ip_address(request.META.get("REMOTE_ADDR", "")).is_loopback
+    except ValueError:
+        return False
+
+
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    if settings.METRICS_TOKEN:
+        if request.headers.get("Authorization") != f"Bearer {settings.METRICS_TOKEN}":
+            return HttpResponse(status=401)
+    elif not is_local(request=request):
+        return HttpResponse(status=403)
+
+    return HttpResponse(registry.exposition(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -11,5 +11,10 @@ THIRD_PARTY_MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
 ]
 CUSTOM_MIDDLEWARE = [
-
+    'core.metrics.MetricsMiddleware',
+    ## After MetricsMiddleware so rejections are counted, before anything that reads the database.
+    'core.ratelimit.RateLimitMiddleware',
+    'core.db.routers.ReplicaStickinessMiddleware',
+    ## Keep last: it times the view and the response rendering from the innermost position.
+    'core.timing.RequestTimingMiddleware',
 ]
\ No newline at end of file
@@ -0,0 +1,252 @@
+import json
+from collections import OrderedDict
+from hashlib import blake2b
+from threading import Lock
+from time import time
+from typing import Dict, List, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.urls import Resolver404, resolve
+from django.utils.module_loading import import_string
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.metrics import registry
+from core.timing import AsyncCapableMiddleware
+
+from core import logger
+
+
+class TokenBucket:
+    """
+    Token bucket arithmetic: a bucket holds up to `capacity` tokens and regains `capacity`
+    tokens every `period` seconds, so `capacity` requests may come in a burst after which
+    they are spread evenly over the period.
+    """
+
+    @classmethod
+    def parse(cls, limit: str = None) -> Tuple[int, float]:
+        """
+        "<capacity>/<period seconds>", e.g. "5/300".
+        """
+        capacity, period = limit.split("/")
+        return int(capacity), float(period)
+
+    @classmethod
+    def take(cls, state: Tuple[float, float] = None, capacity: int = 1, period: float = 1.0,
+             now: float = 0.0) -> Tuple[Tuple[float, float], float]:
+        """
+        The bucket's new (tokens, updated) state and 0 if a token was taken, or the seconds
+        until one is available.
+        """
+        rate = capacity / period
+        tokens, updated = state if state else (float(capacity), now)
+        tokens = min(float(capacity), tokens + max(0.0, now - updated) * rate)
+        if tokens >= 1:
+            return (tokens - 1, now), 0.0
+
+        return (tokens, now), (1 - tokens) / rate
+
+
+class MemoryBucketStore:
+    """
+    Buckets held by the worker process, least recently used ones evicted past `max_keys`.
+    Every worker counts on its own, so a node with N workers lets up to N times a limit through.
+    """
+
+    def __init__(self, max_keys: int = None) -> None:
+        self.max_keys = max_keys or settings.RATE_LIMIT_MEMORY_MAX_KEYS
+        self._buckets: OrderedDict = OrderedDict()
+        self._lock = Lock()
+
+    def take(self, key: str = None, capacity: int = 1, period: float = 1.0) -> float:
+        with self._lock:
+            state, wait = TokenBucket.take(
+                state=self._buckets.get(key), capacity=capacity, period=period, now=time())
+            self._buckets[key] = state
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+
+        return wait
+
+
+class CacheBucketStore:
+    """
+    Buckets kept in the RATE_LIMIT_CACHE_ALIAS Django cache, shared by every worker and node
+    using that cache. The read and the write are not atomic: concurrent requests for the same
+    key may take the same token, so a burst can exceed a limit by a few requests.
+    """
+
+    def __init__(self, alias: str = None) -> None:
+        self.cache = caches[alias or settings.RATE_LIMIT_CACHE_ALIAS]
+
+    def take(self, key: str = None, capacity: int = 1, period: float = 1.0) -> float:
+        state, wait = TokenBucket.take(state=self.cache.get(key), capacity=capacity, period=period, now=time())
+        ## A bucket left alone for a whole period is full again, which is what a missing key means.
+        self.cache.set(key, state, timeout=max(1, int(period) + 1))
+        return wait
+
+
+class RateLimitMiddleware(AsyncCapableMiddleware):
+    """
+    Rejects requests to the routes of RATE_LIMITS with 429 and a `Retry-After` header once one
+    of their token buckets is empty. Runs before the view and never queries the database, so
+    rejected requests cost no query, password hash or serializer work.
+
+    A route's limits are given per key: "ip" (the client address), "user" (the user id of a
+    valid access token, else the username or email of a JSON or form body, so logins are
+    limited per targeted name) and "route" (every client together). The "ip" and "route"
+    buckets are checked first: a request they reject does not have its body parsed.
+    """
+
+    STORES: Dict[str, str] = {
+        "memory": "core.ratelimit.MemoryBucketStore",
+        "cache": "core.ratelimit.CacheBucketStore",
+    }
+    IDENTITY_FIELDS: Tuple[str, ...] = ("username", "email")
+    ## Keys whose identity is known without reading the request body, checked first.
+    CHEAP_KEYS: Tuple[str, ...] = ("ip", "route")
+    EXEMPT_METHODS: Tuple[str, ...] = ("OPTIONS",)
+
+    def __init__(self, get_response=None) -> None:
+        super().__init__(get_response=get_response)
+        self.limits = {
+            route: {key: TokenBucket.parse(limit=limit) for key, limit in limits.items()}
+            for route, limits in settings.RATE_LIMITS.items()
+        }
+        self.store = import_string(self.STORES.get(settings.RATE_LIMIT_STORE, settings.RATE_LIMIT_STORE))()
+
+    def handle(self, request: HttpRequest) -> HttpResponse:
+        match, limits = self.route(request=request)
+        response = self.check(request=request, match=match, limits=limits) if limits else None
+        return response or self.get_response(request)
+
+    async def ahandle(self, request: HttpRequest) -> HttpResponse:
+        match, limits = self.route(request=request)
+        response = self.check(request=request, match=match, limits=limits) if limits else None
+        return response or await self.get_response(request)
+
+    def route(self, request: HttpRequest = None) -> Tuple[object, Dict[str, Tuple[int, float]]]:
+        """
+        The resolved route of a request and its limits, if any apply.
+        """
+        if not settings.RATE_LIMIT_ENABLED or request.method in self.EXEMPT_METHODS:
+            return None, None
+
+        try:
+            match = resolve(request.path_info, urlconf=getattr(request, "urlconf", None))
+        except Resolver404:
+            return None, None
+
+        return match, self.limits.get(match.url_name)
+
+    def check(self, request: HttpRequest = None, match=None, limits: Dict[str, Tuple[int, float]] = None) -> HttpResponse:
+        """
+        The 429 response for a request over one of its route's limits, None otherwise.
+        """
+        wait, key = self.take(request=request, route=match.url_name, limits=limits)
+        if not wait:
+            return None
+
+        ## Lets MetricsMiddleware file the rejection under its route.
+        request.resolver_match = match
+        rate_limit_rejections_total.inc(route=match.url_name, key=key)
+        retry_after = max(1, int(wait + 0.999))
+        response = JsonResponse(
+            {
+                "error": "Too Many Requests",
+                "message": f"Rate limit exceeded, retry in {retry_after} seconds.",
+                "data": None
+            },
+            status=429
+        )
+        response["Retry-After"] = str(retry_after)
+        return response
+
+    def take(self, request: HttpRequest = None, route: str = None,
+             limits: Dict[str, Tuple[int, float]] = None) -> Tuple[float, str]:
+        """
+        Take a token from each of the request's buckets; returns the longest wait and its key.
+        The user bucket is only reached when the ip and route buckets let the request through.
+        """
+        identities = {"ip": self.client_ip(request=request), "route": route}
+        longest, longest_key = 0.0, None
+        for key in sorted(limits, key=lambda key: key not in self.CHEAP_KEYS):
+            if key not in identities:
+                if longest:
+                    break
+                identities[key] = self.user_identity(request=request)
+
+            identity = identities.get(key)
+            if not identity:
+                continue
+
+            capacity, period = limits[key]
+            digest = blake2b(f"{identity}".encode(), digest_size=12).hexdigest()
+            wait = self.store.take(key=f"ratelimit:{route}:{key}:{digest}", capacity=capacity, period=period)
+            if wait > longest:
+                longest, longest_key = wait, key
+
+        return longest, longest_key
+
+    @classmethod
+    def client_ip(cls, request: HttpRequest = None) -> str:
+        """
+        REMOTE_ADDR, or the address RATE_LIMIT_TRUSTED_PROXIES hops back in X-Forwarded-For.
+        """
+        proxies = settings.RATE_LIMIT_TRUSTED_PROXIES
+        forwarded = request.META.get("HTTP_X_FORWARDED_FOR")
+        if proxies and forwarded:
+            hops: List[str] = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+            if hops:
+                return hops[-min(proxies, len(hops))]
+
+        return request.META.get("REMOTE_ADDR")
+
+    @classmethod
+    def user_identity(cls, request: HttpRequest = None) -> str:
+        """
+        The user a request acts as (from its access token) or on (the account named in its body).
+        """
+        header = request.META.get("HTTP_AUTHORIZATION", "").split()
+        if len(header) == 2 and header[0] in jwt_settings.AUTH_HEADER_TYPES:
+            try:
+                return f"id:{AccessToken(header[1])[jwt_settings.USER_ID_CLAIM]}"
+            except (TokenError, KeyError):
+                pass
+
+        body = cls.body_fields(request=request)
+        for field in cls.IDENTITY_FIELDS:
+            value = body.get(field)
+            if value and isinstance(value, str) and value.strip():
+                return f"account:{value.strip().lower()}"
+
+        return None
+
+    @classmethod
+    def body_fields(cls, request: HttpRequest = None) -> dict:
+        """
+        The fields of a JSON, urlencoded or multipart body; empty for other or malformed bodies.
+        """
+        if request.content_type in ("application/x-www-form-urlencoded", "multipart/form-data"):
+            ## DRF reuses the parsed request.POST, so the body is not parsed twice.
+            return request.POST
+
+        if request.content_type != "application/json" or not request.body:
+            return {}
+
+        try:
+            body = json.loads(request.body)
+        except ValueError as ex:
+            logger.debug(f"Unparseable body on a rate-limited route: {ex}")
+            return {}
+
+        return body if isinstance(body, dict) else {}
+
+
+rate_limit_rejections_total = registry.counter(
+    "rate_limit_rejections_total", "Requests rejected by rate limits, by route and exhausted key.", ("route", "key"))
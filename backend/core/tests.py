@@ -0,0 +1,486 @@
+import asyncio
+import json
+import logging
+import re
+import subprocess
+import sys
+from os import getpid, getppid, listdir, path, utime
+from tempfile import TemporaryDirectory
+from threading import Timer
+from time import time
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from psycopg2 import InterfaceError, extensions
+from rest_framework.test import APIClient
+
+from core.db.pool import ConnectionPool, PoolRegistry, PoolTimeout
+from core.db.postgresql_pool.base import DatabaseWrapper
+from core.log_handlers import BatchedRotatingFileHandler
+from core.metrics import MetricsRegistry, metrics_view
+from core.timing import QueryTimer, RequestTimingMiddleware
+from user_app.models import User
+
+
+class BatchedRotatingFileHandlerTest(SimpleTestCase):
+    """
+    Size rotation of per-process files in a temporary directory.
+    """
+
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.handler = BatchedRotatingFileHandler(
+            filename=path.join(self.directory, "app.log"), rotation="size", max_bytes=64, backup_count=2)
+        self.addCleanup(self.handler.close)
+
+    @classmethod
+    def dead_pid(cls) -> int:
+        process = subprocess.Popen([sys.executable, "-c", "pass"])
+        process.wait()
+        return process.pid
+
+    def touch(self, name: str = None, age: float = 0) -> None:
+        file_path = path.join(self.directory, name)
+        with open(file_path, "w") as target:
+            target.write("line\n")
+        utime(file_path, (time() - age, time() - age))
+
+    def emit(self) -> None:
+        self.handler.emit_batch([logging.LogRecord("test", logging.INFO, __file__, 0, "x" * 40, None, None)])
+
+    def rotate(self) -> None:
+        ## The second batch does not fit in max_bytes next to the first.
+        self.emit()
+        self.emit()
+
+    def test_each_process_writes_its_own_file(self):
+        self.emit()
+        self.assertEqual(listdir(self.directory), [f"app.{getpid()}.log"])
+
+    def test_rotation_removes_the_old_files_of_exited_processes(self):
+        old, recent = self.dead_pid(), self.dead_pid()
+        grace = BatchedRotatingFileHandler.DEAD_PROCESS_GRACE
+        for name in (f"app.{old}.log", f"app.{old}.log.1", f"app.{old}.log.2.gz"):
+            self.touch(name=name, age=grace + 60)
+        self.touch(name=f"app.{recent}.log", age=grace + 60)
+        self.touch(name=f"app.{recent}.log.1", age=0)
+        self.touch(name="app.other.log", age=grace + 60)
+
+        self.rotate()
+
+        self.assertEqual(sorted(listdir(self.directory)), sorted([
+            f"app.{getpid()}.log", f"app.{getpid()}.log.1",
+            f"app.{recent}.log", f"app.{recent}.log.1", "app.other.log",
+        ]))
+
+    def test_files_of_running_processes_are_kept(self):
+        parent = f"app.{getppid()}.log"
+        self.touch(name=parent, age=BatchedRotatingFileHandler.DEAD_PROCESS_GRACE + 60)
+
+        self.rotate()
+
+        self.assertIn(parent, listdir(self.directory))
+
+
+class FakeConnection:
+
+    def __init__(self, number: int = 0) -> None:
+        self.number = number
+        self.closed = False
+        self.healthy = True
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class ConnectionPoolTest(SimpleTestCase):
+    """
+    ConnectionPool over fake connections, with a clock the tests move by hand.
+    """
+
+    def setUp(self):
+        self.opened = []
+        self.now = 1000.0
+        ## None lets the clock run, for tests that really wait.
+        patcher = mock.patch("core.db.pool.monotonic", side_effect=lambda: time() if self.now is None else self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def connect(self) -> FakeConnection:
+        connection = FakeConnection(number=len(self.opened))
+        self.opened.append(connection)
+        return connection
+
+    def make(self, **kwargs) -> ConnectionPool:
+        options = {"connect": self.connect, "check": lambda connection: connection.healthy, "max_size": 2,
+                   "timeout": 0.05, "check_after": 30.0, **kwargs}
+        return ConnectionPool(**options)
+
+    def test_sizes_are_validated(self):
+        with self.assertRaises(ValueError):
+            self.make(min_size=3, max_size=2)
+
+    def test_fill_opens_min_size_connections(self):
+        pool = self.make(min_size=2, max_size=4)
+        pool.fill()
+        pool.fill()
+
+        self.assertEqual(len(self.opened), 2)
+        self.assertEqual((pool.stats()["size"], pool.stats()["idle"]), (2, 2))
+
+    def test_returned_connections_are_reused(self):
+        pool = self.make()
+        connection = pool.getconn()
+        pool.putconn(connection)
+
+        self.assertIs(pool.getconn(), connection)
+        self.assertEqual(len(self.opened), 1)
+
+    def test_checkouts_time_out_when_every_connection_is_in_use(self):
+        pool = self.make()
+        pool.getconn(), pool.getconn()
+        self.now = None
+
+        with self.assertRaises(PoolTimeout):
+            pool.getconn()
+        stats = pool.stats()
+        self.assertEqual((stats["waits"], stats["timeouts"], stats["waiting"], stats["size"]), (1, 1, 0, 2))
+
+    def test_waiting_checkouts_get_returned_connections(self):
+        pool = self.make(timeout=5)
+        first, _ = pool.getconn(), pool.getconn()
+        self.now = None
+        Timer(0.05, pool.putconn, kwargs={"connection": first}).start()
+
+        self.assertIs(pool.getconn(), first)
+        self.assertEqual(pool.stats()["timeouts"], 0)
+
+    def test_broken_connections_are_discarded_on_return(self):
+        pool = self.make()
+        connection = pool.getconn()
+        connection.closed = True
+        pool.putconn(connection)
+
+        self.assertEqual((pool.stats()["size"], pool.stats()["discarded"]), (0, 1))
+        self.assertIsNot(pool.getconn(), connection)
+
+    def test_connections_failing_their_reset_are_discarded(self):
+        pool = self.make(reset=mock.Mock(side_effect=InterfaceError("connection is broken")))
+        connection = pool.getconn()
+        pool.putconn(connection)
+
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()["size"], 0)
+
+    def test_idle_connections_failing_their_check_are_replaced(self):
+        pool = self.make()
+        connection = pool.getconn()
+        pool.putconn(connection)
+        connection.healthy = False
+
+        self.now += 10
+        self.assertIs(pool.getconn(), connection)
+        pool.putconn(connection)
+
+        self.now += 31
+        replacement = pool.getconn()
+        self.assertIsNot(replacement, connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual((pool.stats()["size"], pool.stats()["discarded"]), (1, 1))
+
+    def test_connections_are_replaced_after_their_lifetime(self):
+        pool = self.make(max_lifetime=60)
+        connection = pool.getconn()
+        pool.putconn(connection)
+
+        self.now += 61
+        self.assertIsNot(pool.getconn(), connection)
+        self.assertTrue(connection.closed)
+
+    def test_failed_connects_release_their_slot(self):
+        pool = self.make(connect=mock.Mock(side_effect=OSError("refused")))
+        for _ in range(3):
+            with self.assertRaises(OSError):
+                pool.getconn()
+
+        self.assertEqual(pool.stats()["size"], 0)
+
+
+class PoolRegistryTest(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(PoolRegistry, "_pools", {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_pools_are_kept_per_alias_and_parameters(self):
+        first = PoolRegistry.get(alias="default", signature="a", factory=ConnectionPool)
+
+        self.assertIs(PoolRegistry.get(alias="default", signature="a", factory=ConnectionPool), first)
+        self.assertIsNot(PoolRegistry.get(alias="default", signature="b", factory=ConnectionPool), first)
+
+    def test_a_forked_process_gets_new_pools(self):
+        parent = PoolRegistry.get(alias="default", factory=ConnectionPool)
+        with mock.patch("core.db.pool.getpid", return_value=getpid() + 1):
+            child = PoolRegistry.get(alias="default", factory=ConnectionPool)
+
+            self.assertIsNot(child, parent)
+            self.assertEqual([key[2] for key in PoolRegistry._pools], [getpid() + 1])
+            self.assertEqual(list(PoolRegistry.stats()), ["default"])
+
+
+class PooledDatabaseWrapperTest(SimpleTestCase):
+    """
+    The health check and reset the PostgreSQL backend hands its pools, on mocked psycopg2 connections.
+    """
+
+    def connection(self, status: int = extensions.TRANSACTION_STATUS_IDLE) -> mock.Mock:
+        connection = mock.MagicMock()
+        connection.get_transaction_status.return_value = status
+        return connection
+
+    def test_ping_runs_a_query_and_ends_its_transaction(self):
+        connection = self.connection()
+        self.assertTrue(DatabaseWrapper.ping(connection))
+
+        connection.cursor.return_value.__enter__.return_value.execute.assert_called_once_with("SELECT 1")
+        connection.rollback.assert_called_once()
+
+    def test_reset_rolls_back_open_transactions(self):
+        idle, open_transaction = self.connection(), self.connection(status=extensions.TRANSACTION_STATUS_INTRANS)
+        DatabaseWrapper.reset(idle)
+        DatabaseWrapper.reset(open_transaction)
+
+        idle.rollback.assert_not_called()
+        open_transaction.rollback.assert_called_once()
+
+    def test_reset_rejects_broken_connections(self):
+        with self.assertRaises(InterfaceError):
+            DatabaseWrapper.reset(self.connection(status=extensions.TRANSACTION_STATUS_UNKNOWN))
+
+
+class QueryTimerTest(TestCase):
+
+    def query(self, alias: str = "default") -> None:
+        with connections[alias].cursor() as cursor:
+            cursor.execute("SELECT 1")
+
+    def test_statements_are_counted_while_tracking(self):
+        self.query()
+        with QueryTimer().track() as timer:
+            self.query()
+            self.query()
+        self.query()
+
+        self.assertEqual(timer.count, 2)
+        self.assertGreater(timer.seconds, 0)
+
+    def test_statements_on_sync_to_async_threads_are_counted(self):
+        async def run():
+            await sync_to_async(self.query, thread_sensitive=False)()
+
+        with QueryTimer().track() as timer:
+            asyncio.run(run())
+
+        self.assertEqual(timer.count, 1)
+
+    def test_nested_timers_both_count(self):
+        with QueryTimer().track() as outer:
+            self.query()
+            with QueryTimer().track() as inner:
+                self.query()
+
+        self.assertEqual((outer.count, inner.count), (2, 1))
+
+
+@override_settings(REQUEST_TIMING_SAMPLE_RATE=1, RATE_LIMIT_ENABLED=False, DATABASE_SHARDS=["default"],
+                   DATABASE_REPLICAS=[])
+class RequestTimingMiddlewareTest(TestCase):
+    """
+    The Server-Timing header of requests through the whole middleware stack.
+    """
+
+    HEADER_REGEX = re.compile(
+        r'^total;dur=([0-9.]+), view;dur=([0-9.]+), render;dur=([0-9.]+), db;dur=([0-9.]+);desc="(\d+) queries"$')
+
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            username="timed", email="timed@example.com", password="secret-pass-1", is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def timings(self, response: HttpResponse = None) -> tuple:
+        match = self.HEADER_REGEX.match(response["Server-Timing"])
+        self.assertIsNotNone(match, response["Server-Timing"])
+        return tuple(float(value) for value in match.groups()[:4]) + (int(match.group(5)),)
+
+    def test_sampled_requests_are_broken_down(self):
+        with self.assertLogs("logger.core.timing", level="INFO") as logs:
+            response = self.client.get(reverse("get-all-urls"))
+        total, view, render, db, queries = self.timings(response=response)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(queries, 1)
+        self.assertGreater(render, 0)
+        self.assertLessEqual(view + render, total)
+        self.assertLessEqual(db, total)
+        self.assertIn(f'"queries": {queries}', logs.output[0])
+        self.assertIn('"path": "/all/"', logs.output[0])
+
+    @override_settings(REQUEST_TIMING_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_left_alone(self):
+        self.assertNotIn("Server-Timing", self.client.get(reverse("get-all-urls")))
+
+    def test_plain_responses_time_their_view(self):
+        def view(request):
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            return HttpResponse()
+
+        middleware = RequestTimingMiddleware(get_response=lambda request: (
+            middleware.process_view(request, view, (), {}) or view(request)))
+        response = middleware(RequestFactory().get("/"))
+        total, view_ms, render, db, queries = self.timings(response=response)
+
+        self.assertEqual((render, queries), (0, 1))
+        self.assertGreater(view_ms, 0)
+
+
+class MetricsRegistryTest(SimpleTestCase):
+    """
+    Registries writing their snapshots to a temporary directory; a second registry stands in
+    for another worker.
+    """
+
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.registry = self.make()
+
+    def make(self) -> MetricsRegistry:
+        registry = MetricsRegistry(directory=self.directory, flush_interval=60, stale_after=60)
+        registry.counter("requests_total", "Requests by status.", ("status",))
+        registry.gauge("pending", "Pending items.")
+        registry.histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1))
+        return registry
+
+    def worker(self, pid: int = None, age: float = 0, **values) -> None:
+        ## Writes the snapshot a worker with this pid would have written `age` seconds ago.
+        registry = self.make()
+        self.fill(registry, **values)
+        file_path = registry.snapshot_path(pid)
+        with open(file_path, "w") as snapshot:
+            json.dump({"pid": pid, "time": time() - age, "metrics": registry.snapshot()}, snapshot)
+        utime(file_path, (time() - age, time() - age))
+
+    def fill(self, registry: MetricsRegistry = None, requests: int = 0, pending: float = 0, latencies=()) -> None:
+        registry._metrics["requests_total"].inc(requests, status=200)
+        registry._metrics["pending"].set(pending)
+        for latency in latencies:
+            registry._metrics["latency_seconds"].observe(latency, route="home")
+
+    def test_the_exposition_format(self):
+        self.fill(self.registry, requests=3, pending=2.5, latencies=(0.05, 0.5, 5))
+        self.registry._metrics["requests_total"].inc(status='a"b\\c\n')
+
+        self.assertEqual(self.registry.exposition(), "\n".join((
+            "# HELP latency_seconds Latency.",
+            "# TYPE latency_seconds histogram",
+            'latency_seconds_bucket{route="home",le="0.1"} 1',
+            'latency_seconds_bucket{route="home",le="1"} 2',
+            'latency_seconds_bucket{route="home",le="+Inf"} 3',
+            'latency_seconds_sum{route="home"} 5.55',
+            'latency_seconds_count{route="home"} 3',
+            "# HELP pending Pending items.",
+            "# TYPE pending gauge",
+            "pending 2.5",
+            "# HELP requests_total Requests by status.",
+            "# TYPE requests_total counter",
+            'requests_total{status="200"} 3',
+            'requests_total{status="a\\"b\\\\c\\n"} 1',
+        )) + "\n")
+
+    def test_worker_snapshots_are_summed(self):
+        self.fill(self.registry, requests=3, pending=1, latencies=(0.05,))
+        self.worker(pid=getpid() + 1, requests=4, pending=2, latencies=(0.5, 5))
+        self.worker(pid=getpid() + 2, requests=1)
+
+        exposition = self.registry.exposition()
+        self.assertIn('requests_total{status="200"} 8', exposition)
+        self.assertIn("pending 3", exposition)
+        self.assertIn('latency_seconds_bucket{route="home",le="1"} 2', exposition)
+        self.assertIn('latency_seconds_count{route="home"} 3', exposition)
+
+    def test_the_own_snapshot_is_not_counted_twice(self):
+        self.fill(self.registry, requests=3)
+        self.registry.write_snapshot()
+
+        self.assertEqual(listdir(self.directory), [f"{getpid()}.json"])
+        self.assertIn('requests_total{status="200"} 3', self.registry.exposition())
+
+    def test_stale_snapshots_are_removed(self):
+        self.worker(pid=getpid() + 1, requests=4, age=120)
+
+        self.assertNotIn('requests_total{status="200"}', self.registry.exposition())
+        self.assertEqual(listdir(self.directory), [])
+
+    def test_unreadable_snapshots_are_skipped(self):
+        with open(path.join(self.directory, "1.json"), "w") as snapshot:
+            snapshot.write("{")
+        self.worker(pid=getpid() + 1, requests=4)
+
+        self.assertIn('requests_total{status="200"} 4', self.registry.exposition())
+
+    def test_families_with_other_buckets_are_not_merged(self):
+        other = MetricsRegistry(directory=self.directory)
+        other.histogram("latency_seconds", "Latency.", ("route",), buckets=(0.5,)).observe(0.1, route="home")
+        with open(other.snapshot_path(getpid() + 1), "w") as snapshot:
+            json.dump({"pid": getpid() + 1, "time": time(), "metrics": other.snapshot()}, snapshot)
+        self.fill(self.registry, latencies=(0.05,))
+
+        self.assertIn('latency_seconds_count{route="home"} 1', self.registry.exposition())
+
+    def test_families_of_other_workers_only_are_reported(self):
+        self.worker(pid=getpid() + 1, requests=4)
+        del self.registry._metrics["requests_total"]
+
+        self.assertIn('requests_total{status="200"} 4', self.registry.exposition())
+
+    def test_collectors_run_before_every_snapshot(self):
+        self.registry.add_collector(lambda: self.registry._metrics["pending"].set(7))
+        self.registry.add_collector(mock.Mock(side_effect=RuntimeError("broken collector")))
+
+        self.assertIn("pending 7", self.registry.exposition())
+
+    def test_reset_forgets_every_sample(self):
+        self.fill(self.registry, requests=3, latencies=(0.05,))
+        self.registry.reset()
+
+        self.assertEqual(self.registry.exposition().count("{"), 0)
+
+
+class MetricsViewTest(SimpleTestCase):
+
+    def get(self, **extra) -> HttpResponse:
+        return metrics_view(RequestFactory().get("/metrics/", **extra))
+
+    @override_settings(METRICS_TOKEN="")
+    def test_without_a_token_only_local_requests_are_served(self):
+        response = self.get(REMOTE_ADDR="127.0.0.1")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        self.assertEqual(self.get(REMOTE_ADDR="10.0.0.1").status_code, 403)
+        self.assertEqual(self.get(REMOTE_ADDR="127.0.0.1", HTTP_X_FORWARDED_FOR="10.0.0.1").status_code, 403)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_a_token_is_required_once_set(self):
+        self.assertEqual(self.get(REMOTE_ADDR="127.0.0.1").status_code, 401)
+        self.assertEqual(self.get(REMOTE_ADDR="10.0.0.1", HTTP_AUTHORIZATION="Bearer secret").status_code, 200)
@@ -0,0 +1,193 @@
+import asyncio
+import json
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from random import random
+from threading import Lock
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpRequest, HttpResponse
+
+logger = logging.getLogger('logger.' + __name__)
+
+## Timers of the current request. Context variables follow the request into the threads
+## sync_to_async runs its ORM work on, where thread-local execute wrappers would not.
+_query_timers: ContextVar = ContextVar("query_timers", default=())
+
+
+def _execute_with_timers(execute, sql, params, many, context):
+    timers = _query_timers.get()
+    if not timers:
+        return execute(sql, params, many, context)
+
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = perf_counter() - start
+        for timer in timers:
+            timer.add(elapsed)
+
+
+def _install_execute_wrapper(connection=None, **kwargs) -> None:
+    if _execute_with_timers not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_execute_with_timers)
+
+
+connection_created.connect(_install_execute_wrapper)
+
+
+class QueryTimer:
+    """
+    Counts the SQL statements run while it is tracking, on any thread of the request, and
+    their total duration.
+    """
+
+    def __init__(self) -> None:
+        self.count: int = 0
+        self.seconds: float = 0.0
+        self._lock = Lock()
+
+    def add(self, seconds: float = 0.0) -> None:
+        with self._lock:
+            self.count += 1
+            self.seconds += seconds
+
+    @contextmanager
+    def track(self):
+        ## Connections opened before this module was imported never saw connection_created.
+        for connection in connections.all():
+            _install_execute_wrapper(connection=connection)
+
+        token = _query_timers.set(_query_timers.get() + (self,))
+        try:
+            yield self
+        finally:
+            _query_timers.reset(token)
+
+
+class AsyncCapableMiddleware:
+    """
+    Base of middlewares usable in both handler modes: Django 3.2 adapts a sync-only middleware
+    in an ASGI stack with a thread-sensitive sync_to_async, which runs every request's
+    middleware on one shared thread. Subclasses implement `handle` and `ahandle`.
+    """
+
+    sync_capable: bool = True
+    async_capable: bool = True
+
+    def __init__(self, get_response=None) -> None:
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            ## Marks instances as coroutine functions, as django.utils.deprecation.MiddlewareMixin does.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request: HttpRequest):
+        if self.is_async:
+            return self.ahandle(request)
+
+        return self.handle(request)
+
+    def handle(self, request: HttpRequest) -> HttpResponse:
+        raise NotImplementedError
+
+    async def ahandle(self, request: HttpRequest) -> HttpResponse:
+        raise NotImplementedError
+
+
+class RequestTimingMiddleware(AsyncCapableMiddleware):
+    """
+    Breaks a sampled fraction (REQUEST_TIMING_SAMPLE_RATE) of requests down into view, render
+    and SQL time, sent back as a `Server-Timing` header and logged as one JSON line.
+
+    Must be the last entry in MIDDLEWARE: the view is timed from process_view to
+    process_template_response, where DRF responses are rendered (serialized) and timed.
+    Redirects answered by url_app.fastpath never reach Django and are not timed.
+    """
+
+    def __init__(self, get_response=None) -> None:
+        super().__init__(get_response=get_response)
+        self.sample_rate = settings.REQUEST_TIMING_SAMPLE_RATE
+        if self.is_async:
+            ## Coroutine hooks, so the async handler does not adapt them with a thread hop.
+            self.process_view = self.aprocess_view
+            self.process_template_response = self.aprocess_template_response
+
+    def sampled(self) -> bool:
+        return not (self.sample_rate <= 0 or (self.sample_rate < 1 and random() >= self.sample_rate))
+
+    def handle(self, request: HttpRequest) -> HttpResponse:
+        if not self.sampled():
+            return self.get_response(request)
+
+        request._timing = {"view": 0.0, "render": 0.0}
+        start = perf_counter()
+        with QueryTimer().track() as timer:
+            response = self.get_response(request)
+
+        return self.report(request=request, response=response, timer=timer, total=perf_counter() - start)
+
+    async def ahandle(self, request: HttpRequest) -> HttpResponse:
+        if not self.sampled():
+            return await self.get_response(request)
+
+        request._timing = {"view": 0.0, "render": 0.0}
+        start = perf_counter()
+        with QueryTimer().track() as timer:
+            response = await self.get_response(request)
+
+        return self.report(request=request, response=response, timer=timer, total=perf_counter() - start)
+
+    def report(self, request: HttpRequest = None, response: HttpResponse = None, timer: QueryTimer = None,
+               total: float = 0.0) -> HttpResponse:
+        timings = request._timing
+        if "viewStart" in timings and not timings["view"]:
+            ## Plain HttpResponses have no render step; the view ran until the response came back.
+            timings["view"] = perf_counter() - timings["viewStart"]
+
+        response["Server-Timing"] = ", ".join((
+            f"total;dur={total * 1000:.2f}",
+            f"view;dur={timings['view'] * 1000:.2f}",
+            f"render;dur={timings['render'] * 1000:.2f}",
+            f'db;dur={timer.seconds * 1000:.2f};desc="{timer.count} queries"',
+        ))
+        logger.info(json.dumps({
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "totalMs": round(total * 1000, 2),
+            "viewMs": round(timings["view"] * 1000, 2),
+            "renderMs": round(timings["render"] * 1000, 2),
+            "dbMs": round(timer.seconds * 1000, 2),
+            "queries": timer.count
+        }))
+
+        return response
+
+    def process_view(self, request: HttpRequest, view_func, view_args, view_kwargs) -> None:
+        if hasattr(request, "_timing"):
+            request._timing["viewStart"] = perf_counter()
+
+    def process_template_response(self, request: HttpRequest, response: HttpResponse) -> HttpResponse:
+        timings = getattr(request, "_timing", None)
+        if timings is None or "viewStart" not in timings:
+            return response
+
+        start = perf_counter()
+        timings["view"] = start - timings["viewStart"]
+        ## Rendering is idempotent, so the handler's own render() call afterwards is a no-op.
+        response.render()
+        timings["render"] = perf_counter() - start
+
+        return response
+
+    async def aprocess_view(self, request: HttpRequest, view_func, view_args, view_kwargs) -> None:
+        return RequestTimingMiddleware.process_view(self, request, view_func, view_args, view_kwargs)
+
+    async def aprocess_template_response(self, request: HttpRequest, response: HttpResponse) -> HttpResponse:
+        return RequestTimingMiddleware.process_template_response(self, request, response)
@@ -1,7 +1,11 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from core.metrics import metrics_view
+
 urlpatterns = [
+    ## Before url_app's catch-all slug route; "metrics" is a reserved short code.
+    path('metrics/', metrics_view, name='metrics'),
     path('', include('url_app.endpoints')),
     path('admin/', admin.site.urls),
     path('api/user/', include('user_app.endpoints'))
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_wsgi_application()
+
+## Redirects for live short codes are answered ahead of the middleware stack and DRF;
+## everything else falls through to Django.
+from url_app.fastpath import RedirectFastPath
+application = RedirectFastPath(application=application)
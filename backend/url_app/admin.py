@@ -1,6 +1,11 @@
 from django.contrib import admin
-from url_app.models import ShortenedURL
+from url_app.models import ClickRollup, ShortenedURL
 
 @admin.register(ShortenedURL)
 class ShortenedUrlAdmin(admin.ModelAdmin):
-    list_display = ("id", "long_url", "expiry")
+    list_display = ("id", "short_code", "long_url", "expiry")
+
+
+@admin.register(ClickRollup)
+class ClickRollupAdmin(admin.ModelAdmin):
+    list_display = ("id", "link", "granularity", "bucket", "clicks", "unique_visitors")
@@ -1,4 +1,8 @@
-from django.shortcuts import redirect
+from uuid import UUID
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 from rest_framework import status
 from rest_framework.request import Request
@@ -6,6 +10,10 @@ from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 
 from core.boilerplate.template_responses import Resp
+from url_app.clicks import ClickHelper
+from url_app.fastpath import RedirectFastPath
+from url_app.helpers import ExportHelper
+from url_app.model_choices import RollupChoice
 from url_app.utils import ShortenedURLUtils
 
 from url_app import logger
@@ -18,7 +26,7 @@ class GetAllURLsAPI(APIView):
         resp = Resp()
 
         try:
-            page = int(request.query_params.get("page", 1))
+            limit = int(request.query_params.get("limit", 0))
         except Exception as ex:
             resp.error = "Invalid Data."
             resp.message = f"{ex}"
@@ -27,11 +35,51 @@ class GetAllURLsAPI(APIView):
             logger.warn(resp.message)
             return resp.to_response()
 
-        resp = ShortenedURLUtils.get_all_urls(page=page, user=request.user)
+        resp = ShortenedURLUtils.get_all_urls(
+            cursor=request.query_params.get("cursor"),
+            limit=limit,
+            count=request.query_params.get("count", ShortenedURLUtils.COUNT_NONE),
+            user=request.user
+        )
 
         return resp.to_response()
 
 
+class ExportURLsAPI(APIView):
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request: Request, *args, **kwargs):
+        resp = Resp()
+
+        ## Not `format`: DRF reserves that parameter for renderer negotiation.
+        fmt = request.query_params.get("output", ExportHelper.NDJSON)
+        try:
+            assigned_user = request.query_params.get("user")
+            assigned_user = UUID(assigned_user) if assigned_user else None
+            created_from = request.query_params.get("created_from")
+            created_from = parse_datetime(created_from) if created_from else None
+            created_to = request.query_params.get("created_to")
+            created_to = parse_datetime(created_to) if created_to else None
+        except Exception as ex:
+            resp.error = "Invalid Data."
+            resp.message = f"{ex}"
+            resp.status_code = status.HTTP_400_BAD_REQUEST
+
+            logger.warn(resp.message)
+            return resp.to_response()
+
+        resp = ShortenedURLUtils.export_urls(
+            user=request.user, fmt=fmt, assigned_user=assigned_user, created_from=created_from,
+            created_to=created_to, state=request.query_params.get("state")
+        )
+        if resp.status_code != status.HTTP_200_OK:
+            return resp.to_response()
+
+        response = StreamingHttpResponse(resp.data, content_type=ExportHelper.CONTENT_TYPES[fmt])
+        response["Content-Disposition"] = f'attachment; filename="urls-{timezone.now():%Y%m%d%H%M%S}.{fmt}"'
+        return response
+
+
 class CreateShortUrlAPI(APIView):
     permission_classes = (IsAuthenticated,)
 
@@ -58,19 +106,61 @@ class CreateShortUrlAPI(APIView):
         return resp.to_response()
 
 
+class BulkCreateShortUrlAPI(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request: Request, *args, **kwargs):
+        data = request.data
+        items = data if isinstance(data, list) else data.get("items")
+
+        resp = ShortenedURLUtils.bulk_create_short_urls(user=request.user, items=items)
+
+        return resp.to_response()
+
+
 class GetShortUrlAPI(APIView):
     permission_classes = (AllowAny,)
-    secure_http: str = "https://"
 
     def get(self, request: Request, slug: str = None, *args, **kwargs):
 
-        resp = ShortenedURLUtils.get_long_url(short_url=slug)
+        visitor = ClickHelper.visitor_hash(
+            ip=request.META.get("REMOTE_ADDR"), user_agent=request.META.get("HTTP_USER_AGENT"))
+        resp = ShortenedURLUtils.get_long_url(
+            short_url=slug, visitor=visitor, resolved=RedirectFastPath.resolved(request=request))
 
         if resp.error:
             return resp.to_response()
 
-        long_url = str(resp.data.get("long_url"))
-        long_url = f"{self.secure_http}{long_url}" if not long_url.startswith(
-            self.secure_http) else long_url
+        status_code, _ = ShortenedURLUtils.get_redirect_status()
+        response = HttpResponse(status=status_code)
+        for header, value in ShortenedURLUtils.get_redirect_headers(
+                short_code=slug, long_url=str(resp.data.get("long_url")), expiry=resp.data.get("expiry")):
+            response[header] = value
+
+        return response
+
+
+class GetUrlStatsAPI(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request: Request, slug: str = None, *args, **kwargs):
+        resp = Resp()
 
-        return redirect(to=long_url, permanent=True)
+        granularity = request.query_params.get("granularity", RollupChoice.hour)
+        try:
+            start = request.query_params.get("start")
+            start = parse_datetime(start) if start else None
+            end = request.query_params.get("end")
+            end = parse_datetime(end) if end else None
+        except Exception as ex:
+            resp.error = "Invalid Data."
+            resp.message = f"{ex}"
+            resp.status_code = status.HTTP_400_BAD_REQUEST
+
+            logger.warn(resp.message)
+            return resp.to_response()
+
+        resp = ShortenedURLUtils.get_link_stats(
+            user=request.user, short_code=slug, granularity=granularity, start=start, end=end)
+
+        return resp.to_response()
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class UrlAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'url_app'
+
+    def ready(self):
+        import url_app.signals
+
+        from core.metrics import registry
+        from url_app.utils import ShortenedURLUtils
+        registry.add_collector(ShortenedURLUtils.collect_metrics)
@@ -0,0 +1,551 @@
+import asyncio
+import json
+import platform
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from random import Random
+from statistics import mean
+from threading import Lock, Thread
+from time import perf_counter
+from typing import Callable, List, Tuple
+
+import django
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection
+from django.test import Client, RequestFactory, override_settings
+from django.utils import timezone
+
+from user_app.models import User
+from user_app.utils import JWTUtils
+from url_app.fastpath import AsyncRedirectFastPath, RedirectFastPath
+from url_app.helpers import URLHelper
+from url_app.models import ShortCodeClaim, ShortenedURL
+from url_app.serializers import ShortenedUrlReadSerializer, ShortenedUrlSerializer
+from url_app.utils import ShortenedURLUtils
+
+
+class BenchmarkHelper:
+    """
+    Timing utilities shared by the benchmark scenarios.
+    """
+
+    @classmethod
+    def time_calls(cls, func: Callable = None, iterations: int = 1000, warmup: int = 50) -> List[float]:
+        for _ in range(warmup):
+            func()
+
+        samples = []
+        for _ in range(iterations):
+            start = perf_counter()
+            func()
+            samples.append(perf_counter() - start)
+
+        return samples
+
+    @classmethod
+    def time_async_calls(cls, func: Callable = None, iterations: int = 1000, warmup: int = 50) -> List[float]:
+        """
+        Same as time_calls for a coroutine function; every call runs on one event loop.
+        """
+        async def run():
+            for _ in range(warmup):
+                await func()
+
+            samples = []
+            for _ in range(iterations):
+                start = perf_counter()
+                await func()
+                samples.append(perf_counter() - start)
+
+            return samples
+
+        return asyncio.run(run())
+
+    @classmethod
+    def percentile(cls, ordered: List[float] = None, pct: float = 50.0) -> float:
+        index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+        return ordered[index]
+
+    @classmethod
+    def wsgi_call(cls, application=None, environ: dict = None) -> int:
+        result = {}
+
+        def start_response(status, headers, exc_info=None):
+            result["status"] = int(status.split(" ", 1)[0])
+
+        response = application(dict(environ), start_response)
+        b"".join(response)
+        if hasattr(response, "close"):
+            response.close()
+
+        return result["status"]
+
+    @classmethod
+    async def asgi_call(cls, application=None, method: str = "GET", path: str = "/", body: bytes = b"", headers: list = None) -> int:
+        result = {}
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "root_path": "",
+            "query_string": b"",
+            "headers": [(b"host", b"testserver"), (b"content-length", str(len(body)).encode())] + (headers or []),
+            "client": ("127.0.0.1", 50000),
+            "server": ("testserver", 80),
+        }
+
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                result["status"] = message["status"]
+
+        await application(scope, receive, send)
+        return result["status"]
+
+    @classmethod
+    def run_concurrent(cls, factory: Callable = None, requests: int = 1000, concurrency: int = 50) -> dict:
+        """
+        Spread `requests` calls over `concurrency` threads, each calling its own `factory()`
+        result (e.g. with its own test client), and report latency and overall throughput.
+        """
+        samples = []
+        errors = []
+        lock = Lock()
+
+        def worker(func: Callable = None, calls: int = 0):
+            local, failed = [], 0
+            try:
+                for _ in range(calls):
+                    start = perf_counter()
+                    try:
+                        func()
+                    except Exception:
+                        failed += 1
+                    local.append(perf_counter() - start)
+            finally:
+                connection.close()
+
+            with lock:
+                samples.extend(local)
+                errors.append(failed)
+
+        ## The callers are made here, in order, so each thread gets the same one on every run.
+        threads = [
+            Thread(target=worker, args=(factory(), requests // concurrency + (1 if index < requests % concurrency else 0)))
+            for index in range(concurrency)
+        ]
+        start = perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = perf_counter() - start
+
+        summary = cls.summarise(samples)
+        summary["concurrency"] = concurrency
+        summary["errors"] = sum(errors)
+        summary["throughputRps"] = round(len(samples) / elapsed, 2) if elapsed else None
+        return summary
+
+    @classmethod
+    def environment(cls) -> dict:
+        """
+        What a run was measured on, so results from different commits and machines can be told apart.
+        """
+        try:
+            commit = subprocess.run(
+                ["git", "rev-parse", "HEAD"], capture_output=True, text=True, timeout=5, cwd=settings.BASE_DIR
+            ).stdout.strip() or None
+        except Exception:
+            commit = None
+
+        return {
+            "commit": commit,
+            "timestamp": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "machine": platform.machine(),
+            "processor": platform.processor() or None
+        }
+
+    @classmethod
+    def summarise(cls, samples: List[float] = None) -> dict:
+        ordered = sorted(samples)
+        total = sum(ordered)
+        return {
+            "requests": len(ordered),
+            "meanUs": round(mean(ordered) * 1e6, 2),
+            "p50Us": round(cls.percentile(ordered, 50) * 1e6, 2),
+            "p90Us": round(cls.percentile(ordered, 90) * 1e6, 2),
+            "p99Us": round(cls.percentile(ordered, 99) * 1e6, 2),
+            "throughputRps": round(len(ordered) / total, 2) if total else None
+        }
+
+
+class RedirectBenchmark:
+    """
+    Per-request overhead of the redirect fast path against GetShortUrlAPI.
+    Both run through a WSGIHandler, the only difference being the RedirectFastPath wrapper.
+    """
+
+    @classmethod
+    def seed(cls) -> ShortenedURL:
+        user, _ = User.objects.get_or_create(
+            username="benchmark",
+            defaults={"email": "benchmark@mslate.ai", "phone": "9000000000"}
+        )
+        return ShortenedURL.objects.create(long_url="example.com/benchmark", assigned_user=user)
+
+    @classmethod
+    def call(cls, application=None, environ: dict = None) -> Callable:
+        expected, _ = ShortenedURLUtils.get_redirect_status()
+
+        def run():
+            status = BenchmarkHelper.wsgi_call(application, environ)
+            if status != expected:
+                raise AssertionError(f"Unexpected status: {status}")
+
+        return run
+
+    @classmethod
+    def run(cls, iterations: int = 1000) -> dict:
+        url = cls.seed()
+        environ = RequestFactory().get(f"/{url.short_code}/").environ
+
+        handler = WSGIHandler()
+        results = {
+            "GetShortUrlAPI": BenchmarkHelper.summarise(
+                BenchmarkHelper.time_calls(cls.call(handler, environ), iterations=iterations)
+            ),
+            "RedirectFastPath": BenchmarkHelper.summarise(
+                BenchmarkHelper.time_calls(cls.call(RedirectFastPath(application=handler), environ), iterations=iterations)
+            ),
+        }
+        results["speedup"] = round(results["GetShortUrlAPI"]["meanUs"] / results["RedirectFastPath"]["meanUs"], 2)
+
+        return results
+
+
+class SerializerBenchmark:
+    """
+    Per-object cost of ShortenedUrlSerializer against ShortenedUrlReadSerializer, on
+    instances already in memory and on a listing page fetched from the database.
+    """
+
+    @classmethod
+    def seed(cls, count: int = 0) -> None:
+        user, _ = User.objects.get_or_create(
+            username="benchmark",
+            defaults={"email": "benchmark@mslate.ai", "phone": "9000000000"}
+        )
+        objs = ShortenedURL.objects.bulk_create([
+            ShortenedURL(long_url=f"example.com/serializer/{index}", assigned_user=user,
+                         expiry=ShortenedURLUtils.get_expiry(expiry_mins=60))
+            for index in range(count)
+        ])
+        ShortCodeClaim.claim(links=objs)
+
+    @classmethod
+    def per_object(cls, samples: List[float] = None, count: int = 1) -> dict:
+        summary = BenchmarkHelper.summarise(samples)
+        summary["perObjectUs"] = round(summary["meanUs"] / count, 3)
+        return summary
+
+    @classmethod
+    def run(cls, iterations: int = 1000) -> dict:
+        count = settings.ITEMS_PER_PAGE
+        cls.seed(count=count)
+        queryset = ShortenedURL.objects.order_by("-created", "-id")[:count]
+        objs = list(queryset)
+        iterations = max(1, iterations // 10)
+
+        results = {
+            "instances:ShortenedUrlSerializer": cls.per_object(BenchmarkHelper.time_calls(
+                lambda: ShortenedUrlSerializer(objs, many=True).data, iterations=iterations), count),
+            "instances:ShortenedUrlReadSerializer": cls.per_object(BenchmarkHelper.time_calls(
+                lambda: ShortenedUrlReadSerializer.many(objs), iterations=iterations), count),
+            "page:ShortenedUrlSerializer": cls.per_object(BenchmarkHelper.time_calls(
+                lambda: ShortenedUrlSerializer(queryset.all(), many=True).data, iterations=iterations), count),
+            "page:ShortenedUrlReadSerializer": cls.per_object(BenchmarkHelper.time_calls(
+                lambda: ShortenedUrlReadSerializer.many(queryset.all()), iterations=iterations), count),
+        }
+        results["instanceSpeedup"] = round(
+            results["instances:ShortenedUrlSerializer"]["meanUs"] / results["instances:ShortenedUrlReadSerializer"]["meanUs"], 2)
+        results["pageSpeedup"] = round(
+            results["page:ShortenedUrlSerializer"]["meanUs"] / results["page:ShortenedUrlReadSerializer"]["meanUs"], 2)
+
+        return results
+
+
+class AsgiBenchmark:
+    """
+    Side-by-side comparison of the ASGI and WSGI entry points: concurrent redirect
+    throughput through each fast path, and create latency and concurrent throughput through
+    CreateShortUrlAPI (WSGI and ASGI) against the native async create view.
+    """
+
+    ## Shared by every create call, so no two runs post the same URL.
+    SEQUENCE = count()
+
+    @classmethod
+    def redirect_throughput(cls, requests: int = 1000, concurrency: int = 50) -> dict:
+        url = RedirectBenchmark.seed()
+        path = f"/{url.short_code}/"
+
+        wsgi_app = RedirectFastPath(application=WSGIHandler())
+        environ = RequestFactory().get(path).environ
+        start = perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            statuses = list(executor.map(lambda _: BenchmarkHelper.wsgi_call(wsgi_app, environ), range(requests)))
+        wsgi_elapsed = perf_counter() - start
+
+        asgi_app = AsyncRedirectFastPath(application=ASGIHandler())
+
+        async def run_all():
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def one():
+                async with semaphore:
+                    return await BenchmarkHelper.asgi_call(asgi_app, path=path)
+
+            return await asyncio.gather(*(one() for _ in range(requests)))
+
+        start = perf_counter()
+        statuses += asyncio.run(run_all())
+        asgi_elapsed = perf_counter() - start
+
+        return {
+            "requests": requests,
+            "concurrency": concurrency,
+            "wsgiRps": round(requests / wsgi_elapsed, 2),
+            "asgiRps": round(requests / asgi_elapsed, 2),
+            "nonRedirects": len([code for code in statuses if code != ShortenedURLUtils.get_redirect_status()[0]])
+        }
+
+    @classmethod
+    def create_calls(cls) -> Tuple[Callable, Callable]:
+        """
+        A WSGI create call and a factory of ASGI create coroutines for a path, each posting a
+        fresh URL and raising unless it was created.
+        """
+        user, _ = User.objects.get_or_create(
+            username="benchmark",
+            defaults={"email": "benchmark@mslate.ai", "phone": "9000000000"}
+        )
+        token = JWTUtils.get_tokens_for_user(user=user)["accessToken"]
+
+        def body() -> bytes:
+            ## A fresh URL per call; repeating one would measure the deduplication shortcut instead.
+            return json.dumps({"long_url": f"example.com/benchmark/{next(cls.SEQUENCE)}", "expiry_mins": 60}).encode()
+
+        headers = [(b"authorization", f"Bearer {token}".encode()), (b"content-type", b"application/json")]
+
+        factory = RequestFactory()
+        wsgi_app = WSGIHandler()
+        asgi_app = ASGIHandler()
+
+        def wsgi_create():
+            environ = factory.post(
+                "/create/", data=body(), content_type="application/json", HTTP_AUTHORIZATION=f"Bearer {token}"
+            ).environ
+            status = BenchmarkHelper.wsgi_call(wsgi_app, environ)
+            if status != 201:
+                raise AssertionError(f"Unexpected status: {status}")
+
+        def asgi_create(path: str = None):
+            async def run():
+                status = await BenchmarkHelper.asgi_call(asgi_app, method="POST", path=path, body=body(), headers=headers)
+                if status != 201:
+                    raise AssertionError(f"Unexpected status: {status}")
+
+            return run
+
+        return wsgi_create, asgi_create
+
+    @classmethod
+    def create_latency(cls, iterations: int = 200) -> dict:
+        wsgi_create, asgi_create = cls.create_calls()
+        ## One user and address make every call; the rate limits would reject most creates.
+        with override_settings(RATE_LIMIT_ENABLED=False):
+            return {
+                "wsgi:CreateShortUrlAPI": BenchmarkHelper.summarise(
+                    BenchmarkHelper.time_calls(wsgi_create, iterations=iterations, warmup=10)
+                ),
+                "asgi:CreateShortUrlAPI": BenchmarkHelper.summarise(
+                    BenchmarkHelper.time_async_calls(asgi_create("/create/"), iterations=iterations, warmup=10)
+                ),
+                "asgi:create_short_url_async": BenchmarkHelper.summarise(
+                    BenchmarkHelper.time_async_calls(asgi_create("/async/create/"), iterations=iterations, warmup=10)
+                ),
+            }
+
+    @classmethod
+    def create_throughput(cls, requests: int = 200, concurrency: int = 50) -> dict:
+        """
+        Creates per second with `concurrency` requests in flight; unlike the serial latencies,
+        this shows whether an entry point runs concurrent creates side by side or one at a time.
+        """
+        wsgi_create, asgi_create = cls.create_calls()
+
+        def asgi_rps(path: str = None) -> float:
+            run = asgi_create(path)
+
+            async def run_all():
+                semaphore = asyncio.Semaphore(concurrency)
+
+                async def one():
+                    async with semaphore:
+                        await run()
+
+                await asyncio.gather(*(one() for _ in range(requests)))
+
+            start = perf_counter()
+            asyncio.run(run_all())
+            return round(requests / (perf_counter() - start), 2)
+
+        with override_settings(RATE_LIMIT_ENABLED=False):
+            start = perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                list(executor.map(lambda _: wsgi_create(), range(requests)))
+            wsgi_rps = round(requests / (perf_counter() - start), 2)
+
+            return {
+                "requests": requests,
+                "concurrency": concurrency,
+                "wsgi:CreateShortUrlAPI": wsgi_rps,
+                "asgi:CreateShortUrlAPI": asgi_rps("/create/"),
+                "asgi:create_short_url_async": asgi_rps("/async/create/"),
+            }
+
+    @classmethod
+    def run(cls, iterations: int = 1000, concurrency: int = 50) -> dict:
+        return {
+            "redirectThroughput": cls.redirect_throughput(requests=iterations, concurrency=concurrency),
+            "create": cls.create_latency(iterations=max(1, iterations // 5)),
+            "createThroughput": cls.create_throughput(requests=max(1, iterations // 5), concurrency=concurrency),
+        }
+
+
+class ApiBenchmark:
+    """
+    GetShortUrlAPI, CreateShortUrlAPI and GetAllURLsAPI through the Django test client,
+    serially for latency percentiles and from concurrent threads for throughput, against
+    `links` seeded links.
+    """
+
+    SEED_BATCH_SIZE: int = 5000
+
+    @classmethod
+    def seed_user(cls) -> User:
+        user, _ = User.objects.get_or_create(
+            username="benchmark",
+            defaults={"email": "benchmark@mslate.ai", "phone": "9000000000", "is_staff": True}
+        )
+        if not user.is_staff:
+            user.is_staff = True
+            user.save()
+        return user
+
+    @classmethod
+    def seed(cls, links: int = 10000, user: User = None) -> List[str]:
+        """
+        Bulk insert `links` live links for the user and return their short codes.
+        """
+        codes = []
+        expiry = timezone.now() + timezone.timedelta(days=1)
+        for offset in range(0, links, cls.SEED_BATCH_SIZE):
+            objs = []
+            for index in range(offset, min(links, offset + cls.SEED_BATCH_SIZE)):
+                long_url = f"https://example.com/seed/{index}"
+                obj = ShortenedURL(long_url=long_url, url_hash=URLHelper.hash(long_url=long_url),
+                                   assigned_user=user, expiry=expiry)
+                obj.short_url = obj.build_short_url()
+                objs.append(obj)
+            ShortenedURL.objects.bulk_create(objs, batch_size=cls.SEED_BATCH_SIZE)
+            ShortCodeClaim.claim(links=objs)
+            codes.extend(obj.short_code for obj in objs)
+
+        return codes
+
+    @classmethod
+    def client_call(cls, client: Client = None, method: str = "get", path: str = "/", expected: int = 200,
+                    **kwargs) -> None:
+        response = getattr(client, method)(path, **kwargs)
+        if response.status_code != expected:
+            raise AssertionError(f"Unexpected status for {method.upper()} {path}: {response.status_code}")
+
+    @classmethod
+    def redirect(cls, codes: List[str] = None, seed: int = 0) -> Callable:
+        expected, _ = ShortenedURLUtils.get_redirect_status()
+        callers = count()
+
+        def factory():
+            ## Every caller draws from a generator of its own, seeded by `seed` and its creation order:
+            ## threads sharing one would interleave their draws differently on every run.
+            random = Random(f"{seed}:{next(callers)}")
+            client = Client()
+            return lambda: cls.client_call(client, "get", f"/{random.choice(codes)}/", expected)
+
+        return factory
+
+    @classmethod
+    def create(cls, token: str = None) -> Callable:
+        sequence = count()
+
+        def factory():
+            client = Client(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+            def run():
+                ## A fresh URL per call; repeating one would measure the deduplication shortcut instead.
+                body = {"long_url": f"https://example.com/create/{next(sequence)}", "expiry_mins": 60}
+                cls.client_call(client, "post", "/create/", 201, data=body, content_type="application/json")
+
+            return run
+
+        return factory
+
+    @classmethod
+    def listing(cls, token: str = None) -> Callable:
+        def factory():
+            client = Client(HTTP_AUTHORIZATION=f"Bearer {token}")
+            return lambda: cls.client_call(client, "get", "/all/")
+
+        return factory
+
+    @classmethod
+    def run(cls, iterations: int = 1000, concurrency: int = 50, links: int = 10000, seed: int = 0) -> dict:
+        user = cls.seed_user()
+        started = perf_counter()
+        codes = cls.seed(links=links, user=user)
+        seed_seconds = perf_counter() - started
+        token = JWTUtils.get_tokens_for_user(user=user)["accessToken"]
+
+        scenarios = {
+            "GetShortUrlAPI": (cls.redirect(codes=codes, seed=seed), iterations),
+            "CreateShortUrlAPI": (cls.create(token=token), max(1, iterations // 5)),
+            "GetAllURLsAPI": (cls.listing(token=token), max(1, iterations // 10)),
+        }
+        results = {
+            "seed": {"links": links, "seconds": round(seed_seconds, 3)},
+        }
+        ## One user and address make every call; the rate limits would reject most creates.
+        with override_settings(RATE_LIMIT_ENABLED=False):
+            for name, (factory, calls) in scenarios.items():
+                results[name] = {
+                    "serial": BenchmarkHelper.summarise(
+                        BenchmarkHelper.time_calls(factory(), iterations=calls, warmup=min(50, calls))
+                    ),
+                    "concurrent": BenchmarkHelper.run_concurrent(factory, requests=calls, concurrency=concurrency),
+                }
+
+        return results
@@ -0,0 +1,333 @@
+import atexit
+from datetime import datetime
+from hashlib import blake2b
+from math import log
+from os import getpid
+from threading import Event, Lock, Thread
+from time import perf_counter
+from typing import Dict, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, router, transaction
+from django.db.models import Case, F, PositiveBigIntegerField, Value, When
+from django.utils import timezone
+
+from core import metrics
+from core.db.sharding import ShardHelper
+from url_app.model_choices import RollupChoice
+from url_app.models import ClickRollup, ShortenedURL
+
+from url_app import logger
+
+
+class HyperLogLog:
+    """
+    HyperLogLog sketch over 64-bit hashes; 2^precision one-byte registers,
+    with a standard error of about 1.04 / sqrt(2^precision).
+    """
+
+    def __init__(self, precision: int = None, registers: bytes = None) -> None:
+        if registers:
+            ## Stored sketches keep the precision they were written with.
+            precision = len(registers).bit_length() - 1
+        self.precision = precision if precision is not None else settings.CLICK_ROLLUP_HLL_PRECISION
+        self.num_registers = 1 << self.precision
+        self.registers = bytearray(registers) if registers else bytearray(self.num_registers)
+
+    @property
+    def alpha(self) -> float:
+        if self.num_registers == 16:
+            return 0.673
+        if self.num_registers == 32:
+            return 0.697
+        if self.num_registers == 64:
+            return 0.709
+        return 0.7213 / (1 + 1.079 / self.num_registers)
+
+    def add_hash(self, value: int = 0) -> None:
+        index = value >> (64 - self.precision)
+        remainder = value & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - remainder.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog" = None) -> "HyperLogLog":
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self) -> int:
+        estimate = self.alpha * self.num_registers ** 2 / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        ## Small-range correction: linear counting while most registers are still empty.
+        if estimate <= 2.5 * self.num_registers and zeros:
+            estimate = self.num_registers * log(self.num_registers / zeros)
+
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.registers)
+
+
+class ClickHelper:
+    """
+    Helpers to place clicks into rollup buckets.
+    """
+
+    @classmethod
+    def visitor_hash(cls, ip: str = None, user_agent: str = None) -> int:
+        """
+        Anonymous 64-bit visitor id; only its HyperLogLog registers are ever stored.
+        """
+        digest = blake2b(f"{ip}|{user_agent}".encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+
+    @classmethod
+    def truncate(cls, moment: datetime = None, granularity: str = RollupChoice.minute) -> datetime:
+        moment = moment.replace(second=0, microsecond=0)
+        if granularity in (RollupChoice.hour, RollupChoice.day):
+            moment = moment.replace(minute=0)
+        if granularity == RollupChoice.day:
+            moment = moment.replace(hour=0)
+
+        return moment
+
+
+class ClickBuffer:
+    """
+    Per-worker write-behind buffer of redirect clicks.
+
+    Clicks are accumulated in memory per (short code, minute) and written by a background
+    thread every `flush_interval` seconds or as soon as `max_size` clicks are pending,
+    whichever comes first. A flush adds the totals to ShortenedURL.clicks with
+    `UPDATE ... SET clicks = clicks + CASE short_code ... END` statements of up to
+    TOTALS_PER_UPDATE codes each and merges the minute/hour/day rollups. A crashed worker
+    loses at most `flush_interval` seconds of clicks.
+
+    Clicks of failed flushes are kept for the next one, up to `max_pending` clicks: past that the
+    oldest minutes are dropped (and counted), so a long database outage cannot exhaust memory.
+    """
+
+    GRANULARITIES = (RollupChoice.minute, RollupChoice.hour, RollupChoice.day)
+    ## Each code takes three parameters (two in its WHEN, one in the IN list): 300 codes stay
+    ## under SQLite's 999 variables per statement.
+    TOTALS_PER_UPDATE = 300
+
+    def __init__(self, flush_interval: float = None, max_size: int = None, max_pending: int = None) -> None:
+        self.flush_interval = flush_interval if flush_interval is not None else settings.CLICK_FLUSH_INTERVAL
+        self.max_size = max_size if max_size is not None else settings.CLICK_BUFFER_MAX_SIZE
+        self.max_pending = max_pending if max_pending is not None else settings.CLICK_BUFFER_MAX_PENDING
+
+        ## (short_code, minute) -> [clicks, {visitor hashes}]
+        self._events: Dict[Tuple[str, datetime], list] = {}
+        self._pending: int = 0
+        self._lock = Lock()
+        self._wakeup = Event()
+        self._flusher: Thread = None
+        self._pid: int = None
+
+        self.flushes: int = 0
+        self.failed_flushes: int = 0
+        self.flushed_clicks: int = 0
+        self.dropped_clicks: int = 0
+        self.last_flush_seconds: float = 0.0
+        self.max_flush_seconds: float = 0.0
+
+    def record(self, short_code: str = None, visitor: int = None) -> None:
+        key = (short_code, ClickHelper.truncate(timezone.now()))
+        with self._lock:
+            event = self._events.get(key)
+            if event is None:
+                event = self._events[key] = [0, set()]
+            event[0] += 1
+            if visitor is not None:
+                event[1].add(visitor)
+            self._pending += 1
+            full = self._pending >= self.max_size
+
+        self._ensure_flusher()
+        if full:
+            self._wakeup.set()
+
+    def _write_totals(self, events: dict = None, using: str = None) -> None:
+        totals = {}
+        for (short_code, _), (clicks, _) in events.items():
+            totals[short_code] = totals.get(short_code, 0) + clicks
+
+        ## Called inside flush_shard's transaction, so the chunks commit together.
+        totals = list(totals.items())
+        for start in range(0, len(totals), self.TOTALS_PER_UPDATE):
+            chunk = dict(totals[start:start + self.TOTALS_PER_UPDATE])
+            ShortenedURL.objects.using(using).filter(short_code__in=chunk.keys()).update(
+                clicks=F("clicks") + Case(
+                    *[When(short_code=short_code, then=Value(count)) for short_code, count in chunk.items()],
+                    default=Value(0),
+                    output_field=PositiveBigIntegerField()
+                )
+            )
+
+    def _aggregate(self, events: dict = None, link_ids: dict = None) -> dict:
+        ## (link_id, granularity, bucket) -> [clicks, HyperLogLog]
+        rollups = {}
+        for (short_code, minute), (clicks, visitors) in events.items():
+            link_id = link_ids.get(short_code)
+            if link_id is None:
+                continue
+
+            for granularity in self.GRANULARITIES:
+                key = (link_id, granularity, ClickHelper.truncate(minute, granularity))
+                rollup = rollups.get(key)
+                if rollup is None:
+                    rollup = rollups[key] = [0, HyperLogLog()]
+                rollup[0] += clicks
+                for visitor in visitors:
+                    rollup[1].add_hash(visitor)
+
+        return rollups
+
+    def _write_rollups(self, rollups: dict = None, using: str = None) -> None:
+        with transaction.atomic(using=using):
+            existing = ClickRollup.objects.using(using).select_for_update().filter(
+                link_id__in={key[0] for key in rollups},
+                bucket__in={key[2] for key in rollups}
+            )
+
+            to_update = []
+            for row in existing:
+                key = (row.link_id, row.granularity, row.bucket)
+                if key not in rollups:
+                    continue
+
+                clicks, sketch = rollups.pop(key)
+                sketch.merge(HyperLogLog(registers=row.visitors))
+                row.clicks += clicks
+                row.visitors = sketch.to_bytes()
+                row.unique_visitors = sketch.count()
+                to_update.append(row)
+
+            ClickRollup.objects.using(using).bulk_update(to_update, ("clicks", "visitors", "unique_visitors"))
+            ClickRollup.objects.using(using).bulk_create([
+                ClickRollup(
+                    link_id=link_id, granularity=granularity, bucket=bucket, clicks=clicks,
+                    visitors=sketch.to_bytes(), unique_visitors=sketch.count()
+                )
+                for (link_id, granularity, bucket), (clicks, sketch) in rollups.items()
+            ])
+
+    def flush(self) -> int:
+        """
+        Write every pending click, one transaction per shard; on failure the events of that
+        shard are put back for the next flush.
+        """
+        with self._lock:
+            events, self._events = self._events, {}
+            self._pending = 0
+        if not events:
+            return 0
+
+        started = perf_counter()
+        clicks = 0
+        failed = False
+        for shard, keys in ShardHelper.group(events, key=lambda key: key[0]).items():
+            shard_events = {key: events[key] for key in keys}
+            try:
+                self.flush_shard(events=shard_events, using=shard or router.db_for_write(ShortenedURL))
+            except Exception as ex:
+                self._requeue(events=shard_events)
+                failed = True
+                logger.error(
+                    f"Click flush failed, {sum(event[0] for event in shard_events.values())} clicks kept for retry: {ex}")
+                continue
+
+            clicks += sum(event[0] for event in shard_events.values())
+
+        ## Failed flushes are timed too: a flush waiting on an unreachable database is what they measure.
+        elapsed = perf_counter() - started
+        self.last_flush_seconds = elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+        self.flushed_clicks += clicks
+        metrics.click_flush_seconds.observe(elapsed, result="failed" if failed else "ok")
+        if failed:
+            self.failed_flushes += 1
+        else:
+            self.flushes += 1
+
+        return clicks
+
+    def flush_shard(self, events: dict = None, using: str = None) -> None:
+        ## Totals and rollups commit together, so a retried flush never double counts.
+        with transaction.atomic(using=using):
+            self._write_totals(events=events, using=using)
+
+            link_ids = dict(
+                ShortenedURL.objects.using(using).filter(
+                    short_code__in={key[0] for key in events}).values_list("short_code", "pk")
+            )
+            try:
+                self._write_rollups(rollups=self._aggregate(events=events, link_ids=link_ids), using=using)
+            except IntegrityError:
+                ## Another worker created one of the buckets first; it is an update now.
+                self._write_rollups(rollups=self._aggregate(events=events, link_ids=link_ids), using=using)
+
+    def _requeue(self, events: dict = None) -> None:
+        with self._lock:
+            for key, (clicks, visitors) in events.items():
+                event = self._events.get(key)
+                if event is None:
+                    event = self._events[key] = [0, set()]
+                event[0] += clicks
+                event[1] |= visitors
+                self._pending += clicks
+
+            dropped = 0
+            if self._pending > self.max_pending:
+                for key in sorted(self._events, key=lambda key: key[1]):
+                    dropped += self._events.pop(key)[0]
+                    if self._pending - dropped <= self.max_pending:
+                        break
+                self._pending -= dropped
+                self.dropped_clicks += dropped
+
+        if dropped:
+            logger.error(f"Click buffer over {self.max_pending} clicks, dropped the {dropped} oldest.")
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(timeout=self.flush_interval)
+            self._wakeup.clear()
+
+            close_old_connections()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+    def _ensure_flusher(self) -> None:
+        ## Threads do not survive a fork, so every worker process starts its own flusher.
+        if self._pid == getpid() and self._flusher and self._flusher.is_alive():
+            return
+
+        with self._lock:
+            if self._pid == getpid() and self._flusher and self._flusher.is_alive():
+                return
+
+            self._pid = getpid()
+            self._flusher = Thread(target=self._run, name="click-flusher", daemon=True)
+            self._flusher.start()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "bufferDepth": self._pending,
+                "bufferedLinks": len({key[0] for key in self._events}),
+                "flushes": self.flushes,
+                "failedFlushes": self.failed_flushes,
+                "flushedClicks": self.flushed_clicks,
+                "droppedClicks": self.dropped_clicks,
+                "lastFlushSeconds": self.last_flush_seconds,
+                "maxFlushSeconds": self.max_flush_seconds
+            }
+
+
+## One click buffer per worker process, fed by ShortenedURLUtils.record_click.
+click_buffer = ClickBuffer()
+atexit.register(click_buffer.flush)
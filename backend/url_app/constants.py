@@ -0,0 +1,19 @@
+import re
+from string import digits, ascii_lowercase, ascii_uppercase
+
+
+class ShortCode:
+    """
+    Class to hold the format of the base62 short codes used as redirect slugs.
+    """
+
+    ALPHABET = digits + ascii_lowercase + ascii_uppercase
+    BASE = len(ALPHABET)
+    LENGTH = 7
+    # Every integer in [62^6, 62^7) encodes to exactly 7 base62 characters.
+    MIN_VALUE = BASE ** (LENGTH - 1)
+    MAX_VALUE = BASE ** LENGTH
+    MAX_ATTEMPTS = 5
+    ## Codes that would collide with top-level routes matched before the slug route.
+    RESERVED = frozenset(("metrics",))
+    REGEX = re.compile(r'^[0-9a-zA-Z]{%d}$' % LENGTH)
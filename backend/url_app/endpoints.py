@@ -1,11 +1,17 @@
 from django.urls import path, include
 
-from url_app.apis import GetShortUrlAPI, CreateShortUrlAPI, GetAllURLsAPI
+from url_app.apis import GetShortUrlAPI, CreateShortUrlAPI, BulkCreateShortUrlAPI, GetAllURLsAPI, GetUrlStatsAPI, \
+    ExportURLsAPI
+from url_app.views import create_short_url_async
 
 URL_PREFIX = '/'
 
 urlpatterns = [
     path('create/', CreateShortUrlAPI.as_view(), name='create-short'),
+    path('create/bulk/', BulkCreateShortUrlAPI.as_view(), name='create-short-bulk'),
+    path('async/create/', create_short_url_async, name='create-short-async'),
     path('all/', GetAllURLsAPI.as_view(), name='get-all-urls'),
+    path('export/', ExportURLsAPI.as_view(), name='export-urls'),
+    path('stats/<str:slug>/', GetUrlStatsAPI.as_view(), name='url-stats'),
     path('<str:slug>/', GetShortUrlAPI.as_view(), name='redirect-long'),
 ]
\ No newline at end of file
@@ -0,0 +1,172 @@
+import re
+from datetime import datetime
+from time import perf_counter
+from typing import List, Tuple
+
+from django.db import close_old_connections
+from django.http import parse_cookie
+from django.utils import timezone
+
+from core import metrics
+from core.db.routers import PrimaryReplicaRouter, ReplicaStickinessMiddleware
+from core.db.threads import database_sync_to_async
+from url_app.clicks import ClickHelper
+from url_app.helpers import resolution_cache
+from url_app.utils import ShortenedURLUtils
+
+
+class RedirectFastPath:
+    """
+    WSGI application mounted in front of Django's handler that answers redirects for
+    live short codes directly: slug lookup, expiry check and `Location` header, nothing else.
+
+    Anything it cannot answer with a redirect (other routes, methods, unknown or expired
+    codes) is handed to the wrapped application, so error responses and their side effects
+    stay with GetShortUrlAPI.
+    """
+
+    PATH_REGEX = re.compile(r'^/([0-9a-zA-Z]+)/?$')
+    METHODS = ("GET", "HEAD")
+    ROUTE = "redirect-long"
+    ## Environ (WSGI) or scope (ASGI) key of the (short code, row) pair looked up by the fast
+    ## path for a request it hands on, so GetShortUrlAPI does not look the code up again.
+    ## Only set for codes that were found: a miss is looked up again by the view.
+    LOOKUP_KEY = "url_app.lookup"
+
+    def __init__(self, application=None) -> None:
+        self.application = application
+
+    @classmethod
+    def short_code(cls, method: str = None, path: str = None) -> str:
+        if method not in cls.METHODS:
+            return None
+
+        match = cls.PATH_REGEX.match(path or "")
+        return match.group(1) if match else None
+
+    @classmethod
+    def lookup(cls, short_code: str = None, sticky: bool = False) -> Tuple[str, datetime]:
+        """
+        ShortenedURLUtils.lookup, on the primary for clients holding a sticky cookie: the fast
+        path runs ahead of ReplicaStickinessMiddleware, so it has to honour the cookie itself.
+        """
+        if not sticky:
+            return ShortenedURLUtils.lookup(short_code=short_code)
+
+        with PrimaryReplicaRouter.use_primary():
+            return ShortenedURLUtils.lookup(short_code=short_code)
+
+    @classmethod
+    def redirect_headers(cls, short_code: str = None, row: Tuple[str, datetime] = None, ip: str = None,
+                         user_agent: str = None) -> List[Tuple[str, str]]:
+        if not row or row[1] <= timezone.now():
+            return None
+
+        ShortenedURLUtils.record_click(
+            short_code=short_code, visitor=ClickHelper.visitor_hash(ip=ip, user_agent=user_agent))
+        return ShortenedURLUtils.get_redirect_headers(short_code=short_code, long_url=row[0], expiry=row[1])
+
+    @classmethod
+    def resolved(cls, request=None) -> Tuple[str, Tuple[str, datetime]]:
+        """
+        The (short code, row) pair the fast path looked up for a request it handed on, if any.
+        """
+        carrier = getattr(request, "scope", None) or request.META
+        return carrier.get(cls.LOOKUP_KEY)
+
+    def get_headers(self, environ: dict = None) -> List[Tuple[str, str]]:
+        short_code = self.short_code(method=environ.get("REQUEST_METHOD"), path=environ.get("PATH_INFO"))
+        if not short_code:
+            return None
+
+        sticky = ReplicaStickinessMiddleware.is_sticky(cookies=parse_cookie(environ.get("HTTP_COOKIE", "")))
+        row = self.lookup(short_code=short_code, sticky=sticky)
+        if row:
+            environ[self.LOOKUP_KEY] = (short_code, row)
+        return self.redirect_headers(short_code=short_code, row=row, ip=environ.get("REMOTE_ADDR"),
+                                     user_agent=environ.get("HTTP_USER_AGENT"))
+
+    @classmethod
+    def record(cls, method: str = None, status_code: int = None, elapsed: float = 0.0) -> None:
+        ## Counted under the route the redirect would otherwise have been served by.
+        metrics.registry.ensure_writer()
+        metrics.request_latency.observe(elapsed, route=cls.ROUTE, method=method)
+        metrics.requests_total.inc(route=cls.ROUTE, method=method, status=status_code)
+        metrics.redirects_total.inc(outcome="redirect")
+
+    def __call__(self, environ: dict, start_response):
+        start = perf_counter()
+        ## Django's handler does this through request_started/request_finished; the fast path
+        ## has to honour CONN_MAX_AGE itself.
+        close_old_connections()
+        try:
+            headers = self.get_headers(environ=environ)
+        finally:
+            close_old_connections()
+
+        if not headers:
+            return self.application(environ, start_response)
+
+        status_code, status_line = ShortenedURLUtils.get_redirect_status()
+        start_response(status_line, headers + [("Content-Length", "0")])
+        self.record(method=environ.get("REQUEST_METHOD"), status_code=status_code, elapsed=perf_counter() - start)
+        return [b""]
+
+
+class AsyncRedirectFastPath:
+    """
+    ASGI counterpart of RedirectFastPath. Cache hits are answered on the event loop;
+    only a cache miss hops to a worker thread (any of the executor's) for the lookup.
+    """
+
+    def __init__(self, application=None) -> None:
+        self.application = application
+        self.lookup = database_sync_to_async(RedirectFastPath.lookup)
+
+    async def resolve(self, scope: dict = None) -> Tuple[str, Tuple[str, datetime]]:
+        """
+        The short code of a redirect request and its (long_url, expiry) row, None for other requests.
+        """
+        if scope["type"] != "http":
+            return None
+
+        short_code = RedirectFastPath.short_code(method=scope.get("method"), path=scope.get("path"))
+        if not short_code:
+            return None
+
+        row = resolution_cache.get(slug=short_code)
+        if not row:
+            cookies = parse_cookie(dict(scope.get("headers") or []).get(b"cookie", b"").decode("latin-1"))
+            row = await self.lookup(short_code=short_code, sticky=ReplicaStickinessMiddleware.is_sticky(cookies=cookies))
+
+        return short_code, row
+
+    async def get_headers(self, scope: dict = None, resolved: Tuple[str, Tuple[str, datetime]] = None
+                          ) -> List[Tuple[str, str]]:
+        if not resolved:
+            return None
+
+        client = scope.get("client") or (None, None)
+        user_agent = dict(scope.get("headers") or []).get(b"user-agent", b"").decode("latin-1")
+        return RedirectFastPath.redirect_headers(short_code=resolved[0], row=resolved[1], ip=client[0],
+                                                 user_agent=user_agent)
+
+    async def __call__(self, scope: dict, receive, send):
+        start = perf_counter()
+        resolved = await self.resolve(scope=scope)
+        headers = await self.get_headers(scope=scope, resolved=resolved)
+        if not headers:
+            if resolved and resolved[1]:
+                scope = dict(scope, **{RedirectFastPath.LOOKUP_KEY: resolved})
+            return await self.application(scope, receive, send)
+
+        status_code, _ = ShortenedURLUtils.get_redirect_status()
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [
+                (header.lower().encode("latin-1"), value.encode("latin-1")) for header, value in headers
+            ] + [(b"content-length", b"0")],
+        })
+        await send({"type": "http.response.body", "body": b""})
+        RedirectFastPath.record(method=scope.get("method"), status_code=status_code, elapsed=perf_counter() - start)
@@ -0,0 +1,497 @@
+import csv
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from io import StringIO
+from datetime import datetime
+from functools import lru_cache
+from hashlib import blake2b, sha256
+from math import ceil, exp, log
+from secrets import randbelow
+from os import getpid
+from threading import Condition, Lock, Thread
+from time import sleep, time
+from typing import Iterable, Iterator, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from uuid import UUID
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.db.routers import PrimaryReplicaRouter
+from core.db.sharding import ShardHelper
+from url_app.constants import ShortCode
+
+from url_app import logger
+
+
+class ShortCodeHelper:
+    """
+    Helpers to generate and validate base62 short codes.
+    """
+
+    @classmethod
+    def encode(cls, number: int = 0) -> str:
+        if number == 0:
+            return ShortCode.ALPHABET[0]
+
+        chars = []
+        while number:
+            number, remainder = divmod(number, ShortCode.BASE)
+            chars.append(ShortCode.ALPHABET[remainder])
+
+        return ''.join(reversed(chars))
+
+    @classmethod
+    def generate(cls) -> str:
+        while True:
+            number = ShortCode.MIN_VALUE + randbelow(ShortCode.MAX_VALUE - ShortCode.MIN_VALUE)
+            short_code = cls.encode(number=number)
+            if short_code not in ShortCode.RESERVED:
+                return short_code
+
+    @classmethod
+    def is_valid(cls, short_code: str = None) -> bool:
+        return bool(short_code) and bool(ShortCode.REGEX.match(short_code)) and short_code not in ShortCode.RESERVED
+
+
+class URLHelper:
+    """
+    Canonical form and content hash of long URLs, used to deduplicate creates.
+    """
+
+    DEFAULT_SCHEME: str = "https"
+    DEFAULT_PORTS = {
+        "http": 80,
+        "https": 443
+    }
+
+    @classmethod
+    @lru_cache(maxsize=settings.URL_NORMALISE_CACHE_SIZE)
+    def normalise(cls, long_url: str = None) -> str:
+        """
+        Lower-case scheme and host, drop default ports, sort query parameters. URLs without
+        a scheme are treated as https, the same way redirects treat them.
+        """
+        long_url = long_url.strip()
+        if "://" not in long_url:
+            long_url = f"{cls.DEFAULT_SCHEME}://{long_url}"
+
+        try:
+            parts = urlsplit(long_url)
+        except ValueError:
+            return long_url
+        scheme = parts.scheme.lower()
+        host = (parts.hostname or "").lower()
+        try:
+            port = parts.port
+        except ValueError:
+            port = None
+        if port and port != cls.DEFAULT_PORTS.get(scheme):
+            host = f"{host}:{port}"
+        if "@" in parts.netloc:
+            host = f"{parts.netloc.rsplit('@', 1)[0]}@{host}"
+
+        query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+
+        return urlunsplit((scheme, host, parts.path or "/", query, parts.fragment))
+
+    @classmethod
+    def hash(cls, long_url: str = None) -> str:
+        return sha256(cls.normalise(long_url=long_url).encode()).hexdigest()
+
+
+class CursorHelper:
+    """
+    Opaque keyset cursors over (created, id), the listing order of ShortenedURL.
+    """
+
+    @classmethod
+    def encode(cls, created: datetime = None, pk=None) -> str:
+        payload = json.dumps({"c": created.isoformat(), "i": str(pk)}, separators=(",", ":"))
+        return urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+    @classmethod
+    def decode(cls, cursor: str = None) -> Tuple[datetime, UUID]:
+        """
+        Return the (created, id) the cursor points at; raises ValueError for anything malformed.
+        """
+        try:
+            payload = json.loads(urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+            created = parse_datetime(payload["c"])
+            pk = UUID(payload["i"])
+        except Exception as ex:
+            raise ValueError(f"Invalid cursor: {ex}")
+
+        if not created:
+            raise ValueError("Invalid cursor.")
+
+        return created, pk
+
+
+class ExportHelper:
+    """
+    Incremental NDJSON/CSV encoding of row dicts, for exports that never hold the full result set.
+    """
+
+    NDJSON: str = "ndjson"
+    CSV: str = "csv"
+    CONTENT_TYPES = {
+        NDJSON: "application/x-ndjson",
+        CSV: "text/csv"
+    }
+
+    @classmethod
+    def to_ndjson(cls, rows: Iterable[dict] = None, batch_size: int = 1000) -> Iterator[str]:
+        lines = []
+        for row in rows:
+            lines.append(json.dumps(row, cls=DjangoJSONEncoder, separators=(",", ":")))
+            if len(lines) >= batch_size:
+                yield "\n".join(lines) + "\n"
+                lines = []
+        if lines:
+            yield "\n".join(lines) + "\n"
+
+    @classmethod
+    def to_csv(cls, rows: Iterable[dict] = None, fields: Iterable[str] = None, batch_size: int = 1000) -> Iterator[str]:
+        buffer = StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+
+        pending = 0
+        for row in rows:
+            writer.writerow({
+                key: value.isoformat() if isinstance(value, datetime) else value for key, value in row.items()
+            })
+            pending += 1
+            if pending >= batch_size:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                pending = 0
+        yield buffer.getvalue()
+
+    @classmethod
+    def stream(cls, rows: Iterable[dict] = None, fmt: str = NDJSON, fields: Iterable[str] = None,
+               batch_size: int = 1000) -> Iterator[str]:
+        if fmt == cls.CSV:
+            return cls.to_csv(rows=rows, fields=fields, batch_size=batch_size)
+        return cls.to_ndjson(rows=rows, batch_size=batch_size)
+
+
+class ResolutionCache:
+    """
+    Bounded, per-worker LRU cache mapping slugs to (long_url, expiry).
+
+    Entries live for at most `ttl` seconds and never outlive the link's own expiry.
+    """
+
+    def __init__(self, max_size: int = None, ttl: int = None) -> None:
+        self.max_size = max_size if max_size is not None else settings.REDIRECT_CACHE_SIZE
+        self.ttl = ttl if ttl is not None else settings.REDIRECT_CACHE_TTL
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = Lock()
+
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def get(self, slug: str = None) -> Tuple[str, datetime]:
+        """
+        Return the cached (long_url, expiry) for the slug, or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(slug)
+            if not entry:
+                self.misses += 1
+                return None
+
+            long_url, expiry, deadline = entry
+            if deadline <= time():
+                del self._entries[slug]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(slug)
+            self.hits += 1
+            return long_url, expiry
+
+    def set(self, slug: str = None, long_url: str = None, expiry: datetime = None) -> None:
+        if self.max_size <= 0 or self.ttl <= 0:
+            return
+
+        deadline = time() + self.ttl
+        if expiry:
+            deadline = min(deadline, expiry.timestamp())
+        if deadline <= time():
+            return
+
+        with self._lock:
+            self._entries[slug] = (long_url, expiry, deadline)
+            self._entries.move_to_end(slug)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, slug: str = None) -> None:
+        with self._lock:
+            self._entries.pop(slug, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxSize": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hitRatio": (self.hits / lookups) if lookups else 0.0
+            }
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter sized for `capacity` items at the given false-positive rate.
+    """
+
+    def __init__(self, capacity: int = 1000, fp_rate: float = 0.001) -> None:
+        self.capacity = max(1, capacity)
+        self.fp_rate = fp_rate
+        self.num_bits = max(8, ceil(-self.capacity * log(fp_rate) / (log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count: int = 0
+
+    def _positions(self, item: str = None) -> Iterable[int]:
+        ## Double hashing: k positions derived from two 64-bit halves of one digest.
+        digest = blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "big")
+        second = int.from_bytes(digest[8:], "big") | 1
+        return ((first + i * second) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, item: str = None) -> None:
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self.bits)
+
+    @property
+    def estimated_fp_rate(self) -> float:
+        return (1 - exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+    def stats(self) -> dict:
+        return {
+            "items": self.count,
+            "capacity": self.capacity,
+            "bits": self.num_bits,
+            "hashes": self.num_hashes,
+            "memoryBytes": self.memory_bytes,
+            "targetFpRate": self.fp_rate,
+            "estimatedFpRate": self.estimated_fp_rate
+        }
+
+
+class SlugFilter:
+    """
+    Per-worker negative cache over the short codes of live links, consulted before any
+    query so that unknown slugs are rejected without touching the database.
+
+    A background thread builds the filter (every slug is treated as possibly present until
+    then), rebuilds it every `rebuild_interval` seconds, which is also what drops expired codes,
+    and adds the codes created by any worker through a delta sync on `created` every
+    `sync_interval` seconds. Codes created by this worker are also added through url_app.signals.
+
+    A code missing from the filter is reported absent while the last sync started at most
+    `max_staleness` seconds ago: a link created on another worker within that window may be
+    rejected. Past it (the maintenance thread is behind), the request runs a sync itself, at
+    most once per `min_sync_gap` seconds per worker; in between, and while another sync is in
+    flight, the code is reported as possibly present and left to the database.
+    """
+
+    ## Margin for clock skew between app servers and for late-committing transactions.
+    SYNC_SKEW = timezone.timedelta(seconds=5)
+    BUILD_CHUNK_SIZE: int = 10000
+
+    def __init__(self, enabled: bool = None, capacity: int = None, fp_rate: float = None,
+                 sync_interval: float = None, rebuild_interval: float = None, max_staleness: float = None,
+                 min_sync_gap: float = None) -> None:
+        self.enabled = enabled if enabled is not None else settings.SLUG_FILTER_ENABLED
+        self.capacity = capacity if capacity is not None else settings.SLUG_FILTER_CAPACITY
+        self.fp_rate = fp_rate if fp_rate is not None else settings.SLUG_FILTER_FP_RATE
+        self.sync_interval = sync_interval if sync_interval is not None else settings.SLUG_FILTER_SYNC_INTERVAL
+        self.rebuild_interval = rebuild_interval if rebuild_interval is not None else settings.SLUG_FILTER_REBUILD_INTERVAL
+        self.max_staleness = max_staleness if max_staleness is not None else settings.SLUG_FILTER_MAX_STALENESS
+        self.min_sync_gap = min_sync_gap if min_sync_gap is not None else settings.SLUG_FILTER_MIN_SYNC_GAP
+
+        self._bloom: BloomFilter = None
+        self._built_at: float = 0
+        ## Wall-clock start of the latest completed build or sync: every code committed before it is in the filter.
+        self._synced_at: float = 0
+        self._synced_since: datetime = None
+        self._sync_ended: float = 0
+        self._syncing = False
+        self._worker_pid: int = None
+        self._lock = Lock()
+        self._condition = Condition(self._lock)
+
+        self.rejections: int = 0
+        self.forced_syncs: int = 0
+
+    def _exclusive(self, task=None) -> None:
+        """
+        Run a build or a sync, never two at once: a sync adding codes to a filter that a
+        concurrent build is about to replace would lose them.
+        """
+        with self._condition:
+            while self._syncing:
+                self._condition.wait()
+            self._syncing = True
+
+        try:
+            task()
+        finally:
+            with self._condition:
+                self._syncing = False
+                self._sync_ended = time()
+                self._condition.notify_all()
+
+    def build(self) -> BloomFilter:
+        """
+        Build a fresh filter over every live short code and swap it in.
+        """
+        from url_app.models import ShortenedURL
+
+        started_at = time()
+        started = timezone.now()
+        querysets = [
+            ShortenedURL.objects.using(shard).filter(expiry__gt=started).values_list("short_code", flat=True)
+            for shard in ShardHelper.databases()
+        ]
+        ## A replica lagging behind would leave fresh codes out, and the filter must never miss a live code.
+        with PrimaryReplicaRouter.use_primary():
+            live = sum(queryset.count() for queryset in querysets)
+            bloom = BloomFilter(capacity=max(self.capacity, 2 * live), fp_rate=self.fp_rate)
+            for queryset in querysets:
+                for short_code in queryset.iterator(chunk_size=self.BUILD_CHUNK_SIZE):
+                    bloom.add(short_code)
+
+        with self._condition:
+            self._bloom = bloom
+            self._built_at = self._synced_at = started_at
+            self._synced_since = started - self.SYNC_SKEW
+            self._condition.notify_all()
+
+        logger.info(f"Slug filter built: {bloom.stats()}")
+        return bloom
+
+    def sync(self) -> None:
+        """
+        Add codes created (by any worker) since the last build/sync.
+        """
+        from url_app.models import ShortenedURL
+
+        started_at = time()
+        started = timezone.now()
+        codes = []
+        with PrimaryReplicaRouter.use_primary():
+            for shard in ShardHelper.databases():
+                codes.extend(ShortenedURL.objects.using(shard).filter(
+                    created__gte=self._synced_since).values_list("short_code", flat=True))
+        with self._condition:
+            for short_code in codes:
+                self._bloom.add(short_code)
+
+            self._synced_at = started_at
+            self._synced_since = started - self.SYNC_SKEW
+            self._condition.notify_all()
+
+    def refresh(self) -> bool:
+        """
+        Sync in this thread, unless a build or sync is in flight or the last one ended less than
+        `min_sync_gap` seconds ago. True when the sync ran and completed; never waits.
+        """
+        with self._condition:
+            if self._syncing or time() - self._sync_ended < self.min_sync_gap:
+                return False
+            self.forced_syncs += 1
+
+        try:
+            self._exclusive(self.sync)
+        except Exception as ex:
+            logger.error(f"Slug filter sync failed: {ex}")
+            return False
+
+        return True
+
+    def _maintain(self) -> None:
+        while True:
+            try:
+                if self._bloom is None or time() - self._built_at > self.rebuild_interval:
+                    self._exclusive(self.build)
+                else:
+                    self._exclusive(self.sync)
+            except Exception as ex:
+                logger.error(f"Slug filter maintenance failed: {ex}")
+            finally:
+                connections.close_all()
+
+            sleep(self.sync_interval)
+
+    def _ensure_maintained(self) -> None:
+        ## Threads do not survive a fork, so every worker process starts its own.
+        if self._worker_pid == getpid():
+            return
+
+        with self._lock:
+            if self._worker_pid == getpid():
+                return
+            self._worker_pid = getpid()
+
+        Thread(target=self._maintain, name="slug-filter-maintenance", daemon=True).start()
+
+    def add(self, short_code: str = None) -> None:
+        ## Bit updates are read-modify-write on a shared byte, so concurrent adds are serialised.
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(short_code)
+
+    def might_contain(self, short_code: str = None) -> bool:
+        if not self.enabled:
+            return True
+
+        self._ensure_maintained()
+        if self._bloom is None or short_code in self._bloom:
+            return True
+
+        if time() - self._synced_at > self.max_staleness and (not self.refresh() or short_code in self._bloom):
+            return True
+
+        self.rejections += 1
+        return False
+
+    def stats(self) -> dict:
+        stats = self._bloom.stats() if self._bloom is not None else {}
+        stats["rejections"] = self.rejections
+        stats["forcedSyncs"] = self.forced_syncs
+        return stats
+
+
+## One cache and one filter per worker process; the cache is filled by ShortenedURLUtils.lookup,
+## and both are kept in step with writes from url_app.signals.
+resolution_cache = ResolutionCache()
+slug_filter = SlugFilter()
@@ -0,0 +1,360 @@
+import csv
+import json
+from io import StringIO
+from os import environ, path, replace
+from time import perf_counter
+from typing import Dict, Iterator, List, Tuple
+from uuid import NAMESPACE_URL, UUID, uuid5
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.db.sharding import ShardHelper
+from url_app.constants import ShortCode
+from url_app.helpers import ExportHelper, ShortCodeHelper, URLHelper
+from url_app.models import ShortCodeClaim, ShortenedURL
+from url_app.utils import ShortenedURLUtils
+from user_app.models import User
+
+from url_app import logger
+
+
+class URLImporter:
+    """
+    Bulk loader for legacy links read from a CSV or NDJSON file.
+
+    Rows are validated in chunks of `chunk_size`, rejected lines being appended to the rejects
+    file. On PostgreSQL each chunk is sent with `COPY ... FROM STDIN` into a temporary staging
+    table and merged with `INSERT ... SELECT ... ON CONFLICT DO NOTHING`; other backends fall
+    back to `bulk_create(ignore_conflicts=True)`. Neither path goes through serializers or `save()`;
+    codes are claimed (see ShortCodeClaim) in the transaction writing their chunk.
+
+    Row ids are derived from (source, line number), so a chunk replayed after a crash
+    merges into the rows it already wrote instead of duplicating them; those rows are counted
+    as `replayed`, not `loaded`. After every committed chunk the line reached is written to the
+    checkpoint file, which `resume` starts from.
+
+    Recognised columns: long_url (required), short_code, assigned_user, expiry, clicks, created.
+    """
+
+    STAGING_TABLE: str = "url_app_import_staging"
+
+    def __init__(self, file_path: str = None, fmt: str = None, source: str = None, chunk_size: int = None,
+                 checkpoint_path: str = None, rejects_path: str = None, default_user: UUID = None,
+                 expiry_mins: int = None, keep_created: bool = False) -> None:
+        self.file_path = file_path
+        self.fmt = fmt or (ExportHelper.CSV if file_path.endswith(".csv") else ExportHelper.NDJSON)
+        self.source = source or path.basename(file_path)
+        self.chunk_size = chunk_size or settings.IMPORT_CHUNK_SIZE
+        self.checkpoint_path = checkpoint_path or f"{file_path}.checkpoint"
+        self.rejects_path = rejects_path or f"{file_path}.rejects"
+        self.default_user = default_user
+        self.expiry_mins = expiry_mins or ShortenedURLUtils.DEFAULT_EXPIRY
+        self.keep_created = keep_created
+
+        self.columns = [field.column for field in ShortenedURL._meta.concrete_fields]
+        self.line: int = 0
+        self.loaded: int = 0
+        self.replayed: int = 0
+        self.duplicates: int = 0
+        self.rejected: int = 0
+        self.rejects: List[dict] = []
+
+    def read_rows(self, start_line: int = 0) -> Iterator[Tuple[int, dict]]:
+        with open(self.file_path, newline="") as source:
+            if self.fmt == ExportHelper.CSV:
+                ## Data lines are numbered from 1, after the header.
+                rows = enumerate(csv.DictReader(source), start=1)
+            else:
+                ## Lines are decoded in validate(), so one malformed line is rejected rather than fatal.
+                rows = ((number, line) for number, line in enumerate(source, start=1) if line.strip())
+
+            for number, row in rows:
+                if number > start_line:
+                    yield number, row
+
+    def parse_moment(self, value: str = None):
+        moment = parse_datetime(value) if isinstance(value, str) else None
+        if not moment:
+            raise ValueError(f"Invalid datetime: {value}")
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment, timezone.utc)
+        return moment
+
+    def validate(self, number: int = 0, row: dict = None, now=None) -> dict:
+        """
+        Column values for one row, or an exception describing why it cannot be imported.
+        """
+        if isinstance(row, str):
+            row = json.loads(row)
+
+        long_url = (row.get("long_url") or "").strip()
+        if not long_url:
+            raise ValueError("long_url is required.")
+
+        short_code = row.get("short_code") or None
+        if short_code and not ShortCodeHelper.is_valid(short_code=short_code):
+            raise ValueError(f"short_code must be {ShortCode.LENGTH} base62 characters.")
+
+        assigned_user = row.get("assigned_user") or row.get("assigned_user_id") or self.default_user
+        assigned_user = UUID(str(assigned_user)) if assigned_user else None
+
+        expiry = row.get("expiry")
+        expiry = self.parse_moment(expiry) if expiry else now + timezone.timedelta(minutes=self.expiry_mins)
+
+        clicks = int(row.get("clicks") or 0)
+        if clicks < 0:
+            raise ValueError("clicks cannot be negative.")
+
+        created = row.get("created")
+        created = self.parse_moment(created) if self.keep_created and created else now
+
+        record_id = uuid5(NAMESPACE_URL, f"{self.source}:{number}")
+        return {
+            "line": number,
+            "id": record_id,
+            "created": created,
+            "updated": now,
+            "long_url": long_url,
+            "url_hash": URLHelper.hash(long_url=long_url),
+            "short_code": short_code or self.generate_code(record_id=record_id),
+            "short_url": None,
+            "assigned_user_id": assigned_user,
+            "expiry": expiry,
+            "clicks": clicks,
+            "legacy_code": bool(short_code)
+        }
+
+    @classmethod
+    def generate_code(cls, record_id: UUID = None) -> str:
+        """
+        A random code placed on the shard owning the row id, so a replayed line goes back to
+        the shard it was first written to (and conflicts on its id there) whatever code it draws.
+        """
+        shard = ShardHelper.for_key(str(record_id))
+        short_code = ShortCodeHelper.generate()
+        while ShardHelper.for_key(short_code) != shard:
+            short_code = ShortCodeHelper.generate()
+
+        return short_code
+
+    def reject(self, number: int = 0, error: str = None) -> None:
+        self.rejected += 1
+        self.rejects.append({"line": number, "error": error})
+
+    def write_rejects(self) -> None:
+        if not self.rejects:
+            return
+
+        with open(self.rejects_path, "a") as rejects:
+            rejects.writelines(f"{json.dumps(reject)}\n" for reject in self.rejects)
+        self.rejects = []
+
+    def prepare(self, chunk: List[Tuple[int, dict]] = None) -> List[dict]:
+        now = timezone.now()
+        records = []
+        for number, row in chunk:
+            try:
+                records.append(self.validate(number=number, row=row, now=now))
+            except Exception as ex:
+                self.reject(number=number, error=f"{ex}")
+
+        ## Unknown users would fail the whole merge on the foreign key, so they are rejected up front.
+        user_ids = {record["assigned_user_id"] for record in records if record["assigned_user_id"]}
+        known = set(User.objects.filter(id__in=user_ids).values_list("id", flat=True)) if user_ids else set()
+        accepted = []
+        for record in records:
+            if record["assigned_user_id"] and record["assigned_user_id"] not in known:
+                self.reject(number=record["line"], error=f"Unknown user {record['assigned_user_id']}.")
+                continue
+
+            record["short_url"] = f"{environ.get('APP_NAME')}/{record['short_code']}"
+            accepted.append(record)
+
+        return accepted
+
+    def copy_records(self, records: List[dict] = None, using: str = None) -> None:
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        for record in records:
+            writer.writerow([
+                value.isoformat() if hasattr(value, "isoformat") else value
+                for value in (record[column] for column in self.columns)
+            ])
+        buffer.seek(0)
+
+        connection = connections[using]
+        table = ShortenedURL._meta.db_table
+        columns = ", ".join(connection.ops.quote_name(column) for column in self.columns)
+        with connection.cursor() as cursor:
+            ## ON COMMIT DELETE ROWS empties the staging table after every chunk.
+            cursor.execute(
+                f"CREATE TEMPORARY TABLE IF NOT EXISTS {self.STAGING_TABLE} "
+                f"(LIKE {connection.ops.quote_name(table)} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+            )
+            cursor.copy_expert(f"COPY {self.STAGING_TABLE} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+            cursor.execute(
+                f"INSERT INTO {connection.ops.quote_name(table)} ({columns}) "
+                f"SELECT {columns} FROM {self.STAGING_TABLE} ON CONFLICT DO NOTHING"
+            )
+
+    def insert_records(self, records: List[dict] = None, using: str = None) -> None:
+        ShortenedURL.objects.using(using).bulk_create(
+            [ShortenedURL(**{column: record[column] for column in self.columns}) for record in records],
+            batch_size=self.chunk_size,
+            ignore_conflicts=True
+        )
+
+    @classmethod
+    def stored(cls, records: List[dict] = None, using: str = None) -> set:
+        """
+        Ids of the records already written to `using`.
+        """
+        return set(
+            ShortenedURL.objects.using(using).filter(
+                id__in=[record["id"] for record in records]).values_list("id", flat=True)
+        )
+
+    def claim(self, records: List[dict] = None, using: str = None) -> List[dict]:
+        """
+        Claim the codes of the records and return those to write. Records whose code is held by
+        another link are left out, as are all but the first of records sharing a code.
+        """
+        held = ShortCodeClaim.held(using=using, codes={record["short_code"] for record in records})
+        accepted = []
+        for record in records:
+            if record["short_code"] in held:
+                continue
+            held[record["short_code"]] = record["id"]
+            accepted.append(record)
+
+        ShortCodeClaim.objects.using(using).bulk_create(
+            [ShortCodeClaim(short_code=record["short_code"], link_id=record["id"]) for record in accepted],
+            batch_size=self.chunk_size
+        )
+        return accepted
+
+    def load(self, records: List[dict] = None) -> int:
+        """
+        Write one chunk, one transaction per shard, and return the number of rows it stored.
+        """
+        present = 0
+        for shard, shard_records in ShardHelper.group(records, key=lambda record: record["short_code"]).items():
+            present += self.load_shard(records=shard_records, using=shard or router.db_for_write(ShortenedURL))
+
+        return present
+
+    def load_shard(self, records: List[dict] = None, using: str = None) -> int:
+        """
+        Write the records owned by one shard in a single transaction. Generated codes that collide
+        are re-rolled (on the same shard); a colliding legacy code is counted as a duplicate.
+        Records already stored, under whatever code they drew then, are counted as replayed.
+        """
+        write = self.copy_records if connections[using].vendor == "postgresql" else self.insert_records
+        present = 0
+        with transaction.atomic(using=using):
+            ## A chunk committed before a crash that kept its checkpoint from being written.
+            replayed = self.stored(records=records, using=using)
+            self.replayed += len(replayed)
+            records = [record for record in records if record["id"] not in replayed]
+            for attempt in range(ShortCode.MAX_ATTEMPTS):
+                if not records:
+                    break
+
+                write(records=self.claim(records=records, using=using), using=using)
+                stored = self.stored(records=records, using=using)
+                present += len(stored)
+
+                records = [record for record in records if record["id"] not in stored]
+                retry = [record for record in records if not record["legacy_code"]]
+                self.duplicates += len(records) - len(retry)
+                if not retry:
+                    break
+
+                for record in retry:
+                    record["short_code"] = self.generate_code(record_id=record["id"])
+                    record["short_url"] = f"{environ.get('APP_NAME')}/{record['short_code']}"
+                records = retry
+            else:
+                self.duplicates += len(records)
+
+        return present
+
+    def read_checkpoint(self) -> Dict[str, int]:
+        if not path.exists(self.checkpoint_path):
+            return {}
+
+        with open(self.checkpoint_path) as checkpoint:
+            state = json.load(checkpoint)
+        if state.get("source") != self.source:
+            raise ValueError(f"Checkpoint {self.checkpoint_path} belongs to source {state.get('source')}.")
+
+        return state
+
+    def write_checkpoint(self) -> None:
+        ## Written to a temporary file and renamed so a crash never leaves a torn checkpoint.
+        temporary = f"{self.checkpoint_path}.tmp"
+        with open(temporary, "w") as checkpoint:
+            json.dump({
+                "source": self.source,
+                "line": self.line,
+                "loaded": self.loaded,
+                "replayed": self.replayed,
+                "duplicates": self.duplicates,
+                "rejected": self.rejected
+            }, checkpoint)
+        replace(temporary, self.checkpoint_path)
+
+    def stats(self, elapsed: float = 0.0, processed: int = 0) -> dict:
+        return {
+            "line": self.line,
+            "loaded": self.loaded,
+            "replayed": self.replayed,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "rowsPerSecond": round(processed / elapsed, 1) if elapsed else 0.0
+        }
+
+    def run(self, resume: bool = False, progress=None) -> dict:
+        """
+        Import the whole file (or the rest of it when resuming), calling `progress(stats)` after every chunk.
+        """
+        if resume:
+            state = self.read_checkpoint()
+            self.line = state.get("line", 0)
+            self.loaded = state.get("loaded", 0)
+            self.replayed = state.get("replayed", 0)
+            self.duplicates = state.get("duplicates", 0)
+            self.rejected = state.get("rejected", 0)
+
+        started = perf_counter()
+        processed = 0
+        chunk = []
+        for number, row in self.read_rows(start_line=self.line):
+            chunk.append((number, row))
+            if len(chunk) < self.chunk_size:
+                continue
+
+            processed += self.process(chunk=chunk)
+            chunk = []
+            if progress:
+                progress(self.stats(elapsed=perf_counter() - started, processed=processed))
+
+        if chunk:
+            processed += self.process(chunk=chunk)
+
+        stats = self.stats(elapsed=perf_counter() - started, processed=processed)
+        logger.info(f"Imported {self.source}: {stats}")
+        return stats
+
+    def process(self, chunk: List[Tuple[int, dict]] = None) -> int:
+        records = self.prepare(chunk=chunk)
+        if records:
+            self.loaded += self.load(records=records)
+
+        self.line = chunk[-1][0]
+        self.write_rejects()
+        self.write_checkpoint()
+        return len(chunk)
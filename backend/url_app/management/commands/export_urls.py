@@ -0,0 +1,55 @@
+import sys
+from uuid import UUID
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from url_app.helpers import ExportHelper
+from url_app.utils import ShortenedURLUtils
+
+
+class Command(BaseCommand):
+    help = "Stream every shortened URL matching the filters as NDJSON or CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=tuple(ExportHelper.CONTENT_TYPES), default=ExportHelper.NDJSON)
+        parser.add_argument("--user", default=None, help="Only links assigned to this user id.")
+        parser.add_argument("--created-from", default=None, help="ISO datetime, inclusive.")
+        parser.add_argument("--created-to", default=None, help="ISO datetime, exclusive.")
+        parser.add_argument("--state", choices=(ShortenedURLUtils.STATE_LIVE, ShortenedURLUtils.STATE_EXPIRED),
+                            default=None)
+        parser.add_argument("--output", default=None, help="File to write to; standard output by default.")
+
+    def parse_moment(self, value: str = None):
+        if not value:
+            return None
+
+        moment = parse_datetime(value)
+        if not moment:
+            raise CommandError(f"Invalid datetime: {value}")
+        return moment
+
+    def handle(self, *args, **options):
+        try:
+            assigned_user = UUID(options["user"]) if options["user"] else None
+        except ValueError:
+            raise CommandError(f"Invalid user id: {options['user']}")
+
+        rows = ShortenedURLUtils.get_export_rows(
+            assigned_user=assigned_user,
+            created_from=self.parse_moment(options["created_from"]),
+            created_to=self.parse_moment(options["created_to"]),
+            state=options["state"]
+        )
+        chunks = ExportHelper.stream(
+            rows=rows, fmt=options["format"], fields=ShortenedURLUtils.EXPORT_FIELDS,
+            batch_size=settings.EXPORT_CHUNK_SIZE)
+
+        output = open(options["output"], "w", newline="") if options["output"] else sys.stdout
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout:
+                output.close()
@@ -0,0 +1,57 @@
+import json
+from uuid import UUID
+
+from django.core.management.base import BaseCommand, CommandError
+
+from url_app.helpers import ExportHelper
+from url_app.imports import URLImporter
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk load links from a CSV or NDJSON file (COPY into a staging table on PostgreSQL), "
+        "checkpointing after every chunk so an interrupted import can be resumed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("file", help="CSV (with a header) or NDJSON file to import.")
+        parser.add_argument("--format", choices=tuple(ExportHelper.CONTENT_TYPES), default=None,
+                            help="Defaults to csv for .csv files and ndjson otherwise.")
+        parser.add_argument("--source", default=None,
+                            help="Stable name of the source, used to derive row ids; defaults to the file name.")
+        parser.add_argument("--chunk-size", type=int, default=None)
+        parser.add_argument("--checkpoint", default=None, help="Defaults to <file>.checkpoint.")
+        parser.add_argument("--rejects", default=None, help="Defaults to <file>.rejects.")
+        parser.add_argument("--resume", action="store_true", help="Continue after the line in the checkpoint.")
+        parser.add_argument("--user", default=None, help="User id for rows without an assigned_user.")
+        parser.add_argument("--expiry-mins", type=int, default=None, help="Lifetime of rows without an expiry.")
+        parser.add_argument("--keep-created", action="store_true",
+                            help="Keep the rows' own created timestamps. Running workers only see such links "
+                                 "in their slug filters after the next rebuild.")
+
+    def handle(self, *args, **options):
+        try:
+            default_user = UUID(options["user"]) if options["user"] else None
+        except ValueError:
+            raise CommandError(f"Invalid user id: {options['user']}")
+
+        importer = URLImporter(
+            file_path=options["file"],
+            fmt=options["format"],
+            source=options["source"],
+            chunk_size=options["chunk_size"],
+            checkpoint_path=options["checkpoint"],
+            rejects_path=options["rejects"],
+            default_user=default_user,
+            expiry_mins=options["expiry_mins"],
+            keep_created=options["keep_created"]
+        )
+        try:
+            stats = importer.run(
+                resume=options["resume"],
+                progress=lambda stats: self.stdout.write(json.dumps(stats))
+            )
+        except (OSError, ValueError) as ex:
+            raise CommandError(f"{ex}")
+
+        self.stdout.write(self.style.SUCCESS(json.dumps(stats)))
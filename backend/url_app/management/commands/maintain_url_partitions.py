@@ -0,0 +1,74 @@
+import json
+from time import sleep
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, router
+from django.utils import timezone
+
+from core.db.sharding import ShardHelper
+from url_app.models import ShortenedURL
+from url_app.partitions import ExpiryPartitions
+from url_app.utils import ShortenedURLUtils
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the coming days' partitions of the ShortenedURL table and detach and drop the expired ones, "
+        "once or on a loop. Does nothing on databases where the table is not partitioned."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--premake-days", type=int, default=settings.URL_PARTITION_PREMAKE_DAYS,
+                            help="Days of partitions to keep ahead of today.")
+        parser.add_argument("--drop-grace-hours", type=int, default=settings.URL_PARTITION_DROP_GRACE_HOURS,
+                            help="Hours after its day ends before a partition is dropped.")
+        parser.add_argument("--dry-run", action="store_true", help="Only list the partitions to create and drop.")
+        parser.add_argument("--check-pruning", action="store_true",
+                            help="Print the partitions scanned by the link queries instead of maintaining.")
+        parser.add_argument("--loop", action="store_true", help="Keep maintaining every --interval seconds.")
+        parser.add_argument("--interval", type=int, default=settings.URL_PARTITION_MAINTENANCE_INTERVAL)
+
+    def queries(self, shard: str = None) -> dict:
+        """
+        The link queries of ShortenedURLUtils and the slug filter, by name.
+        """
+        objs = ShortenedURL.objects.using(shard)
+        return {
+            "sweepExpired": ShortenedURLUtils.expired_links(shard=shard).order_by("expiry").values_list("pk", flat=True),
+            "liveDuplicates": ShortenedURLUtils.live_links(shard=shard).filter(url_hash__in=[""]),
+            "exportLive": objs.filter(expiry__gt=timezone.now()).order_by("created", "id").values("id"),
+            "slugFilterBuild": objs.filter(expiry__gt=timezone.now()).values_list("short_code", flat=True),
+            "lookup": ShortenedURLUtils.lookup_links(shard=shard).filter(short_code="").values_list("long_url", "expiry"),
+        }
+
+    def check_pruning(self, using: str = None) -> dict:
+        total = len(ExpiryPartitions.partitions(using=using)) + 1
+        report = {}
+        for name, queryset in self.queries(shard=using).items():
+            scanned = ExpiryPartitions.scanned_partitions(queryset=queryset)
+            report[name] = {**scanned, "total": total}
+
+        return report
+
+    def handle(self, *args, **options):
+        grace = timezone.timedelta(hours=options["drop_grace_hours"])
+        while True:
+            close_old_connections()
+            results = {}
+            for shard in ShardHelper.databases():
+                using = shard or router.db_for_write(ShortenedURL)
+                if not ExpiryPartitions.is_partitioned(using=using):
+                    self.stderr.write(f"The links table of '{using}' is not partitioned; skipped.")
+                    continue
+
+                if options["check_pruning"]:
+                    results[using] = self.check_pruning(using=using)
+                else:
+                    results[using] = ExpiryPartitions.maintain(
+                        using=using, premake_days=options["premake_days"], grace=grace, dry_run=options["dry_run"])
+            self.stdout.write(json.dumps(results, indent=4))
+
+            if not options["loop"] or options["check_pruning"]:
+                break
+            sleep(options["interval"])
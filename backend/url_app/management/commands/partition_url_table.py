@@ -0,0 +1,45 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections, router
+
+from core.db.sharding import ShardHelper
+from url_app.models import ShortenedURL
+from url_app.partitions import ExpiryPartitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the ShortenedURL table of every PostgreSQL shard as a table partitioned by expiry "
+        "(or, with --undo, as a plain table) while it stays in use, copying the rows in batches. "
+        "Stop `maintain_url_partitions` while it runs and start it once it is done."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--undo", action="store_true", help="Turn a partitioned table back into a plain one.")
+        parser.add_argument("--batch-size", type=int, default=settings.URL_PARTITION_REBUILD_BATCH_SIZE,
+                            help="Rows copied per transaction.")
+        parser.add_argument("--premake-days", type=int, default=settings.URL_PARTITION_PREMAKE_DAYS,
+                            help="Days of partitions to create ahead of today.")
+
+    def handle(self, *args, **options):
+        partitioned = not options["undo"]
+        results = {}
+        for shard in ShardHelper.databases():
+            using = shard or router.db_for_write(ShortenedURL)
+            if connections[using].vendor != "postgresql":
+                self.stderr.write(f"'{using}' is not a PostgreSQL database; skipped.")
+                continue
+            if ExpiryPartitions.is_partitioned(using=using) == partitioned:
+                self.stderr.write(f"The links table of '{using}' is {'already' if partitioned else 'not'} partitioned; skipped.")
+                continue
+
+            def progress(stats: dict, using: str = using) -> None:
+                self.stderr.write(f"'{using}': copied {stats['copied']} rows.")
+
+            results[using] = ExpiryPartitions.rebuild(
+                using=using, partitioned=partitioned, premake_days=options["premake_days"],
+                batch_size=options["batch_size"], progress=progress)
+
+        self.stdout.write(json.dumps(results, indent=4))
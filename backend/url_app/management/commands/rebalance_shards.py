@@ -0,0 +1,25 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from url_app.utils import ShortenedURLUtils
+
+
+class Command(BaseCommand):
+    help = (
+        "Move links to the shard their short code hashes to, e.g. after adding a shard to DB_SHARD_HOSTS. "
+        "Run with DATABASE_SHARD_REBALANCING=True on the workers until it finishes, so links still "
+        "waiting to move keep resolving."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows scanned (and moved) per batch.")
+        parser.add_argument("--dry-run", action="store_true", help="Only count the links that would move.")
+
+    def handle(self, *args, **options):
+        def progress(stats: dict) -> None:
+            self.stderr.write(f"Scanned {stats['scanned']}, misplaced {stats['misplaced']}, moved {stats['moved']}.")
+
+        stats = ShortenedURLUtils.rebalance_shards(
+            batch_size=options["batch_size"], dry_run=options["dry_run"], progress=progress)
+        self.stdout.write(json.dumps(stats, indent=4))
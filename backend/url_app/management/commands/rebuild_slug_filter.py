@@ -0,0 +1,16 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from url_app.helpers import slug_filter
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the slug Bloom filter over all live short codes and report its memory footprint. "
+        "Running workers rebuild their own filters every SLUG_FILTER_REBUILD_INTERVAL seconds."
+    )
+
+    def handle(self, *args, **options):
+        bloom = slug_filter.build()
+        self.stdout.write(json.dumps(bloom.stats(), indent=4))
@@ -0,0 +1,68 @@
+import json
+from os import path
+from tempfile import gettempdir
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from user_app.benchmarks import LoginBenchmark
+from url_app.benchmarks import ApiBenchmark, AsgiBenchmark, BenchmarkHelper, RedirectBenchmark, SerializerBenchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the redirect, create, listing, login and serialization hot paths against a throwaway "
+        "test database (SQLite or PostgreSQL, whichever is configured) and print the results as JSON."
+    )
+
+    SUITES = ("api", "login", "fastpath", "asgi", "serializers")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=1000)
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument("--links", type=int, default=10000, help="Links seeded for the api suite.")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed for picking redirect slugs.")
+        parser.add_argument("--suites", nargs="+", choices=self.SUITES, default=list(self.SUITES))
+        parser.add_argument("--output", default=None, help="Also write the results to this JSON file.")
+
+    def run_suite(self, suite: str = None, options: dict = None) -> dict:
+        iterations, concurrency = options["iterations"], options["concurrency"]
+        if suite == "api":
+            return ApiBenchmark.run(
+                iterations=iterations, concurrency=concurrency, links=options["links"], seed=options["seed"])
+        if suite == "login":
+            return LoginBenchmark.run(iterations=iterations, concurrency=concurrency)
+        if suite == "fastpath":
+            return RedirectBenchmark.run(iterations=iterations)
+        if suite == "asgi":
+            return AsgiBenchmark.run(iterations=iterations, concurrency=concurrency)
+        return SerializerBenchmark.run(iterations=iterations)
+
+    def handle(self, *args, **options):
+        setup_test_environment(debug=False)
+        old_name = connection.settings_dict["NAME"]
+        test_settings = connection.settings_dict.setdefault("TEST", {})
+        if connection.vendor == "sqlite" and not test_settings.get("NAME"):
+            ## The default in-memory test database uses a shared cache, whose table locks fail
+            ## concurrent writers immediately instead of waiting; a file database waits.
+            test_settings["NAME"] = path.join(gettempdir(), "url_shortener_benchmarks.sqlite3")
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            results = {
+                "environment": BenchmarkHelper.environment(),
+                "parameters": {
+                    key: options[key] for key in ("iterations", "concurrency", "links", "seed", "suites")
+                },
+            }
+            for suite in options["suites"]:
+                results[suite] = self.run_suite(suite=suite, options=options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        output = json.dumps(results, indent=4)
+        if options["output"]:
+            with open(options["output"], "w") as results_file:
+                results_file.write(output)
+        self.stdout.write(output)
@@ -0,0 +1,29 @@
+from time import sleep
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from url_app.utils import ShortenedURLUtils
+
+
+class Command(BaseCommand):
+    help = "Delete expired shortened URLs in bounded batches, once or on a loop."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=settings.EXPIRY_SWEEP_BATCH_SIZE)
+        parser.add_argument("--max-batches", type=int, default=None,
+                            help="Stop a sweep after this many batches; the rest is left for the next run.")
+        parser.add_argument("--loop", action="store_true", help="Keep sweeping every --interval seconds.")
+        parser.add_argument("--interval", type=int, default=settings.EXPIRY_SWEEP_INTERVAL)
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            deleted = ShortenedURLUtils.sweep_expired(
+                batch_size=options["batch_size"], max_batches=options["max_batches"])
+            self.stdout.write(f"Deleted {deleted} expired links.")
+
+            if not options["loop"]:
+                break
+            sleep(options["interval"])
@@ -0,0 +1,64 @@
+from os import environ
+
+from django.db import migrations, models
+import url_app.helpers
+
+BATCH_SIZE = 1000
+
+
+def backfill_short_codes(apps, schema_editor):
+    """
+    Assign short codes to existing rows in batches; every batch is committed on its own,
+    so an interrupted backfill resumes from the rows that are still missing a code.
+    """
+    ShortenedURL = apps.get_model('url_app', 'ShortenedURL')
+    db_alias = schema_editor.connection.alias
+
+    while True:
+        batch = list(
+            ShortenedURL.objects.using(db_alias).filter(short_code__isnull=True).only('id')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+
+        codes = set()
+        while len(codes) < len(batch):
+            codes.add(url_app.helpers.ShortCodeHelper.generate())
+        taken = set(
+            ShortenedURL.objects.using(db_alias).filter(short_code__in=codes).values_list('short_code', flat=True)
+        )
+        while taken:
+            codes -= taken
+            while len(codes) < len(batch):
+                codes.add(url_app.helpers.ShortCodeHelper.generate())
+            taken = set(
+                ShortenedURL.objects.using(db_alias).filter(short_code__in=codes).values_list('short_code', flat=True)
+            )
+
+        for obj, code in zip(batch, codes):
+            obj.short_code = code
+            obj.short_url = f"{environ.get('APP_NAME')}/{code}"
+
+        ShortenedURL.objects.using(db_alias).bulk_update(batch, ('short_code', 'short_url'))
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('url_app', '0002_auto_20230221_0834'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shortenedurl',
+            name='short_code',
+            field=models.CharField(editable=False, max_length=8, null=True),
+        ),
+        migrations.RunPython(backfill_short_codes, migrations.RunPython.noop, atomic=False),
+        migrations.AlterField(
+            model_name='shortenedurl',
+            name='short_code',
+            field=models.CharField(default=url_app.helpers.ShortCodeHelper.generate, editable=False, max_length=8, unique=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.6 on 2026-10-18 08:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('url_app', '0003_shortenedurl_short_code'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shortenedurl',
+            index=models.Index(fields=['created'], name='url_app_sho_created_f93142_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.6 on 2026-10-18 08:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('url_app', '0004_shortenedurl_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shortenedurl',
+            index=models.Index(condition=models.Q(('expiry__isnull', False)), fields=['expiry'], name='url_app_sho_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.6 on 2026-10-18 08:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('url_app', '0005_shortenedurl_expiry_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shortenedurl',
+            name='clicks',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.2.6 on 2026-10-18 08:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('url_app', '0006_shortenedurl_clicks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClickRollup',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, unique=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('granularity', models.CharField(choices=[('minute', 'minute'), ('hour', 'hour'), ('day', 'day')], max_length=8)),
+                ('bucket', models.DateTimeField()),
+                ('clicks', models.PositiveBigIntegerField(default=0)),
+                ('unique_visitors', models.PositiveBigIntegerField(default=0)),
+                ('visitors', models.BinaryField()),
+                ('link', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='url_app.shortenedurl')),
+            ],
+            options={
+                'verbose_name': 'Click Rollup',
+                'verbose_name_plural': 'Click Rollups',
+                'ordering': ('link', 'granularity', '-bucket'),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='clickrollup',
+            constraint=models.UniqueConstraint(fields=('link', 'granularity', 'bucket'), name='url_app_rollup_link_bucket_uniq'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.2.6 on 2026-10-18 08:46
+
+from django.db import migrations, models
+import url_app.helpers
+
+BATCH_SIZE = 1000
+
+
+def backfill_url_hashes(apps, schema_editor):
+    """
+    Hash the long URLs of existing rows in batches; every batch is committed on its own,
+    so an interrupted backfill resumes from the rows that are still missing a hash.
+    """
+    ShortenedURL = apps.get_model('url_app', 'ShortenedURL')
+    db_alias = schema_editor.connection.alias
+
+    while True:
+        batch = list(
+            ShortenedURL.objects.using(db_alias).filter(url_hash__isnull=True).only('id', 'long_url')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+
+        for obj in batch:
+            obj.url_hash = url_app.helpers.URLHelper.hash(long_url=obj.long_url)
+
+        ShortenedURL.objects.using(db_alias).bulk_update(batch, ('url_hash',))
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('url_app', '0007_clickrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shortenedurl',
+            name='url_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(backfill_url_hashes, migrations.RunPython.noop, atomic=False),
+        migrations.AddIndex(
+            model_name='shortenedurl',
+            index=models.Index(fields=['assigned_user', 'url_hash'], name='url_app_sho_assigne_e6b2af_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.6 on 2026-10-18 08:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('url_app', '0008_shortenedurl_url_hash'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='shortenedurl',
+            options={'ordering': ('-created', '-id'), 'verbose_name': 'Shortened URL', 'verbose_name_plural': 'Shortened URLs'},
+        ),
+        migrations.RemoveIndex(
+            model_name='shortenedurl',
+            name='url_app_sho_created_f93142_idx',
+        ),
+        migrations.AddIndex(
+            model_name='shortenedurl',
+            index=models.Index(fields=['created', 'id'], name='url_app_sho_created_86a48a_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.6 on 2026-10-18 09:04
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('url_app', '0009_shortenedurl_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='shortenedurl',
+            name='assigned_user',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
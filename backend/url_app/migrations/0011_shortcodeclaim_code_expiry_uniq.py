@@ -0,0 +1,105 @@
+# Generated by Django 3.2.6 on 2026-10-18 11:20
+
+from django.db import migrations, models, transaction
+import django.db.models.deletion
+import url_app.helpers
+import uuid
+
+BATCH_SIZE = 1000
+CODE_EXPIRY_CONSTRAINT = 'url_app_shortenedurl_code_expiry_uniq'
+
+
+def backfill_claims(apps, schema_editor):
+    """
+    Claim the codes of existing links in primary key batches, each committed on its own, so
+    an interrupted backfill picks up from the links still unclaimed.
+    """
+    ShortenedURL = apps.get_model('url_app', 'ShortenedURL')
+    ShortCodeClaim = apps.get_model('url_app', 'ShortCodeClaim')
+    db_alias = schema_editor.connection.alias
+
+    last_pk = None
+    while True:
+        objs = ShortenedURL.objects.using(db_alias).order_by('pk')
+        if last_pk:
+            objs = objs.filter(pk__gt=last_pk)
+        batch = list(objs.values_list('pk', 'short_code')[:BATCH_SIZE])
+        if not batch:
+            break
+
+        last_pk = batch[-1][0]
+        with transaction.atomic(using=db_alias):
+            ShortCodeClaim.objects.using(db_alias).bulk_create(
+                [ShortCodeClaim(short_code=short_code, link_id=pk) for pk, short_code in batch], ignore_conflicts=True)
+
+
+def add_code_expiry_constraint(apps, schema_editor):
+    """
+    On PostgreSQL the constraint's index is built with CREATE INDEX CONCURRENTLY and then
+    attached, so writes to the links table are not blocked while it is built.
+    """
+    table = schema_editor.quote_name(apps.get_model('url_app', 'ShortenedURL')._meta.db_table)
+    if schema_editor.connection.vendor != 'postgresql':
+        schema_editor.execute(f"CREATE UNIQUE INDEX {CODE_EXPIRY_CONSTRAINT} ON {table} (short_code, expiry)")
+        return
+
+    schema_editor.execute(
+        f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {CODE_EXPIRY_CONSTRAINT} ON {table} (short_code, expiry)")
+    schema_editor.execute(
+        f"ALTER TABLE {table} ADD CONSTRAINT {CODE_EXPIRY_CONSTRAINT} UNIQUE USING INDEX {CODE_EXPIRY_CONSTRAINT}")
+
+
+def remove_code_expiry_constraint(apps, schema_editor):
+    schema_editor.remove_constraint(
+        apps.get_model('url_app', 'ShortenedURL'),
+        models.UniqueConstraint(fields=('short_code', 'expiry'), name=CODE_EXPIRY_CONSTRAINT)
+    )
+
+
+class Migration(migrations.Migration):
+    ## The claims are backfilled in batches and the index built concurrently, outside a transaction.
+    ## The table itself is partitioned afterwards by `manage.py partition_url_table`.
+    atomic = False
+
+    dependencies = [
+        ('url_app', '0010_shortenedurl_assigned_user_no_constraint'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='clickrollup',
+            name='link',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='url_app.shortenedurl'),
+        ),
+        migrations.CreateModel(
+            name='ShortCodeClaim',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, unique=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('short_code', models.CharField(max_length=8, unique=True)),
+                ('link_id', models.UUIDField()),
+            ],
+            options={
+                'verbose_name': 'Short Code Claim',
+                'verbose_name_plural': 'Short Code Claims',
+            },
+        ),
+        migrations.RunPython(backfill_claims, migrations.RunPython.noop, atomic=False),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name='shortenedurl',
+                    constraint=models.UniqueConstraint(fields=('short_code', 'expiry'), name=CODE_EXPIRY_CONSTRAINT),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(add_code_expiry_constraint, remove_code_expiry_constraint, atomic=False),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='shortenedurl',
+            name='short_code',
+            field=models.CharField(default=url_app.helpers.ShortCodeHelper.generate, editable=False, max_length=8),
+        ),
+    ]
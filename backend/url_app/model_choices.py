@@ -0,0 +1,11 @@
+class RollupChoice:
+
+    minute = "minute"
+    hour = "hour"
+    day = "day"
+
+    GRANULARITY_CHOICES = (
+        (minute, minute),
+        (hour, hour),
+        (day, day)
+    )
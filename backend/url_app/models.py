@@ -1,31 +1,134 @@
 from os import environ
-from django.db import models
+from typing import Dict, Iterable
+from uuid import UUID
+
+from django.db import models, router, transaction, IntegrityError
 from django.utils import timezone
 
 from core.boilerplate.template_models import TemplateModel
+from core.db.sharding import ShardHelper
 from user_app.models import User
+from url_app.constants import ShortCode
+from url_app.helpers import ShortCodeHelper, URLHelper
+from url_app.model_choices import RollupChoice
+
 
 class ShortenedURL(TemplateModel):
     long_url = models.TextField()
+    url_hash = models.CharField(max_length=64, blank=True, null=True, editable=False)
+    ## Unique through ShortCodeClaim: a partitioned table can only hold unique constraints including the expiry.
+    short_code = models.CharField(max_length=8, editable=False, default=ShortCodeHelper.generate)
     short_url = models.TextField(blank=True, null=True)
-    assigned_user = models.ForeignKey(User, on_delete=models.CASCADE, blank=True, null=True)
+    ## No FK constraint: with sharding the link and its user can live in different databases.
+    assigned_user = models.ForeignKey(User, on_delete=models.CASCADE, blank=True, null=True, db_constraint=False)
     expiry = models.DateTimeField(blank=True, null=True)
+    clicks = models.PositiveBigIntegerField(default=0, editable=False)
 
     def __str__(self):
-        return f"{self.id}"
+        return f"{self.short_code}"
+
+    def build_short_url(self) -> str:
+        return f"{environ.get('APP_NAME')}/{self.short_code}"
 
     def save(self, *args, **kwargs):
         if not self.expiry:
             self.expiry = timezone.now() + timezone.timedelta(minutes=360)
-        
-        self.short_url = f"{environ.get('APP_NAME')}/{self.id}"
-        super(ShortenedURL, self).save(*args, **kwargs)
+
+        self.short_url = self.build_short_url()
+        self.url_hash = URLHelper.hash(long_url=self.long_url)
+        if not self._state.adding:
+            return super(ShortenedURL, self).save(*args, **kwargs)
+
+        ## The code space is large but random, so retry with a fresh code on the rare collision.
+        for attempt in range(ShortCode.MAX_ATTEMPTS):
+            ## A new link goes to the shard owning its code, whatever database the caller picked.
+            using = ShardHelper.for_key(self.short_code) or kwargs.get("using") or router.db_for_write(ShortenedURL, instance=self)
+            kwargs["using"] = using
+            try:
+                with transaction.atomic(using=using):
+                    ShortCodeClaim.objects.using(using).create(short_code=self.short_code, link_id=self.pk)
+                    return super(ShortenedURL, self).save(*args, **kwargs)
+            except IntegrityError:
+                if attempt + 1 == ShortCode.MAX_ATTEMPTS or not ShortCodeClaim.objects.using(using).filter(short_code=self.short_code).exclude(link_id=self.pk).exists():
+                    raise
+
+                self.short_code = ShortCodeHelper.generate()
+                self.short_url = self.build_short_url()
 
     class Meta:
         verbose_name = "Shortened URL"
         verbose_name_plural = "Shortened URLs"
-        ordering = ("-created",)
+        ordering = ("-created", "-id")
         indexes = (
             models.Index(fields=('id',)),
+            models.Index(fields=('created', 'id')),
+            models.Index(fields=('expiry',), name='url_app_sho_expiry_idx', condition=models.Q(expiry__isnull=False)),
+            models.Index(fields=('assigned_user', 'url_hash')),
         )
+        constraints = (
+            ## Includes the partition key, so PostgreSQL can keep it on the partitioned table; also serves code lookups.
+            models.UniqueConstraint(fields=('short_code', 'expiry'), name='url_app_shortenedurl_code_expiry_uniq'),
+        )
+
+
+class ShortCodeClaim(TemplateModel):
+    """
+    One row per short code in use, held on the link's shard next to it: its unique index keeps
+    codes unique across every partition of the ShortenedURL table. Claims are written in the
+    transaction writing their link and deleted with it (see url_app.signals and ExpiryPartitions).
+    """
+    short_code = models.CharField(max_length=8, unique=True)
+    link_id = models.UUIDField()
+
+    def __str__(self):
+        return f"{self.short_code}"
+
+    @classmethod
+    def held(cls, using: str = None, codes: Iterable[str] = None) -> Dict[str, UUID]:
+        """
+        The ids of the links holding the given codes, by code.
+        """
+        return dict(cls.objects.using(using).filter(short_code__in=list(codes)).values_list("short_code", "link_id"))
 
+    @classmethod
+    def claim(cls, using: str = None, links: Iterable = None, ignore_conflicts: bool = False) -> None:
+        """
+        Claim the codes of links written without save() (bulk_create, imports, shard moves).
+        """
+        cls.objects.using(using).bulk_create(
+            [cls(short_code=link.short_code, link_id=link.pk) for link in links],
+            batch_size=1000, ignore_conflicts=ignore_conflicts
+        )
+
+    @classmethod
+    def release(cls, using: str = None, codes: Iterable[str] = None) -> None:
+        cls.objects.using(using).filter(short_code__in=list(codes)).delete()
+
+    class Meta:
+        verbose_name = "Short Code Claim"
+        verbose_name_plural = "Short Code Claims"
+
+
+class ClickRollup(TemplateModel):
+    """
+    Clicks on a link within one minute/hour/day bucket, maintained incrementally from
+    the click stream. `visitors` holds the HyperLogLog registers of the bucket's visitors.
+    """
+    ## No FK constraint: a partitioned ShortenedURL table has no unique index on `id` alone.
+    link = models.ForeignKey(ShortenedURL, on_delete=models.CASCADE, related_name="rollups", db_constraint=False)
+    granularity = models.CharField(max_length=8, choices=RollupChoice.GRANULARITY_CHOICES)
+    bucket = models.DateTimeField()
+    clicks = models.PositiveBigIntegerField(default=0)
+    unique_visitors = models.PositiveBigIntegerField(default=0)
+    visitors = models.BinaryField()
+
+    def __str__(self):
+        return f"{self.link_id} | {self.granularity} | {self.bucket}"
+
+    class Meta:
+        verbose_name = "Click Rollup"
+        verbose_name_plural = "Click Rollups"
+        ordering = ("link", "granularity", "-bucket")
+        constraints = (
+            models.UniqueConstraint(fields=('link', 'granularity', 'bucket'), name='url_app_rollup_link_bucket_uniq'),
+        )
@@ -0,0 +1,437 @@
+import json
+import re
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from time import time
+from typing import Dict, List, Tuple
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import QuerySet
+
+from url_app import logger
+
+
+class ExpiryPartitions:
+    """
+    Daily range partitioning of the ShortenedURL table on `expiry` (PostgreSQL only).
+
+    A day's partition holds the links expiring within that UTC day, so once the day is over
+    (plus a grace period, never shorter than URL_LOOKUP_EXPIRED_HOURS) the whole partition is
+    detached and dropped instead of its rows being deleted. Rows without a partition of their
+    own (past days, days not created yet) live in the default partition, from which
+    `create_partition` moves them when their day is created.
+
+    The table is switched between layouts by `manage.py partition_url_table` (see `rebuild`), not
+    by a migration. PostgreSQL requires unique constraints of a partitioned table to include the
+    partition key: the primary key becomes (id, expiry), which Django's model state cannot express
+    and never alters; short codes are kept unique across partitions by ShortCodeClaim.
+    """
+
+    TABLE: str = "url_app_shortenedurl"
+    ROLLUP_TABLE: str = "url_app_clickrollup"
+    CLAIM_TABLE: str = "url_app_shortcodeclaim"
+    DEFAULT_PARTITION: str = f"{TABLE}_default"
+    REBUILD_TABLE: str = f"{TABLE}_rebuild"
+    REBUILD_TRIGGER: str = f"{TABLE}_rebuild_sync"
+    PRIMARY_KEY: str = f"{TABLE}_pkey"
+    CODE_EXPIRY_CONSTRAINT: str = f"{TABLE}_code_expiry_uniq"
+    PARTITION_REGEX = re.compile(r'^%s_p(\d{8})$' % TABLE)
+    INDEX_REGEX = re.compile(r'^CREATE (UNIQUE )?INDEX (\S+) ON (?:ONLY )?\S+ (.*)$')
+    ## Matches ShortenedURL.save(), for rows written without an expiry.
+    DEFAULT_EXPIRY_MINUTES: int = 360
+    ## How long the table swap at the end of a rebuild waits for its lock before giving up.
+    SWAP_LOCK_TIMEOUT: str = "5s"
+    ## Links of a dropped partition whose rollups and claims are deleted per transaction.
+    DROP_BATCH_SIZE: int = 10000
+    ## Seconds a process trusts its answer of `is_partitioned`: a rebuild runs in another process.
+    STATE_TTL: float = 60.0
+
+    ## {alias: (partitioned, checked at)}
+    _partitioned: Dict[str, Tuple[bool, float]] = {}
+
+    @classmethod
+    def is_partitioned(cls, using: str = None) -> bool:
+        """
+        Whether the table is partitioned on `using`; looked up at most every STATE_TTL seconds
+        per database and process.
+        """
+        cached = cls._partitioned.get(using)
+        if cached and time() - cached[1] < cls.STATE_TTL:
+            return cached[0]
+
+        connection = connections[using]
+        partitioned = False
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))",
+                    [cls.TABLE]
+                )
+                partitioned = cursor.fetchone()[0]
+        cls._partitioned[using] = (partitioned, time())
+
+        return partitioned
+
+    @classmethod
+    def retention(cls) -> timedelta:
+        """
+        How long expired links are kept: lookups still find them (and answer 403) for this long.
+        """
+        return timedelta(hours=settings.URL_LOOKUP_EXPIRED_HOURS)
+
+    @classmethod
+    def partition_name(cls, day: date = None) -> str:
+        return f"{cls.TABLE}_p{day:%Y%m%d}"
+
+    @classmethod
+    def bounds(cls, day: date = None) -> Tuple[datetime, datetime]:
+        start = datetime(day.year, day.month, day.day, tzinfo=dt_timezone.utc)
+        return start, start + timedelta(days=1)
+
+    @classmethod
+    def today(cls) -> date:
+        return datetime.now(dt_timezone.utc).date()
+
+    @classmethod
+    def index_definitions(cls, cursor=None, table: str = None) -> List[Tuple[str, str]]:
+        """
+        (name, CREATE INDEX statement) of the table's indexes, except those backing constraints.
+        """
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s "
+            "AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass)",
+            [table, table]
+        )
+        return cursor.fetchall()
+
+    @classmethod
+    def rebuild(cls, using: str = None, partitioned: bool = True, premake_days: int = 7, batch_size: int = 10000,
+                progress=None) -> dict:
+        """
+        Rebuild the table as a partitioned one (or back into a plain one) while it stays in use:
+
+        1. give the rows without an expiry one, in batches (partitioning only);
+        2. create the new table under REBUILD_TABLE, with its constraints, indexes and partitions,
+           and a trigger on the current table repeating every write on it;
+        3. copy the rows in primary key batches of `batch_size`, each its own transaction,
+           locking the rows being copied so no concurrent write to them is lost;
+        4. swap the tables in one transaction, the only step taking an exclusive lock.
+
+        An interrupted rebuild leaves the current table in place and starts over when run again.
+        Partition maintenance (`maintain_url_partitions`) must not run meanwhile.
+        """
+        connection = connections[using]
+        stats = {"filledExpiries": 0, "copied": 0, "partitioned": partitioned}
+        if partitioned:
+            stats["filledExpiries"] = cls.fill_expiries(using=using, batch_size=batch_size)
+
+        indexes = cls.prepare_rebuild(using=using, partitioned=partitioned, premake_days=premake_days)
+        last_pk = None
+        while True:
+            with transaction.atomic(using=using), connection.cursor() as cursor:
+                cursor.execute(
+                    f"SELECT id FROM {cls.TABLE} {'WHERE id > %s' if last_pk else ''} ORDER BY id LIMIT %s",
+                    [last_pk, batch_size] if last_pk else [batch_size]
+                )
+                pks = [row[0] for row in cursor.fetchall()]
+                if not pks:
+                    break
+
+                ## Written rows were already repeated by the trigger, so conflicts are skipped.
+                cursor.execute(
+                    f"INSERT INTO {cls.REBUILD_TABLE} SELECT * FROM "
+                    f"(SELECT * FROM {cls.TABLE} WHERE id = ANY(%s) FOR SHARE) AS batch ON CONFLICT DO NOTHING",
+                    [pks]
+                )
+            last_pk = pks[-1]
+            stats["copied"] += len(pks)
+            if progress:
+                progress(stats)
+
+        cls.swap(using=using, indexes=indexes)
+        logger.info(f"Rebuilt the links table of '{using}': {stats}")
+        return stats
+
+    @classmethod
+    def fill_expiries(cls, using: str = None, batch_size: int = 10000) -> int:
+        """
+        Give the rows without an expiry the one save() would have, `batch_size` rows per transaction.
+        """
+        filled = 0
+        while True:
+            with transaction.atomic(using=using), connections[using].cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE {cls.TABLE} SET expiry = created + interval '{cls.DEFAULT_EXPIRY_MINUTES} minutes' "
+                    f"WHERE id IN (SELECT id FROM {cls.TABLE} WHERE expiry IS NULL LIMIT %s)",
+                    [batch_size]
+                )
+                count = cursor.rowcount
+            if not count:
+                return filled
+            filled += count
+
+    @classmethod
+    def prepare_rebuild(cls, using: str = None, partitioned: bool = True, premake_days: int = 7) -> List[Tuple[str, str]]:
+        """
+        Step 2 of `rebuild`; returns the (temporary, final) names of the indexes of the new table.
+        """
+        renames = []
+        with transaction.atomic(using=using), connections[using].cursor() as cursor:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {cls.REBUILD_TRIGGER} ON {cls.TABLE}")
+            cursor.execute(f"DROP FUNCTION IF EXISTS {cls.REBUILD_TRIGGER}()")
+            cursor.execute(f"DROP TABLE IF EXISTS {cls.REBUILD_TABLE} CASCADE")
+
+            cursor.execute(
+                f"CREATE TABLE {cls.REBUILD_TABLE} (LIKE {cls.TABLE} INCLUDING DEFAULTS)"
+                f"{' PARTITION BY RANGE (expiry)' if partitioned else ''}"
+            )
+            if partitioned:
+                cursor.execute(
+                    f"ALTER TABLE {cls.REBUILD_TABLE} ADD CONSTRAINT {cls.REBUILD_TABLE}_pkey PRIMARY KEY (id, expiry)")
+            else:
+                ## The model's field is nullable; the partition key was not.
+                cursor.execute(f"ALTER TABLE {cls.REBUILD_TABLE} ALTER COLUMN expiry DROP NOT NULL")
+                cursor.execute(f"ALTER TABLE {cls.REBUILD_TABLE} ADD CONSTRAINT {cls.REBUILD_TABLE}_pkey PRIMARY KEY (id)")
+            cursor.execute(
+                f"ALTER TABLE {cls.REBUILD_TABLE} ADD CONSTRAINT {cls.REBUILD_TABLE}_uniq UNIQUE (short_code, expiry)")
+
+            if partitioned:
+                for offset in range(premake_days + 1):
+                    day = cls.today() + timedelta(days=offset)
+                    start, end = cls.bounds(day=day)
+                    cursor.execute(
+                        f"CREATE TABLE {cls.partition_name(day=day)} PARTITION OF {cls.REBUILD_TABLE} "
+                        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+                    )
+                cursor.execute(f"CREATE TABLE {cls.DEFAULT_PARTITION} PARTITION OF {cls.REBUILD_TABLE} DEFAULT")
+
+            ## Built while the table is empty: the copy then fills them without blocking writes.
+            for number, (name, definition) in enumerate(cls.index_definitions(cursor=cursor, table=cls.TABLE)):
+                match = cls.INDEX_REGEX.match(definition)
+                temporary = f"{cls.REBUILD_TABLE}_idx{number}"
+                cursor.execute(f"CREATE {match.group(1) or ''}INDEX {temporary} ON {cls.REBUILD_TABLE} {match.group(3)}")
+                renames.append((temporary, name))
+
+            cursor.execute(f"""
+                CREATE FUNCTION {cls.REBUILD_TRIGGER}() RETURNS trigger LANGUAGE plpgsql AS $$
+                BEGIN
+                    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                        DELETE FROM {cls.REBUILD_TABLE} WHERE id = OLD.id;
+                    END IF;
+                    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                        INSERT INTO {cls.REBUILD_TABLE} SELECT (NEW).* ON CONFLICT DO NOTHING;
+                    END IF;
+                    RETURN NULL;
+                END
+                $$
+            """)
+            cursor.execute(
+                f"CREATE TRIGGER {cls.REBUILD_TRIGGER} AFTER INSERT OR UPDATE OR DELETE ON {cls.TABLE} "
+                f"FOR EACH ROW EXECUTE FUNCTION {cls.REBUILD_TRIGGER}()"
+            )
+
+        return renames
+
+    @classmethod
+    def swap(cls, using: str = None, indexes: List[Tuple[str, str]] = None) -> None:
+        """
+        Step 4 of `rebuild`: replace the table by the rebuilt one and give it the old names.
+        """
+        with transaction.atomic(using=using), connections[using].cursor() as cursor:
+            cursor.execute(f"SET LOCAL lock_timeout = '{cls.SWAP_LOCK_TIMEOUT}'")
+            cursor.execute(f"LOCK TABLE {cls.TABLE} IN ACCESS EXCLUSIVE MODE")
+            ## Also drops the trigger and, for a partitioned table, its partitions.
+            cursor.execute(f"DROP TABLE {cls.TABLE}")
+            cursor.execute(f"DROP FUNCTION {cls.REBUILD_TRIGGER}()")
+            cursor.execute(f"ALTER TABLE {cls.REBUILD_TABLE} RENAME TO {cls.TABLE}")
+            cursor.execute(f"ALTER TABLE {cls.TABLE} RENAME CONSTRAINT {cls.REBUILD_TABLE}_pkey TO {cls.PRIMARY_KEY}")
+            cursor.execute(
+                f"ALTER TABLE {cls.TABLE} RENAME CONSTRAINT {cls.REBUILD_TABLE}_uniq TO {cls.CODE_EXPIRY_CONSTRAINT}")
+            for temporary, name in indexes:
+                cursor.execute(f"ALTER INDEX {temporary} RENAME TO {name}")
+
+        cls._partitioned.pop(using, None)
+
+    @classmethod
+    def partitions(cls, using: str = None) -> Dict[date, str]:
+        """
+        The day partitions currently attached, by day.
+        """
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                "SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                "WHERE pg_inherits.inhparent = %s::regclass",
+                [cls.TABLE]
+            )
+            names = [row[0] for row in cursor.fetchall()]
+
+        days = {}
+        for name in names:
+            match = cls.PARTITION_REGEX.match(name)
+            if match:
+                days[datetime.strptime(match.group(1), "%Y%m%d").date()] = name
+
+        return days
+
+    @classmethod
+    def covered(cls, using: str = None) -> List[Tuple[datetime, datetime]]:
+        """
+        Expiry ranges held by day partitions, consecutive days merged; the rest is in the default partition.
+        """
+        ranges = []
+        for day in sorted(cls.partitions(using=using)):
+            start, end = cls.bounds(day=day)
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((start, end))
+
+        return ranges
+
+    @classmethod
+    def create_partition(cls, using: str = None, day: date = None) -> None:
+        """
+        Create the partition of `day`, moving its rows out of the default partition first:
+        PostgreSQL refuses a new partition while the default one holds rows of its range.
+        """
+        name = cls.partition_name(day=day)
+        start, end = cls.bounds(day=day)
+        with transaction.atomic(using=using), connections[using].cursor() as cursor:
+            cursor.execute(f"CREATE TABLE {name} (LIKE {cls.TABLE} INCLUDING DEFAULTS)")
+            cursor.execute(
+                f"WITH moved AS (DELETE FROM {cls.DEFAULT_PARTITION} WHERE expiry >= %s AND expiry < %s RETURNING *) "
+                f"INSERT INTO {name} SELECT * FROM moved",
+                [start, end]
+            )
+            cursor.execute(
+                f"ALTER TABLE {cls.TABLE} ATTACH PARTITION {name} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            )
+
+    @classmethod
+    def detached(cls, using: str = None) -> List[str]:
+        """
+        Day partitions detached by a drop that did not finish, attached to no table.
+        """
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                "SELECT relname FROM pg_class WHERE relkind = 'r' AND relnamespace = current_schema()::regnamespace "
+                "AND relname LIKE %s AND oid NOT IN (SELECT inhrelid FROM pg_inherits)",
+                [f"{cls.TABLE}_p%"]
+            )
+            return [row[0] for row in cursor.fetchall() if cls.PARTITION_REGEX.match(row[0])]
+
+    @classmethod
+    def drop_partition(cls, using: str = None, name: str = None, batch_size: int = None) -> None:
+        """
+        Detach a partition, then drop it along with the click rollups and code claims of its links.
+
+        Only the detach touches the links table, and it does not depend on the partition's size.
+        The dependent rows are deleted afterwards from the detached table, `batch_size` links per
+        transaction through the rollups' link index and the claims' unique code index.
+        """
+        with transaction.atomic(using=using), connections[using].cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {cls.TABLE} DETACH PARTITION {name}")
+
+        cls.purge_detached(using=using, name=name, batch_size=batch_size)
+
+    @classmethod
+    def purge_detached(cls, using: str = None, name: str = None, batch_size: int = None) -> None:
+        """
+        Delete the dependent rows of a detached partition batch by batch, then drop it. Resumable:
+        `maintain` finishes partitions left detached by an interrupted drop.
+        """
+        batch_size = batch_size or cls.DROP_BATCH_SIZE
+        while True:
+            with transaction.atomic(using=using), connections[using].cursor() as cursor:
+                cursor.execute(f"SELECT id, short_code FROM {name} LIMIT %s", [batch_size])
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+
+                ids, codes = [row[0] for row in rows], [row[1] for row in rows]
+                cursor.execute(f"DELETE FROM {cls.ROLLUP_TABLE} WHERE link_id = ANY(%s)", [ids])
+                cursor.execute(
+                    f"DELETE FROM {cls.CLAIM_TABLE} WHERE short_code = ANY(%s) AND link_id = ANY(%s)", [codes, ids])
+                cursor.execute(f"DELETE FROM {name} WHERE id = ANY(%s)", [ids])
+
+        with transaction.atomic(using=using), connections[using].cursor() as cursor:
+            cursor.execute(f"DROP TABLE {name}")
+
+    @classmethod
+    def maintain(cls, using: str = None, premake_days: int = 7, grace: timedelta = timedelta(0),
+                 dry_run: bool = False) -> dict:
+        """
+        Create the missing partitions up to `premake_days` ahead and drop the ones whose day
+        ended more than `grace` ago, and at least `retention()` ago whatever the grace.
+        """
+        grace = max(grace, cls.retention())
+        existing = cls.partitions(using=using)
+        today = cls.today()
+        missing = [
+            today + timedelta(days=offset) for offset in range(premake_days + 1)
+            if today + timedelta(days=offset) not in existing
+        ]
+        now = datetime.now(dt_timezone.utc)
+        expired = [day for day in sorted(existing) if cls.bounds(day=day)[1] + grace <= now]
+        leftover = cls.detached(using=using)
+
+        if not dry_run:
+            for name in leftover:
+                cls.purge_detached(using=using, name=name)
+            for day in missing:
+                cls.create_partition(using=using, day=day)
+            for day in expired:
+                cls.drop_partition(using=using, name=existing[day])
+
+        stats = {
+            "created": [cls.partition_name(day=day) for day in missing],
+            "dropped": leftover + [existing[day] for day in expired],
+            "dryRun": dry_run
+        }
+        if missing or expired or leftover:
+            logger.info(f"URL partitions on '{using}': {stats}")
+        return stats
+
+    @classmethod
+    def estimated_rows(cls, using: str = None) -> int:
+        """
+        The planner's row estimate of the table: summed over its partitions when partitioned,
+        as the reltuples of a partitioned parent stay -1. None until the table was analysed.
+        """
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                "SELECT SUM(GREATEST(child.reltuples, 0))::bigint, BOOL_AND(child.reltuples < 0) "
+                "FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                "WHERE pg_inherits.inhparent = %s::regclass",
+                [cls.TABLE]
+            )
+            total, unanalysed = cursor.fetchone()
+
+        return None if total is None or unanalysed else total
+
+    @classmethod
+    def scanned_partitions(cls, queryset: QuerySet = None) -> dict:
+        """
+        Partitions the planner keeps for a queryset, read from its EXPLAIN plan; pruned
+        partitions do not appear (or are counted under "Subplans Removed" when pruned at run time).
+        """
+        sql, params = queryset.query.sql_with_params()
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+
+        scanned = set()
+        removed = 0
+        nodes = [plan[0]["Plan"]]
+        while nodes:
+            node = nodes.pop()
+            relation = node.get("Relation Name", "")
+            if relation.startswith(cls.TABLE):
+                scanned.add(relation)
+            removed += node.get("Subplans Removed", 0)
+            nodes.extend(node.get("Plans", []))
+
+        return {"scanned": sorted(scanned), "removedAtRuntime": removed}
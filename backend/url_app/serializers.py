@@ -1,3 +1,9 @@
+from datetime import datetime, tzinfo
+from typing import Iterable, List
+
+from django.conf import settings
+from django.db.models import QuerySet
+from django.utils import timezone
 from rest_framework.serializers import ModelSerializer
 from url_app.models import ShortenedURL
 
@@ -5,4 +11,77 @@ class ShortenedUrlSerializer(ModelSerializer):
 
     class Meta:
         model = ShortenedURL
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+
+class ShortenedUrlReadSerializer:
+    """
+    Read-only counterpart of ShortenedUrlSerializer producing the same dicts from
+    `values_list()` rows or instances, without per-field serializer machinery.
+    """
+
+    FIELDS = (
+        "id", "created", "updated", "long_url", "url_hash", "short_code", "short_url", "expiry", "clicks",
+        "assigned_user"
+    )
+    COLUMNS = (
+        "id", "created", "updated", "long_url", "url_hash", "short_code", "short_url", "expiry", "clicks",
+        "assigned_user_id"
+    )
+    DATETIME_FIELDS = ("created", "updated", "expiry")
+
+    @classmethod
+    def current_timezone(cls) -> tzinfo:
+        return timezone.get_current_timezone() if settings.USE_TZ else None
+
+    @classmethod
+    def format_datetime(cls, value: datetime = None, tz: tzinfo = None) -> str:
+        ## Same as DRF's DateTimeField: current timezone, ISO 8601 with "Z" for UTC.
+        if value is None:
+            return None
+
+        if tz is not None:
+            value = value.astimezone(tz) if value.tzinfo is not None else timezone.make_aware(value, tz)
+        value = value.isoformat()
+        if value.endswith("+00:00"):
+            value = value[:-6] + "Z"
+
+        return value
+
+    @classmethod
+    def from_row(cls, row: tuple = None, tz: tzinfo = None) -> dict:
+        """
+        Serialize one `values_list(*COLUMNS)` row. Pass `tz` (see current_timezone) when
+        serializing many rows, resolving the active timezone is a noticeable share of the cost.
+        """
+        if tz is None:
+            tz = cls.current_timezone()
+
+        pk, created, updated, long_url, url_hash, short_code, short_url, expiry, clicks, assigned_user = row
+        return {
+            "id": str(pk),
+            "created": cls.format_datetime(created, tz),
+            "updated": cls.format_datetime(updated, tz),
+            "long_url": long_url,
+            "url_hash": url_hash,
+            "short_code": short_code,
+            "short_url": short_url,
+            "expiry": cls.format_datetime(expiry, tz),
+            "clicks": clicks,
+            "assigned_user": assigned_user
+        }
+
+    @classmethod
+    def from_instance(cls, obj: ShortenedURL = None, tz: tzinfo = None) -> dict:
+        return cls.from_row(tuple(getattr(obj, column) for column in cls.COLUMNS), tz)
+
+    @classmethod
+    def many(cls, objs: Iterable = None) -> List[dict]:
+        """
+        Serialize a queryset (fetched as tuples) or an iterable of instances.
+        """
+        tz = cls.current_timezone()
+        if isinstance(objs, QuerySet):
+            return [cls.from_row(row, tz) for row in objs.values_list(*cls.COLUMNS)]
+
+        return [cls.from_instance(obj, tz) for obj in objs]
@@ -0,0 +1,31 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from core.db.sharding import ShardHelper
+from url_app.helpers import resolution_cache, slug_filter
+from url_app.models import ShortCodeClaim, ShortenedURL
+from user_app.models import User
+
+
+@receiver(post_save, sender=ShortenedURL)
+def invalidate_on_save(sender, instance: ShortenedURL = None, created: bool = False, *args, **kwargs):
+    resolution_cache.invalidate(slug=instance.short_code)
+    if created:
+        slug_filter.add(short_code=instance.short_code)
+
+
+@receiver(post_delete, sender=ShortenedURL)
+def invalidate_on_delete(sender, instance: ShortenedURL = None, *args, **kwargs):
+    resolution_cache.invalidate(slug=instance.short_code)
+    ShortCodeClaim.objects.using(instance._state.db).filter(short_code=instance.short_code, link_id=instance.pk).delete()
+
+
+@receiver(post_delete, sender=User)
+def delete_links_on_other_shards(sender, instance: User = None, *args, **kwargs):
+    ## The cascade only reaches links in the user's own database.
+    if not ShardHelper.sharded():
+        return
+
+    for shard in ShardHelper.databases():
+        if shard != instance._state.db:
+            ShortenedURL.objects.using(shard).filter(assigned_user_id=instance.pk).delete()
@@ -1,3 +1,1485 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+from datetime import datetime
+from io import StringIO
+from os import path
+from tempfile import TemporaryDirectory
+from time import time
+from unittest import mock, skipUnless
+from uuid import uuid4
 
-# Create your tests here.
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connection, connections, router
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date, parse_http_date
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from core import metrics
+from core.db.routers import ReplicaStickinessMiddleware
+from core.db.sharding import HashRing, ShardHelper, ShardRouter
+from core.wsgi import application
+from url_app.clicks import ClickBuffer
+from url_app.constants import ShortCode
+from url_app.fastpath import AsyncRedirectFastPath, RedirectFastPath
+from url_app.helpers import (
+    BloomFilter, CursorHelper, ExportHelper, ResolutionCache, ShortCodeHelper, SlugFilter, URLHelper, resolution_cache, slug_filter
+)
+from url_app.imports import URLImporter
+from url_app.management.commands.maintain_url_partitions import Command as MaintainPartitionsCommand
+from url_app.model_choices import RollupChoice
+from url_app.models import ClickRollup, ShortCodeClaim, ShortenedURL
+from url_app.partitions import ExpiryPartitions
+from url_app.serializers import ShortenedUrlReadSerializer, ShortenedUrlSerializer
+from url_app.utils import ShortenedURLUtils
+from user_app.models import User
+
+SHARD = "shard_1"
+SHARDS = [DEFAULT_DB_ALIAS, SHARD]
+REPLICA = "replica_1"
+
+
+class HashRingTest(SimpleTestCase):
+    keys = [f"key{index}" for index in range(5000)]
+
+    def test_needs_a_node(self):
+        with self.assertRaises(ValueError):
+            HashRing(nodes=[])
+
+    def test_placement_is_stable(self):
+        first, second = HashRing(nodes=SHARDS), HashRing(nodes=SHARDS)
+        self.assertEqual([first.get(key) for key in self.keys], [second.get(key) for key in self.keys])
+
+    def test_a_single_node_owns_every_key(self):
+        self.assertEqual(HashRing(nodes=["only"]).distribution(self.keys), {"only": len(self.keys)})
+
+    def test_keys_are_spread_evenly(self):
+        counts = HashRing(nodes=["a", "b", "c", "d"]).distribution(self.keys)
+        for count in counts.values():
+            self.assertAlmostEqual(count / len(self.keys), 0.25, delta=0.08)
+
+    def test_adding_a_node_only_moves_keys_to_it(self):
+        before, after = HashRing(nodes=["a", "b", "c"]), HashRing(nodes=["a", "b", "c", "d"])
+        moved = [key for key in self.keys if before.get(key) != after.get(key)]
+
+        self.assertTrue(all(after.get(key) == "d" for key in moved))
+        self.assertAlmostEqual(len(moved) / len(self.keys), 0.25, delta=0.08)
+
+
+class ShardRouterTest(SimpleTestCase):
+    """
+    Routing decisions only: no query is run, so the shard alias does not need to exist.
+    """
+
+    @override_settings(DATABASE_SHARDS=[DEFAULT_DB_ALIAS])
+    def test_unsharded_placement_is_left_to_the_routers(self):
+        self.assertIsNone(ShardHelper.for_key("abc123"))
+        self.assertEqual(ShardHelper.databases(), [None])
+        self.assertIsNone(ShardRouter().db_for_write(ShortenedURL, instance=ShortenedURL(short_code="abc123")))
+
+    @override_settings(DATABASE_SHARDS=SHARDS)
+    def test_instances_go_to_the_shard_of_their_code(self):
+        codes = [f"code{index}" for index in range(200)]
+        groups = ShardHelper.group(codes)
+
+        self.assertEqual(set(groups), set(SHARDS))
+        for shard, members in groups.items():
+            for code in members:
+                link = ShortenedURL(short_code=code)
+                self.assertEqual(router.db_for_write(ShortenedURL, instance=link), shard)
+                self.assertEqual(router.db_for_read(ShortenedURL, instance=link), shard)
+
+    @override_settings(DATABASE_SHARDS=SHARDS)
+    def test_queries_without_instances_are_not_routed_to_shards(self):
+        self.assertNotIn(router.db_for_read(ShortenedURL), [SHARD])
+
+    @override_settings(DATABASE_SHARDS=SHARDS)
+    def test_users_of_sharded_links_stay_on_the_primary(self):
+        link = ShortenedURL(short_code=self.code_on(SHARD))
+        self.assertEqual(router.db_for_read(User, instance=link), DEFAULT_DB_ALIAS)
+
+    @override_settings(DATABASE_SHARDS=SHARDS)
+    def test_rollups_have_no_shard_key_of_their_own(self):
+        self.assertIsNone(ShardRouter().db_for_write(ClickRollup, instance=ClickRollup()))
+
+    def test_the_ring_follows_the_shard_settings(self):
+        with override_settings(DATABASE_SHARDS=SHARDS):
+            ring = ShardHelper.ring()
+            self.assertIs(ShardHelper.ring(), ring)
+        with override_settings(DATABASE_SHARDS=SHARDS + ["shard_2"]):
+            self.assertEqual(ShardHelper.ring().nodes, tuple(SHARDS + ["shard_2"]))
+        with override_settings(DATABASE_SHARDS=SHARDS, DATABASE_SHARD_VNODES=16):
+            self.assertEqual((ShardHelper.ring().nodes, ShardHelper.ring().vnodes), (tuple(SHARDS), 16))
+
+    @override_settings(DATABASE_SHARDS=SHARDS)
+    def test_items_are_grouped_by_their_key(self):
+        rows = [(index, f"code{index}") for index in range(50)]
+        groups = ShardHelper.group(rows, key=lambda row: row[1])
+
+        self.assertEqual(sorted(row for members in groups.values() for row in members), rows)
+        for shard, members in groups.items():
+            self.assertEqual({ShardHelper.for_key(row[1]) for row in members}, {shard})
+
+    @override_settings(DATABASE_SHARDS=SHARDS)
+    def test_links_and_users_may_be_related_across_shards(self):
+        link, user = ShortenedURL(short_code=self.code_on(SHARD)), User()
+        link._state.db, user._state.db = SHARD, DEFAULT_DB_ALIAS
+
+        self.assertTrue(ShardRouter().allow_relation(link, user))
+
+    @classmethod
+    def code_on(cls, shard: str = None) -> str:
+        return next(code for code in (f"code{index:03d}" for index in range(1000)) if ShardHelper.for_key(code) == shard)
+
+
+@skipUnless(SHARD in settings.DATABASES, "Needs a shard alias: run the tests with DB_SHARD_HOSTS set.")
+@override_settings(DATABASE_SHARDS=SHARDS)
+class ShardPlacementTest(TransactionTestCase):
+    """
+    Links written and read back on two databases.
+    """
+
+    ## Every alias: reads of unsharded models may go to replicas when some are configured too.
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="owner", email="owner@example.com", password="secret-pass-1")
+        resolution_cache.clear()
+        patcher = mock.patch.object(slug_filter, "enabled", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create(self, count: int = 1):
+        return [
+            ShortenedURLUtils.create_short_url(user=self.user, long_url=f"https://example.com/{index}").data
+            for index in range(count)
+        ]
+
+    def test_links_are_saved_on_the_shard_of_their_code(self):
+        self.create(count=40)
+        stored = {
+            shard: set(ShortenedURL.objects.using(shard).values_list("short_code", flat=True)) for shard in SHARDS
+        }
+
+        self.assertTrue(all(stored.values()), "40 links should land on both shards")
+        for shard, codes in stored.items():
+            self.assertEqual({ShardHelper.for_key(code) for code in codes}, {shard})
+            self.assertEqual(set(ShortCodeClaim.objects.using(shard).values_list("short_code", flat=True)), codes)
+
+    def test_lookups_read_the_owning_shard(self):
+        for shard in SHARDS:
+            link = ShortenedURL(short_code=ShardRouterTest.code_on(shard), long_url="https://example.com/", assigned_user=self.user)
+            link.save()
+
+            self.assertEqual(link._state.db, shard)
+            self.assertEqual(ShortenedURLUtils.lookup(short_code=link.short_code)[0], "https://example.com/")
+
+    def test_bulk_created_links_are_split_by_shard(self):
+        resp = ShortenedURLUtils.bulk_create_short_urls(
+            user=self.user, items=[{"long_url": f"https://example.com/bulk/{index}"} for index in range(40)])
+        self.assertEqual(resp.status_code, 201, resp.message)
+
+        for shard in SHARDS:
+            codes = ShortenedURL.objects.using(shard).values_list("short_code", flat=True)
+            self.assertTrue(codes)
+            self.assertEqual({ShardHelper.for_key(code) for code in codes}, {shard})
+
+    def test_rebalancing_moves_links_to_an_added_shard(self):
+        with override_settings(DATABASE_SHARDS=[DEFAULT_DB_ALIAS]):
+            self.create(count=40)
+        self.assertEqual(ShortenedURL.objects.using(SHARD).count(), 0)
+
+        expected = ShardHelper.group(ShortenedURL.objects.using(DEFAULT_DB_ALIAS).values_list("short_code", flat=True))
+        stats = ShortenedURLUtils.rebalance_shards(batch_size=7)
+
+        ## Moved links are scanned again on the shard they were moved to.
+        self.assertEqual(stats["scanned"], 40 + stats["moved"])
+        self.assertEqual(stats["moved"], len(expected[SHARD]))
+        for shard in SHARDS:
+            self.assertEqual(set(ShortenedURL.objects.using(shard).values_list("short_code", flat=True)), set(expected[shard]))
+        self.assertEqual(ShortCodeClaim.objects.using(SHARD).count(), stats["moved"])
+        self.assertEqual(ShortenedURLUtils.rebalance_shards()["misplaced"], 0)
+
+    def test_listing_merges_the_shards_newest_first(self):
+        self.create(count=20)
+        admin = User.objects.create_user(
+            username="lister", email="lister@example.com", phone="9000000004", password="secret-pass-1", is_staff=True)
+
+        codes, cursor = [], None
+        while True:
+            data = ShortenedURLUtils.get_all_urls(cursor=cursor, limit=3, count=ShortenedURLUtils.COUNT_EXACT, user=admin).data
+            codes.extend(row["short_code"] for row in data["results"])
+            self.assertEqual(data["total"], 20)
+            cursor = data["nextCursor"]
+            if not cursor:
+                break
+
+        links = [link for shard in SHARDS for link in ShortenedURL.objects.using(shard).values_list("created", "id", "short_code")]
+        self.assertEqual(codes, [code for _, _, code in sorted(links, reverse=True)])
+
+    def test_exports_merge_the_shards_oldest_first(self):
+        self.create(count=20)
+        rows = list(ShortenedURLUtils.get_export_rows())
+
+        self.assertEqual(len(rows), 20)
+        self.assertEqual(rows, sorted(rows, key=lambda row: (row["created"], row["id"])))
+
+    def test_duplicates_are_found_on_any_shard(self):
+        for shard in SHARDS:
+            long_url = f"https://example.com/{shard}"
+            link = ShortenedURL(short_code=ShardRouterTest.code_on(shard), long_url=long_url, assigned_user=self.user)
+            link.save()
+
+            resp = ShortenedURLUtils.create_short_url(user=self.user, long_url=long_url)
+            self.assertEqual((resp.status_code, resp.data["short_code"]), (200, link.short_code))
+
+    @override_settings(DATABASE_SHARD_REBALANCING=True)
+    def test_misplaced_links_resolve_while_rebalancing(self):
+        short_code = ShardRouterTest.code_on(SHARD)
+        with override_settings(DATABASE_SHARDS=[DEFAULT_DB_ALIAS]):
+            ShortenedURL(short_code=short_code, long_url="https://example.com/moved", assigned_user=self.user).save()
+
+        self.assertEqual(ShortenedURLUtils.lookup(short_code=short_code)[0], "https://example.com/moved")
+        with override_settings(DATABASE_SHARD_REBALANCING=False):
+            resolution_cache.clear()
+            self.assertIsNone(ShortenedURLUtils.lookup(short_code=short_code))
+
+    def test_deleting_a_user_deletes_their_links_on_every_shard(self):
+        self.create(count=20)
+        self.assertTrue(ShortenedURL.objects.using(SHARD).exists())
+        self.user.delete()
+
+        for shard in SHARDS:
+            self.assertEqual(ShortenedURL.objects.using(shard).count(), 0)
+
+    def test_expired_links_are_swept_on_every_shard(self):
+        self.create(count=20)
+        ShortenedURL.objects.using(SHARD).update(expiry=timezone.now() - timezone.timedelta(days=2))
+        expired = ShortenedURL.objects.using(SHARD).count()
+
+        self.assertEqual(ShortenedURLUtils.sweep_expired(), expired)
+        self.assertEqual(ShortenedURL.objects.using(SHARD).count(), 0)
+        self.assertEqual(ShortCodeClaim.objects.using(SHARD).count(), 0)
+        self.assertEqual(ShortenedURL.objects.using(DEFAULT_DB_ALIAS).count(), 20 - expired)
+
+
+class ResolutionCacheTest(SimpleTestCase):
+    """
+    ResolutionCache with a clock the tests move by hand.
+    """
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("url_app.helpers.time", side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def expiry(self, seconds: float = 0) -> datetime:
+        return datetime.fromtimestamp(self.now + seconds, tz=timezone.utc)
+
+    def test_the_least_recently_used_entry_is_evicted(self):
+        cache = ResolutionCache(max_size=2, ttl=60)
+        cache.set(slug="aaaaaaa", long_url="https://example.com/a")
+        cache.set(slug="bbbbbbb", long_url="https://example.com/b")
+        cache.get(slug="aaaaaaa")
+        cache.set(slug="ccccccc", long_url="https://example.com/c")
+
+        self.assertIsNone(cache.get(slug="bbbbbbb"))
+        self.assertEqual(cache.get(slug="aaaaaaa"), ("https://example.com/a", None))
+        self.assertEqual((cache.stats()["size"], cache.stats()["evictions"]), (2, 1))
+
+    def test_entries_live_for_the_ttl(self):
+        cache = ResolutionCache(max_size=10, ttl=60)
+        cache.set(slug="aaaaaaa", long_url="https://example.com/a")
+
+        self.now += 59
+        self.assertIsNotNone(cache.get(slug="aaaaaaa"))
+        self.now += 2
+        self.assertIsNone(cache.get(slug="aaaaaaa"))
+        self.assertEqual(cache.stats()["size"], 0)
+
+    def test_entries_never_outlive_their_link(self):
+        cache = ResolutionCache(max_size=10, ttl=300)
+        expiry = self.expiry(seconds=10)
+        cache.set(slug="aaaaaaa", long_url="https://example.com/a", expiry=expiry)
+
+        self.assertEqual(cache.get(slug="aaaaaaa"), ("https://example.com/a", expiry))
+        self.now += 11
+        self.assertIsNone(cache.get(slug="aaaaaaa"))
+
+    def test_expired_links_are_not_cached(self):
+        cache = ResolutionCache(max_size=10, ttl=300)
+        cache.set(slug="aaaaaaa", long_url="https://example.com/a", expiry=self.expiry(seconds=-1))
+
+        self.assertEqual(cache.stats()["size"], 0)
+
+    def test_a_zero_size_or_ttl_disables_the_cache(self):
+        for cache in (ResolutionCache(max_size=0, ttl=60), ResolutionCache(max_size=10, ttl=0)):
+            cache.set(slug="aaaaaaa", long_url="https://example.com/a")
+            self.assertIsNone(cache.get(slug="aaaaaaa"))
+
+    def test_stats_count_hits_and_misses(self):
+        cache = ResolutionCache(max_size=10, ttl=60)
+        cache.set(slug="aaaaaaa", long_url="https://example.com/a")
+        cache.get(slug="aaaaaaa")
+        cache.get(slug="aaaaaaa")
+        cache.get(slug="bbbbbbb")
+        cache.invalidate(slug="aaaaaaa")
+        cache.get(slug="aaaaaaa")
+
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["size"]), (2, 2, 0))
+        self.assertEqual(stats["hitRatio"], 0.5)
+
+
+@override_settings(DATABASE_SHARDS=[DEFAULT_DB_ALIAS], DATABASE_REPLICAS=[])
+class LookupCacheTest(TestCase):
+    """
+    ShortenedURLUtils.lookup through the process-wide resolution cache.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="cacher", email="cacher@example.com", password="secret-pass-1")
+        resolution_cache.clear()
+        self.addCleanup(resolution_cache.clear)
+        patcher = mock.patch.object(slug_filter, "enabled", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.link = ShortenedURL(long_url="https://example.com/cached", assigned_user=self.user)
+        self.link.save()
+
+    def test_repeated_lookups_are_served_from_the_cache(self):
+        with self.assertNumQueries(1):
+            first = ShortenedURLUtils.lookup(short_code=self.link.short_code)
+        with self.assertNumQueries(0):
+            self.assertEqual(ShortenedURLUtils.lookup(short_code=self.link.short_code), first)
+        self.assertEqual(first[0], self.link.long_url)
+
+    def test_saving_a_link_drops_its_entry(self):
+        ShortenedURLUtils.lookup(short_code=self.link.short_code)
+        self.link.long_url = "https://example.com/changed"
+        self.link.save()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(ShortenedURLUtils.lookup(short_code=self.link.short_code)[0], "https://example.com/changed")
+
+    def test_deleting_a_link_drops_its_entry(self):
+        ShortenedURLUtils.lookup(short_code=self.link.short_code)
+        short_code = self.link.short_code
+        self.link.delete()
+
+        self.assertIsNone(ShortenedURLUtils.lookup(short_code=short_code))
+
+
+class ShortCodeHelperTest(SimpleTestCase):
+
+    def test_generated_codes_are_7_base62_characters(self):
+        for _ in range(500):
+            short_code = ShortCodeHelper.generate()
+            self.assertEqual(len(short_code), ShortCode.LENGTH)
+            self.assertTrue(set(short_code) <= set(ShortCode.ALPHABET))
+            self.assertTrue(ShortCodeHelper.is_valid(short_code=short_code))
+
+    def test_the_code_range_encodes_to_7_characters(self):
+        self.assertEqual(ShortCodeHelper.encode(number=ShortCode.MIN_VALUE), "1000000")
+        self.assertEqual(ShortCodeHelper.encode(number=ShortCode.MAX_VALUE - 1), "ZZZZZZZ")
+        self.assertEqual(ShortCodeHelper.encode(number=0), "0")
+
+    def test_other_slugs_are_invalid(self):
+        for short_code in (None, "", "abc123", "abcd1234", "abc-123", "abc 123", "abcdéfg", "metrics", f"{uuid4()}"):
+            self.assertFalse(ShortCodeHelper.is_valid(short_code=short_code), short_code)
+
+    def test_reserved_codes_are_never_generated(self):
+        with mock.patch("url_app.helpers.randbelow", side_effect=[0, 1]):
+            with mock.patch.object(ShortCode, "RESERVED", frozenset(("1000000",))):
+                self.assertEqual(ShortCodeHelper.generate(), "1000001")
+
+
+@override_settings(DATABASE_SHARDS=[DEFAULT_DB_ALIAS], DATABASE_REPLICAS=[])
+class ShortCodeTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="coder", email="coder@example.com", password="secret-pass-1")
+
+    def test_links_are_addressed_by_their_code(self):
+        link = ShortenedURL(long_url="https://example.com/code", assigned_user=self.user)
+        link.save()
+
+        self.assertTrue(ShortCodeHelper.is_valid(short_code=link.short_code))
+        self.assertTrue(link.short_url.endswith(f"/{link.short_code}"))
+        self.assertTrue(ShortCodeClaim.objects.filter(short_code=link.short_code, link_id=link.pk).exists())
+
+    def test_a_taken_code_is_replaced_on_save(self):
+        taken = ShortenedURL(long_url="https://example.com/first", assigned_user=self.user)
+        taken.save()
+        link = ShortenedURL(long_url="https://example.com/second", assigned_user=self.user, short_code=taken.short_code)
+        link.save()
+
+        self.assertNotEqual(link.short_code, taken.short_code)
+        self.assertTrue(link.short_url.endswith(f"/{link.short_code}"))
+        self.assertEqual(ShortenedURL.objects.count(), 2)
+
+    def test_malformed_slugs_cost_no_query(self):
+        with self.assertNumQueries(0):
+            self.assertIsNone(ShortenedURLUtils.lookup(short_code="not-a-code"))
+            self.assertIsNone(ShortenedURLUtils.lookup(short_code=f"{uuid4()}"))
+
+
+@override_settings(DATABASE_SHARDS=[DEFAULT_DB_ALIAS], DATABASE_REPLICAS=[], REDIRECT_STATUS_CODE=302)
+class RedirectFastPathTest(TestCase):
+    """
+    RedirectFastPath and AsyncRedirectFastPath in front of a stub application recording what
+    it is handed.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="fast", email="fast@example.com", password="secret-pass-1")
+        resolution_cache.clear()
+        self.addCleanup(resolution_cache.clear)
+        for target, name, value in ((slug_filter, "enabled", False), (ShortenedURLUtils, "record_click", mock.DEFAULT)):
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.link = ShortenedURL(long_url="https://example.com/fast", assigned_user=self.user)
+        self.link.save()
+        self.handed = []
+
+    def wsgi(self, environ, start_response):
+        self.handed.append(environ)
+        start_response("404 Not Found", [])
+        return [b""]
+
+    async def asgi(self, scope, receive, send):
+        self.handed.append(scope)
+
+    def get(self, path: str = None, method: str = "GET") -> tuple:
+        environ = RequestFactory().generic(method, path).environ
+        responses = []
+        RedirectFastPath(application=self.wsgi)(environ, lambda status, headers: responses.append((status, dict(headers))))
+        return responses[0]
+
+    def test_live_codes_are_redirected_without_django(self):
+        status_line, headers = self.get(path=f"/{self.link.short_code}/")
+
+        self.assertEqual(status_line, "302 Found")
+        self.assertEqual(headers["Location"], self.link.long_url)
+        self.assertEqual(self.handed, [])
+        ShortenedURLUtils.record_click.assert_called_once()
+
+    def test_unknown_codes_are_handed_to_django(self):
+        status_line, _ = self.get(path="/Missing/")
+
+        self.assertEqual(status_line, "404 Not Found")
+        self.assertEqual(len(self.handed), 1)
+        self.assertNotIn(RedirectFastPath.LOOKUP_KEY, self.handed[0])
+        ShortenedURLUtils.record_click.assert_not_called()
+
+    def test_expired_codes_are_handed_on_with_their_lookup(self):
+        ShortenedURL.objects.filter(pk=self.link.pk).update(expiry=timezone.now() - timezone.timedelta(minutes=1))
+        self.get(path=f"/{self.link.short_code}")
+
+        short_code, row = self.handed[0][RedirectFastPath.LOOKUP_KEY]
+        self.assertEqual((short_code, row[0]), (self.link.short_code, self.link.long_url))
+
+    def test_other_requests_are_handed_on_without_a_lookup(self):
+        for path, method in (("/urls/", "GET"), (f"/{self.link.short_code}/", "POST"), ("/a-b/", "GET")):
+            with self.assertNumQueries(0):
+                self.get(path=path, method=method)
+
+        self.assertEqual(len(self.handed), 3)
+
+    def test_asgi_cache_hits_are_redirected_on_the_event_loop(self):
+        resolution_cache.set(slug=self.link.short_code, long_url=self.link.long_url, expiry=self.link.expiry)
+        application = AsyncRedirectFastPath(application=self.asgi)
+        application.lookup = mock.AsyncMock()
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": "GET", "path": f"/{self.link.short_code}/", "headers": [], "client": ("10.0.0.1", 1)}
+        asyncio.run(application(scope, None, send))
+
+        application.lookup.assert_not_called()
+        self.assertEqual(sent[0]["status"], 302)
+        self.assertIn((b"location", self.link.long_url.encode()), sent[0]["headers"])
+        self.assertEqual(self.handed, [])
+
+    def test_asgi_unknown_codes_are_handed_to_django(self):
+        application = AsyncRedirectFastPath(application=self.asgi)
+        application.lookup = mock.AsyncMock(return_value=None)
+
+        asyncio.run(application({"type": "http", "method": "GET", "path": "/Missing/", "headers": []}, None, None))
+
+        application.lookup.assert_awaited_once()
+        self.assertEqual(len(self.handed), 1)
+        self.assertNotIn(RedirectFastPath.LOOKUP_KEY, self.handed[0])
+
+
+@override_settings(REDIRECT_MAX_AGE=3600, REDIRECT_S_MAXAGE=86400)
+class RedirectHeadersTest(SimpleTestCase):
+    """
+    ShortenedURLUtils.get_redirect_headers with a fixed clock.
+    """
+
+    def setUp(self):
+        self.now = timezone.now().replace(microsecond=0)
+        patcher = mock.patch("url_app.utils.timezone.now", return_value=self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def headers(self, seconds: float = 0, long_url: str = "https://example.com/cached") -> dict:
+        return dict(ShortenedURLUtils.get_redirect_headers(
+            short_code="aaaaaaa", long_url=long_url, expiry=self.now + timezone.timedelta(seconds=seconds)))
+
+    def test_long_lived_links_are_cached_up_to_the_caps(self):
+        headers = self.headers(seconds=7 * 86400)
+
+        self.assertEqual(headers["Location"], "https://example.com/cached")
+        self.assertEqual(headers["Cache-Control"], "public, max-age=3600, s-maxage=86400")
+        self.assertEqual(headers["Expires"], http_date(self.now.timestamp() + 3600))
+
+    def test_links_near_their_expiry_are_cached_until_it(self):
+        headers = self.headers(seconds=90)
+
+        self.assertEqual(headers["Cache-Control"], "public, max-age=90, s-maxage=90")
+        self.assertEqual(headers["Expires"], http_date(self.now.timestamp() + 90))
+
+    def test_between_the_caps_only_shared_caches_are_capped_by_the_expiry(self):
+        self.assertEqual(self.headers(seconds=7200)["Cache-Control"], "public, max-age=3600, s-maxage=7200")
+
+    def test_expired_links_are_not_cached(self):
+        self.assertEqual(self.headers(seconds=-60)["Cache-Control"], "public, max-age=0, s-maxage=0")
+
+    def test_etags_change_with_the_target_and_the_expiry(self):
+        etag = self.headers(seconds=90)["ETag"]
+
+        self.assertEqual(self.headers(seconds=90)["ETag"], etag)
+        self.assertNotEqual(self.headers(seconds=91)["ETag"], etag)
+        self.assertNotEqual(self.headers(seconds=90, long_url="https://example.com/other")["ETag"], etag)
+
+    def test_targets_without_a_scheme_get_https(self):
+        self.assertEqual(self.headers(seconds=90, long_url="example.com/bare")["Location"], "https://example.com/bare")
+
+    def test_redirect_statuses_are_validated(self):
+        for code, line in ((301, "301 Moved Permanently"), (302, "302 Found"), (307, "307 Temporary Redirect"),
+                           (308, "308 Permanent Redirect")):
+            with override_settings(REDIRECT_STATUS_CODE=code):
+                self.assertEqual(ShortenedURLUtils.get_redirect_status(), (code, line))
+
+        with override_settings(REDIRECT_STATUS_CODE=200):
+            with self.assertRaises(ImproperlyConfigured):
+                ShortenedURLUtils.get_redirect_status()
+
+
+@override_settings(DATABASE_SHARDS=[DEFAULT_DB_ALIAS], DATABASE_REPLICAS=[], RATE_LIMIT_ENABLED=False,
+                   REDIRECT_STATUS_CODE=307, REDIRECT_MAX_AGE=3600)
+class RedirectViewTest(TestCase):
+    """
+    GetShortUrlAPI, which answers the redirects the fast path hands on.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="viewer", email="viewer@example.com", password="secret-pass-1")
+        resolution_cache.clear()
+        self.addCleanup(resolution_cache.clear)
+        for target, name, value in ((slug_filter, "enabled", False), (ShortenedURLUtils, "record_click", mock.DEFAULT)):
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def link(self, seconds: float = 0) -> ShortenedURL:
+        link = ShortenedURL(long_url="https://example.com/view", assigned_user=self.user,
+                            expiry=timezone.now() + timezone.timedelta(seconds=seconds))
+        link.save()
+        return link
+
+    def test_links_near_their_expiry_still_redirect(self):
+        link = self.link(seconds=30)
+        response = self.client.get(reverse("redirect-long", kwargs={"slug": link.short_code}))
+
+        self.assertEqual(response.status_code, 307)
+        self.assertEqual(response["Location"], link.long_url)
+        max_age = int(response["Cache-Control"].split("max-age=")[1].split(",")[0])
+        self.assertLessEqual(max_age, 30)
+        self.assertLessEqual(parse_http_date(response["Expires"]), link.expiry.timestamp())
+
+    def test_expired_links_are_not_redirected(self):
+        link = self.link(seconds=-30)
+        response = self.client.get(reverse("redirect-long", kwargs={"slug": link.short_code}))
+
+        self.assertEqual(response.status_code, 403)
+        self.assertNotIn("Location", response)
+        self.assertNotIn("Expires", response)
+
+
+class URLHelperTest(SimpleTestCase):
+
+    def test_equivalent_urls_share_a_canonical_form(self):
+        canonical = "https://example.com/path?a=1&b=2"
+        for long_url in ("https://example.com/path?a=1&b=2", "HTTPS://Example.COM/path?b=2&a=1",
+                         "https://example.com:443/path?a=1&b=2", " example.com/path?b=2&a=1 "):
+            self.assertEqual(URLHelper.normalise(long_url=long_url), canonical, long_url)
+
+    def test_meaningful_differences_are_kept(self):
+        self.assertEqual(URLHelper.normalise(long_url="http://example.com:8080"), "http://example.com:8080/")
+        self.assertEqual(URLHelper.normalise(long_url="http://example.com:443/"), "http://example.com:443/")
+        self.assertEqual(URLHelper.normalise(long_url="https://user@Example.com/#top"), "https://user@example.com/#top")
+        self.assertNotEqual(URLHelper.normalise(long_url="https://example.com/Path"),
+                            URLHelper.normalise(long_url="https://example.com/path"))
+
+    def test_blank_query_values_are_kept(self):
+        self.assertEqual(URLHelper.normalise(long_url="https://example.com/?b=&a=1"), "https://example.com/?a=1&b=")
+
+    def test_hashes_follow_the_canonical_form(self):
+        self.assertEqual(URLHelper.hash(long_url="Example.com/?b=2&a=1"), URLHelper.hash(long_url="https://example.com/?a=1&b=2"))
+        self.assertNotEqual(URLHelper.hash(long_url="https://example.com/a"), URLHelper.hash(long_url="https://example.com/b"))
+        self.assertEqual(len(URLHelper.hash(long_url="https://example.com/")), 64)
+
+    def test_unparseable_urls_are_left_as_they_are(self):
+        self.assertEqual(URLHelper.normalise(long_url="https://[broken/"), "https://[broken/")
+
+
+@override_settings(DATABASE_SHARDS=[DEFAULT_DB_ALIAS], DATABASE_REPLICAS=[])
+class DeduplicationTest(TestCase):
+    """
+    ShortenedURLUtils.create_short_url answering repeated URLs with the user's live link.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="dedup", email="dedup@example.com", password="secret-pass-1")
+
+    def create(self, long_url: str = "https://example.com/page?a=1&b=2", user: User = None):
+        return ShortenedURLUtils.create_short_url(user=user or self.user, long_url=long_url, expiry_mins=60)
+
+    def test_equivalent_urls_reuse_the_live_link(self):
+        first = self.create()
+        second = self.create(long_url="HTTPS://EXAMPLE.com:443/page?b=2&a=1")
+
+        self.assertEqual((first.status_code, second.status_code), (201, 200))
+        self.assertEqual(second.message, "URL already shortened.")
+        self.assertEqual(second.data["short_code"], first.data["short_code"])
+        self.assertEqual(ShortenedURL.objects.count(), 1)
+
+    def test_links_are_not_shared_between_users(self):
+        other = User.objects.create_user(
+            username="other", email="other@example.com", phone="9000000001", password="secret-pass-1")
+        self.create()
+
+        self.assertEqual(self.create(user=other).status_code, 201)
+        self.assertEqual(ShortenedURL.objects.count(), 2)
+
+    def test_expired_links_are_not_reused(self):
+        first = self.create()
+        ShortenedURL.objects.filter(short_code=first.data["short_code"]).update(
+            expiry=timezone.now() - timezone.timedelta(minutes=1))
+
+        second = self.create()
+        self.assertEqual(second.status_code, 201)
+        self.assertNotEqual(second.data["short_code"], first.data["short_code"])
+
+    def test_the_link_expiring_last_is_reused(self):
+        first = self.create()
+        later = ShortenedURL(long_url="https://example.com/page?b=2&a=1", assigned_user=self.user,
+                             expiry=timezone.now() + timezone.timedelta(days=1))
+        later.save()
+
+        self.assertNotEqual(later.short_code, first.data["short_code"])
+        self.assertEqual(self.create().data["short_code"], later.short_code)
+
+
+@override_settings(DATABASE_SHARDS=[DEFAULT_DB_ALIAS], DATABASE_REPLICAS=[], ITEMS_PER_PAGE=50)
+class ListingTest(TestCase):
+    """
+    Keyset pages of ShortenedURLUtils.get_all_urls.
+    """
+
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            username="admin", email="admin@example.com", password="secret-pass-1", is_staff=True)
+        for index in range(7):
+            self.add(index=index)
+
+    def add(self, index: int = 0) -> ShortenedURL:
+        link = ShortenedURL(long_url=f"https://example.com/{index}", assigned_user=self.admin)
+        link.save()
+        return link
+
+    def page(self, cursor: str = None, limit: int = 3, count: str = ShortenedURLUtils.COUNT_NONE):
+        return ShortenedURLUtils.get_all_urls(cursor=cursor, limit=limit, count=count, user=self.admin)
+
+    def walk(self, limit: int = 3) -> list:
+        codes, cursor = [], None
+        while True:
+            data = self.page(cursor=cursor, limit=limit).data
+            codes.extend(row["short_code"] for row in data["results"])
+            cursor = data["nextCursor"]
+            if not cursor:
+                return codes
+
+    def newest_first(self) -> list:
+        return list(ShortenedURL.objects.order_by("-created", "-id").values_list("short_code", flat=True))
+
+    def test_pages_walk_every_link_newest_first(self):
+        self.assertEqual([self.page(limit=limit).data["hits"] for limit in (3, 7, 10)], [3, 7, 7])
+        self.assertIsNone(self.page(limit=7).data["nextCursor"])
+        self.assertEqual(self.walk(), self.newest_first())
+
+    def test_links_sharing_a_timestamp_are_ordered_by_id(self):
+        ShortenedURL.objects.update(created=timezone.now())
+        self.assertEqual(self.walk(limit=2), self.newest_first())
+
+    def test_inserts_while_paging_do_not_shift_later_pages(self):
+        first = self.page()
+        expected = self.page(cursor=first.data["nextCursor"]).data["results"]
+        for index in range(3):
+            self.add(index=100 + index)
+
+        self.assertEqual(self.page(cursor=first.data["nextCursor"]).data["results"], expected)
+
+    def test_deletes_while_paging_do_not_repeat_rows(self):
+        rest = self.walk()[3:]
+        first = self.page()
+        ShortenedURL.objects.filter(short_code=first.data["results"][0]["short_code"]).delete()
+        second = self.page(cursor=first.data["nextCursor"], limit=10).data["results"]
+
+        self.assertEqual([row["short_code"] for row in second], rest)
+
+    @override_settings(ITEMS_PER_PAGE=2)
+    def test_limits_are_capped(self):
+        self.assertEqual(self.page(limit=5).data["hits"], 2)
+        self.assertEqual(self.page(limit=0).data["hits"], 2)
+
+    def test_count_modes(self):
+        self.assertIsNone(self.page(count=ShortenedURLUtils.COUNT_NONE).data["total"])
+        self.assertEqual(self.page(count=ShortenedURLUtils.COUNT_EXACT).data["total"], 7)
+        ## Off PostgreSQL there are no planner statistics to estimate from.
+        self.assertEqual(self.page(count=ShortenedURLUtils.COUNT_APPROX).data["total"], 7)
+        self.assertEqual(self.page(count="all").status_code, 400)
+
+    def test_no_count_is_run_unless_asked_for(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.page()
+        self.assertFalse([query for query in queries if "COUNT(" in query["sql"].upper()])
+
+    def test_malformed_cursors_are_rejected(self):
+        for cursor in ("not-a-cursor", CursorHelper.encode(created=timezone.now(), pk="x")):
+            self.assertEqual(self.page(cursor=cursor).status_code, 400)
+
+    def test_only_admins_list_links(self):
+        user = User.objects.create_user(
+            username="plain", email="plain@example.com", phone="9000000002", password="secret-pass-1")
+        resp = ShortenedURLUtils.get_all_urls(limit=3, user=user)
+
+        self.assertEqual(resp.status_code, 401)
+
+    def test_cursors_round_trip(self):
+        created, pk = timezone.now(), uuid4()
+        self.assertEqual(CursorHelper.decode(cursor=CursorHelper.encode(created=created, pk=pk)), (created, pk))
+
+
+class ExportHelperTest(SimpleTestCase):
+    rows = [{"id": index, "created": datetime(2024, 1, 1, index, tzinfo=timezone.utc)} for index in range(3)]
+
+    def test_ndjson_is_written_in_batches(self):
+        chunks = list(ExportHelper.stream(rows=self.rows, fmt=ExportHelper.NDJSON, batch_size=2))
+
+        self.assertEqual(len(chunks), 2)
+        lines = "".join(chunks).splitlines()
+        self.assertEqual([json.loads(line)["id"] for line in lines], [0, 1, 2])
+        self.assertEqual(json.loads(lines[1])["created"], "2024-01-01T01:00:00Z")
+
+    def test_csv_has_one_header_and_iso_datetimes(self):
+        chunks = list(ExportHelper.stream(rows=self.rows, fmt=ExportHelper.CSV, fields=("id", "created"), batch_size=2))
+
+        self.assertEqual(len(chunks), 2)
+        rows = list(csv.DictReader(StringIO("".join(chunks))))
+        self.assertEqual([row["id"] for row in rows], ["0", "1", "2"])
+        self.assertEqual(rows[1]["created"], "2024-01-01T01:00:00+00:00")
+
+    def test_empty_exports(self):
+        self.assertEqual("".join(ExportHelper.stream(rows=[], fmt=ExportHelper.NDJSON)), "")
+        self.assertEqual("".join(ExportHelper.stream(rows=[], fmt=ExportHelper.CSV, fields=("id",))).strip(), "id")
+
+
+@override_settings(DATABASE_SHARDS=[DEFAULT_DB_ALIAS], DATABASE_REPLICAS=[], RATE_LIMIT_ENABLED=False, EXPORT_CHUNK_SIZE=2)
+class ExportTest(TestCase):
+    """
+    ExportURLsAPI streaming the links matching its filters.
+    """
+
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            username="exporter", email="exporter@example.com", password="secret-pass-1", is_staff=True)
+        self.other = User.objects.create_user(
+            username="owner", email="owner@example.com", phone="9000000003", password="secret-pass-1")
+        self.now = timezone.now()
+        self.links = [
+            self.add(user=self.admin, days=3, expired=False),
+            self.add(user=self.other, days=2, expired=True),
+            self.add(user=self.other, days=1, expired=False),
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def add(self, user: User = None, days: int = 0, expired: bool = False) -> ShortenedURL:
+        link = ShortenedURL(long_url=f"https://example.com/{days}", assigned_user=user,
+                            expiry=self.now + timezone.timedelta(minutes=-5 if expired else 60))
+        link.save()
+        ShortenedURL.objects.filter(pk=link.pk).update(created=self.now - timezone.timedelta(days=days))
+        return link
+
+    def export(self, **params):
+        return self.client.get(reverse("export-urls"), data=params)
+
+    def codes(self, **params) -> list:
+        response = self.export(**params)
+        self.assertEqual(response.status_code, 200)
+        body = b"".join(response.streaming_content).decode()
+        return [json.loads(line)["short_code"] for line in body.splitlines()]
+
+    def test_ndjson_exports_every_link_oldest_first(self):
+        response = self.export()
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertRegex(response["Content-Disposition"], r'^attachment; filename="urls-\d{14}\.ndjson"$')
+        self.assertEqual([row["short_code"] for row in rows], [link.short_code for link in self.links])
+        self.assertEqual(set(rows[0]), set(ShortenedURLUtils.EXPORT_FIELDS))
+        self.assertEqual(rows[0]["assigned_user_id"], f"{self.admin.pk}")
+
+    def test_csv_exports(self):
+        response = self.export(output="csv")
+        rows = list(csv.DictReader(StringIO(b"".join(response.streaming_content).decode())))
+
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertEqual(tuple(rows[0]), ShortenedURLUtils.EXPORT_FIELDS)
+        self.assertEqual([row["short_code"] for row in rows], [link.short_code for link in self.links])
+        self.assertEqual(rows[2]["long_url"], "https://example.com/1")
+
+    def test_filters(self):
+        first, expired, last = (link.short_code for link in self.links)
+
+        self.assertEqual(self.codes(user=f"{self.other.pk}"), [expired, last])
+        self.assertEqual(self.codes(state="live"), [first, last])
+        self.assertEqual(self.codes(state="expired"), [expired])
+        self.assertEqual(self.codes(created_from=(self.now - timezone.timedelta(days=2)).isoformat()), [expired, last])
+        self.assertEqual(self.codes(created_to=(self.now - timezone.timedelta(days=2)).isoformat()), [first])
+        self.assertEqual(self.codes(user=f"{self.other.pk}", state="live"), [last])
+
+    def test_invalid_parameters_are_rejected(self):
+        for params in ({"output": "xml"}, {"state": "all"}, {"user": "not-a-uuid"}):
+            self.assertEqual(self.export(**params).status_code, 400, params)
+
+    def test_only_admins_export(self):
+        self.client.force_authenticate(user=self.other)
+        self.assertEqual(self.export().status_code, 403)
+
+
+@override_settings(DATABASE_SHARDS=[DEFAULT_DB_ALIAS], DATABASE_REPLICAS=[])
+class ReadSerializerTest(TestCase):
+    """
+    ShortenedUrlReadSerializer against the ShortenedUrlSerializer output it replaces on reads,
+    compared as rendered JSON.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="reader", email="reader@example.com", password="secret-pass-1")
+        for index, expiry in enumerate((timezone.now().replace(microsecond=0), timezone.now().replace(microsecond=123456))):
+            ShortenedURL(long_url=f"https://example.com/{index}", assigned_user=self.user, expiry=expiry, clicks=index).save()
+
+    def rendered(self, data) -> list:
+        return json.loads(JSONRenderer().render(data))
+
+    def expected(self) -> list:
+        return self.rendered(ShortenedUrlSerializer(ShortenedURL.objects.all(), many=True).data)
+
+    def test_querysets_serialize_like_the_model_serializer(self):
+        self.assertEqual(self.rendered(ShortenedUrlReadSerializer.many(ShortenedURL.objects.all())), self.expected())
+
+    def test_instances_serialize_like_the_model_serializer(self):
+        objs = list(ShortenedURL.objects.all())
+
+        self.assertEqual(self.rendered(ShortenedUrlReadSerializer.many(objs)), self.expected())
+        self.assertEqual(self.rendered([ShortenedUrlReadSerializer.from_instance(obj) for obj in objs]), self.expected())
+
+    def test_datetimes_follow_the_current_timezone(self):
+        for name in ("UTC", "Asia/Kolkata", "America/New_York"):
+            with timezone.override(name):
+                self.assertEqual(
+                    self.rendered(ShortenedUrlReadSerializer.many(ShortenedURL.objects.all())), self.expected(), name)
+
+    def test_missing_datetimes_stay_null(self):
+        self.assertIsNone(ShortenedUrlReadSerializer.format_datetime(None))
+
+
+@skipUnless(REPLICA in settings.DATABASES, "Needs a replica alias: run the tests with DB_REPLICA_HOSTS set.")
+@override_settings(DATABASE_SHARDS=[DEFAULT_DB_ALIAS], DATABASE_REPLICAS=[REPLICA])
+class RedirectStickinessTest(TransactionTestCase):
+    """
+    Redirects through `core.wsgi.application`, fast path included, with a replica that has
+    not caught up with the link yet.
+    """
+
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="sticky", email="sticky@example.com", password="secret-pass-1")
+        resolution_cache.clear()
+        patcher = mock.patch.object(slug_filter, "enabled", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        lookup_links = ShortenedURLUtils.lookup_links
+
+        def lagging(shard=None):
+            links = lookup_links(shard=shard)
+            return links.none() if router.db_for_read(ShortenedURL) == REPLICA else links
+
+        patcher = mock.patch.object(ShortenedURLUtils, "lookup_links", side_effect=lagging)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.link = ShortenedURL(long_url="https://example.com/sticky", assigned_user=self.user)
+        self.link.save()
+
+    def redirect(self, cookies: dict = None) -> str:
+        ## The status line the whole WSGI stack answers a redirect request with.
+        environ = RequestFactory().get(f"/{self.link.short_code}/").environ
+        environ["HTTP_COOKIE"] = "; ".join(f"{name}={value}" for name, value in (cookies or {}).items())
+        statuses = []
+        body = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+        if hasattr(body, "close"):
+            body.close()
+
+        return statuses[0]
+
+    def sticky_cookie(self) -> str:
+        ## The cookie ReplicaStickinessMiddleware hands a client after a write.
+        response = HttpResponse()
+        response.set_signed_cookie(settings.DB_STICKY_COOKIE, "1", salt=ReplicaStickinessMiddleware.SALT)
+        return response.cookies[settings.DB_STICKY_COOKIE].value
+
+    def test_sticky_clients_read_their_links_from_the_primary(self):
+        self.assertTrue(self.redirect(cookies={settings.DB_STICKY_COOKIE: self.sticky_cookie()}).startswith("30"))
+
+    def test_other_clients_read_the_replica(self):
+        self.assertTrue(self.redirect().startswith("404"))
+
+    def test_forged_cookies_read_the_replica(self):
+        self.assertTrue(self.redirect(cookies={settings.DB_STICKY_COOKIE: "1"}).startswith("404"))
+
+
+class SlugFilterTest(SimpleTestCase):
+    """
+    Answers of a built filter, with the maintenance thread and the sync queries stubbed out.
+    """
+
+    def make(self, max_staleness: float = 60, min_sync_gap: float = 60) -> SlugFilter:
+        slugs = SlugFilter(enabled=True, max_staleness=max_staleness, min_sync_gap=min_sync_gap)
+        slugs._bloom = BloomFilter(capacity=100)
+        slugs._bloom.add("Known01")
+        slugs._synced_at = time()
+        for name, side_effect in (("_ensure_maintained", None), ("sync", lambda: setattr(slugs, "_synced_at", time()))):
+            patcher = mock.patch.object(slugs, name, side_effect=side_effect)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        return slugs
+
+    def test_known_slugs_might_be_present(self):
+        slugs = self.make()
+        self.assertTrue(slugs.might_contain(short_code="Known01"))
+        self.assertEqual(slugs.rejections, 0)
+
+    def test_a_fresh_filter_rejects_without_a_sync(self):
+        slugs = self.make()
+        self.assertFalse(slugs.might_contain(short_code="Missing"))
+
+        slugs.sync.assert_not_called()
+        self.assertEqual((slugs.rejections, slugs.forced_syncs), (1, 0))
+
+    def test_a_stale_filter_is_synced_before_rejecting(self):
+        slugs = self.make()
+        slugs._synced_at = time() - 120
+        self.assertFalse(slugs.might_contain(short_code="Missing"))
+
+        slugs.sync.assert_called_once()
+        self.assertEqual((slugs.rejections, slugs.forced_syncs), (1, 1))
+
+    def test_request_path_syncs_are_throttled(self):
+        slugs = self.make(max_staleness=0)
+        results = [slugs.might_contain(short_code=f"Missin{index}") for index in range(5)]
+
+        ## One sync; the database answers the others until min_sync_gap has passed.
+        self.assertEqual(results, [False, True, True, True, True])
+        self.assertEqual(slugs.sync.call_count, 1)
+
+    def test_no_sync_runs_while_another_is_in_flight(self):
+        slugs = self.make()
+        slugs._synced_at = time() - 120
+        slugs._syncing = True
+
+        self.assertTrue(slugs.might_contain(short_code="Missing"))
+        slugs.sync.assert_not_called()
+
+    def test_a_failed_sync_leaves_the_slug_to_the_database(self):
+        slugs = self.make()
+        slugs._synced_at = time() - 120
+        slugs.sync.side_effect = RuntimeError("database down")
+
+        self.assertTrue(slugs.might_contain(short_code="Missing"))
+        self.assertEqual(slugs.rejections, 0)
+
+
+@override_settings(DATABASE_SHARDS=[DEFAULT_DB_ALIAS], DATABASE_REPLICAS=[])
+class ClickBufferTest(SimpleTestCase):
+    """
+    Failed flushes, with the database writes stubbed out.
+    """
+
+    def setUp(self):
+        self.buffer = ClickBuffer(flush_interval=60, max_size=1000, max_pending=10)
+        patcher = mock.patch.object(self.buffer, "_ensure_flusher")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def record(self, short_code: str = None, minute: int = 0, clicks: int = 1) -> None:
+        with mock.patch("url_app.clicks.timezone.now", return_value=timezone.now().replace(minute=minute)):
+            for visitor in range(clicks):
+                self.buffer.record(short_code=short_code, visitor=visitor)
+
+    def test_failed_flushes_keep_their_clicks(self):
+        self.record(short_code="aaaaaaa", clicks=4)
+        with mock.patch.object(self.buffer, "flush_shard", side_effect=RuntimeError("database down")):
+            self.assertEqual(self.buffer.flush(), 0)
+
+        stats = self.buffer.stats()
+        self.assertEqual((stats["bufferDepth"], stats["failedFlushes"], stats["droppedClicks"]), (4, 1, 0))
+        self.assertGreater(stats["lastFlushSeconds"], 0)
+
+    def test_the_oldest_clicks_are_dropped_past_max_pending(self):
+        self.record(short_code="aaaaaaa", minute=1, clicks=6)
+        self.record(short_code="bbbbbbb", minute=2, clicks=3)
+        self.record(short_code="aaaaaaa", minute=3, clicks=4)
+        with mock.patch.object(self.buffer, "flush_shard", side_effect=RuntimeError("database down")):
+            self.buffer.flush()
+
+        self.assertEqual(self.buffer.stats()["bufferDepth"], 7)
+        self.assertEqual(self.buffer.dropped_clicks, 6)
+        self.assertEqual(sorted(key[1].minute for key in self.buffer._events), [2, 3])
+
+        with mock.patch.object(self.buffer, "flush_shard") as flush_shard:
+            self.assertEqual(self.buffer.flush(), 7)
+        flush_shard.assert_called_once()
+        self.assertEqual(self.buffer.stats()["bufferDepth"], 0)
+
+
+@override_settings(DATABASE_SHARDS=[DEFAULT_DB_ALIAS], DATABASE_REPLICAS=[])
+class ClickFlushTest(TestCase):
+    """
+    Flushes written to the default database.
+    """
+
+    def setUp(self):
+        self.buffer = ClickBuffer(flush_interval=60, max_size=100000)
+        patcher = mock.patch.object(self.buffer, "_ensure_flusher")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        user = User.objects.create_user(username="clicked", email="clicked@example.com", password="secret-pass-1")
+        expiry = timezone.now() + timezone.timedelta(days=1)
+        self.links = ShortenedURL.objects.bulk_create([
+            ShortenedURL(long_url=f"https://example.com/{index}", assigned_user=user, expiry=expiry)
+            for index in range(ClickBuffer.TOTALS_PER_UPDATE * 2 + 1)
+        ])
+
+    def test_totals_are_updated_in_chunks(self):
+        for index, link in enumerate(self.links):
+            for visitor in range(index % 3 + 1):
+                self.buffer.record(short_code=link.short_code, visitor=visitor)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.buffer.flush(), sum(index % 3 + 1 for index in range(len(self.links))))
+
+        updates = [query for query in queries if query["sql"].startswith('UPDATE "url_app_shortenedurl"')]
+        self.assertEqual(len(updates), 3)
+        self.assertEqual(
+            dict(ShortenedURL.objects.values_list("short_code", "clicks")),
+            {link.short_code: index % 3 + 1 for index, link in enumerate(self.links)}
+        )
+
+    def test_flush_durations_are_observed_by_result(self):
+        def count(result: str = None) -> int:
+            samples = dict((tuple(labels), value) for labels, value in metrics.click_flush_seconds.samples())
+            return sum(samples.get((result,), [0])[:-1])
+
+        ok, failed = count("ok"), count("failed")
+        self.buffer.record(short_code=self.links[0].short_code, visitor=1)
+        with mock.patch.object(self.buffer, "flush_shard", side_effect=RuntimeError("database down")):
+            self.buffer.flush()
+        self.buffer.flush()
+
+        self.assertEqual((count("ok"), count("failed")), (ok + 1, failed + 1))
+        self.assertEqual(ShortenedURL.objects.get(pk=self.links[0].pk).clicks, 1)
+
+
+@override_settings(DATABASE_SHARDS=[DEFAULT_DB_ALIAS], DATABASE_REPLICAS=[], RATE_LIMIT_ENABLED=False)
+class BulkCreateTest(TestCase):
+    """
+    BulkCreateShortUrlAPI on the default database alone.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="bulk", email="bulk@example.com", password="secret-pass-1")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def shorten(self, items=None):
+        return self.client.post(reverse("create-short-bulk"), data=items, format="json")
+
+    def test_valid_batches_are_created(self):
+        response = self.shorten(items=[{"long_url": f"https://example.com/{index}"} for index in range(3)])
+        data = response.json()["data"]
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((data["created"], data["existing"], data["failed"]), (3, 0, 0))
+        self.assertEqual(ShortenedURL.objects.filter(assigned_user=self.user).count(), 3)
+        self.assertEqual([result["index"] for result in data["results"]], [0, 1, 2])
+
+    def test_items_can_be_wrapped(self):
+        response = self.shorten(items={"items": [{"long_url": "https://example.com/wrapped"}]})
+        self.assertEqual(response.status_code, 201)
+
+    def test_invalid_items_are_reported_next_to_the_created_ones(self):
+        response = self.shorten(items=[
+            {"long_url": "https://example.com/ok"}, {"long_url": ""}, {"long_url": "https://example.com/x", "expiry_mins": "soon"}
+        ])
+        data = response.json()["data"]
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual((data["created"], data["existing"], data["failed"]), (1, 0, 2))
+        self.assertIn("data", data["results"][0])
+        self.assertEqual([data["results"][index]["error"] for index in (1, 2)], ["Invalid Data", "Invalid Data"])
+
+    def test_batches_without_a_valid_item_are_rejected(self):
+        response = self.shorten(items=[{"long_url": ""}, {"expiry_mins": 5}])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["data"]["failed"], 2)
+        self.assertFalse(ShortenedURL.objects.exists())
+
+    def test_empty_batches_are_rejected(self):
+        self.assertEqual(self.shorten(items=[]).status_code, 400)
+        self.assertEqual(self.shorten(items={"items": "https://example.com"}).status_code, 400)
+
+    @override_settings(BULK_SHORTEN_MAX_ITEMS=2)
+    def test_batches_are_capped(self):
+        items = [{"long_url": f"https://example.com/{index}"} for index in range(3)]
+
+        response = self.shorten(items=items)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["error"], "Batch Too Large")
+        self.assertFalse(ShortenedURL.objects.exists())
+        self.assertEqual(self.shorten(items=items[:2]).status_code, 201)
+
+    def test_live_links_of_the_user_are_reused(self):
+        first = self.shorten(items=[{"long_url": "https://example.com/kept"}]).json()["data"]["results"][0]
+        response = self.shorten(items=[{"long_url": "https://example.com/kept"}, {"long_url": "https://example.com/new"}])
+        data = response.json()["data"]
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((data["created"], data["existing"]), (1, 1))
+        self.assertTrue(data["results"][0]["existing"])
+        self.assertEqual(data["results"][0]["data"], first["data"])
+        self.assertNotIn("existing", data["results"][1])
+        self.assertEqual(ShortenedURL.objects.count(), 2)
+
+    def test_repeats_within_a_batch_share_the_first_result(self):
+        response = self.shorten(items=[{"long_url": "https://example.com/twice"}] * 3)
+        data = response.json()["data"]
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((data["created"], data["existing"], data["failed"]), (1, 0, 0))
+        self.assertEqual([result["index"] for result in data["results"]], [0, 1, 2])
+        for result in data["results"]:
+            self.assertNotIn("existing", result)
+            self.assertEqual(result["data"], data["results"][0]["data"])
+        self.assertEqual(ShortenedURL.objects.count(), 1)
+
+    def test_repeats_of_an_existing_link_are_counted_once(self):
+        self.shorten(items=[{"long_url": "https://example.com/kept"}])
+        data = self.shorten(items=[{"long_url": "https://example.com/kept"}] * 2).json()["data"]
+
+        self.assertEqual((data["created"], data["existing"]), (0, 1))
+        self.assertTrue(data["results"][1]["existing"])
+        self.assertEqual(data["results"][1]["index"], 1)
+
+
+@override_settings(DATABASE_SHARDS=[DEFAULT_DB_ALIAS], DATABASE_REPLICAS=[])
+class URLImporterTest(TestCase):
+    """
+    The bulk_create fallback used off PostgreSQL, on the default database alone.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="importer", email="importer@example.com", password="secret-pass-1")
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.file_path = path.join(directory.name, "links.csv")
+        self.rows = [{"long_url": f"https://example.com/{index}", "short_code": "", "clicks": index} for index in range(10)]
+
+    def write(self, rows: list = None) -> None:
+        with open(self.file_path, "w", newline="") as target:
+            writer = csv.DictWriter(target, fieldnames=["long_url", "short_code", "clicks"])
+            writer.writeheader()
+            writer.writerows(rows)
+
+    def importer(self, **kwargs) -> URLImporter:
+        return URLImporter(file_path=self.file_path, chunk_size=4, default_user=self.user.pk, **kwargs)
+
+    def checkpoint(self) -> dict:
+        with open(f"{self.file_path}.checkpoint") as checkpoint:
+            return json.load(checkpoint)
+
+    def test_rows_are_bulk_inserted_with_their_claims(self):
+        self.write(rows=self.rows)
+        with mock.patch.object(URLImporter, "copy_records") as copy_records:
+            stats = self.importer().run()
+
+        copy_records.assert_not_called()
+        self.assertEqual((stats["line"], stats["loaded"], stats["replayed"], stats["rejected"]), (10, 10, 0, 0))
+        self.assertEqual(ShortenedURL.objects.filter(assigned_user=self.user).count(), 10)
+        self.assertEqual(
+            set(ShortCodeClaim.objects.values_list("short_code", flat=True)),
+            set(ShortenedURL.objects.values_list("short_code", flat=True))
+        )
+        self.assertEqual(self.checkpoint()["line"], 10)
+
+    def test_invalid_rows_are_written_to_the_rejects_file(self):
+        self.rows[2]["long_url"] = ""
+        self.rows[5]["short_code"] = "bad"
+        self.rows[7]["clicks"] = -1
+        self.write(rows=self.rows)
+        stats = self.importer().run()
+
+        self.assertEqual((stats["loaded"], stats["rejected"]), (7, 3))
+        with open(f"{self.file_path}.rejects") as rejects:
+            self.assertEqual([json.loads(line)["line"] for line in rejects], [3, 6, 8])
+
+    def test_rows_of_unknown_users_are_rejected(self):
+        self.rows[4]["assigned_user"] = str(uuid4())
+        with open(self.file_path, "w") as target:
+            target.writelines(f"{json.dumps(row)}\n" for row in self.rows)
+        stats = self.importer(fmt="ndjson").run()
+
+        self.assertEqual((stats["loaded"], stats["rejected"]), (9, 1))
+        self.assertFalse(ShortenedURL.objects.filter(long_url="https://example.com/4").exists())
+
+    def test_resume_starts_after_the_checkpoint(self):
+        self.write(rows=self.rows[:6])
+        self.importer().run()
+        self.assertEqual(self.checkpoint()["line"], 6)
+
+        self.write(rows=self.rows)
+        stats = self.importer().run(resume=True)
+
+        self.assertEqual((stats["line"], stats["loaded"], stats["replayed"]), (10, 10, 0))
+        self.assertEqual(ShortenedURL.objects.count(), 10)
+
+    def test_a_replayed_chunk_merges_into_its_rows(self):
+        self.write(rows=self.rows)
+        self.importer().run()
+        codes = dict(ShortenedURL.objects.values_list("id", "short_code"))
+
+        ## A crash after the last chunk committed, before its checkpoint was written.
+        with open(f"{self.file_path}.checkpoint", "w") as checkpoint:
+            json.dump({"source": "links.csv", "line": 8, "loaded": 8, "duplicates": 0, "rejected": 0}, checkpoint)
+        stats = self.importer().run(resume=True)
+
+        self.assertEqual((stats["loaded"], stats["replayed"], stats["duplicates"]), (8, 2, 0))
+        self.assertEqual(dict(ShortenedURL.objects.values_list("id", "short_code")), codes)
+        self.assertEqual(ShortCodeClaim.objects.count(), 10)
+
+    def test_legacy_codes_in_use_are_duplicates(self):
+        taken = ShortenedURL(long_url="https://example.com/taken", short_code="Taken01", assigned_user=self.user)
+        taken.save()
+        self.rows[0]["short_code"] = "Taken01"
+        self.rows[1]["short_code"] = "Legacy1"
+        self.rows[2]["short_code"] = "Legacy1"
+        self.write(rows=self.rows)
+        stats = self.importer().run()
+
+        self.assertEqual((stats["loaded"], stats["duplicates"]), (8, 2))
+        self.assertEqual(ShortenedURL.objects.get(short_code="Taken01").pk, taken.pk)
+        self.assertEqual(ShortenedURL.objects.get(short_code="Legacy1").long_url, "https://example.com/1")
+
+    def test_generated_codes_that_collide_are_drawn_again(self):
+        taken = ShortenedURL(long_url="https://example.com/taken", short_code="Taken01", assigned_user=self.user)
+        taken.save()
+        self.write(rows=self.rows[:1])
+        with mock.patch("url_app.imports.ShortCodeHelper.generate", side_effect=["Taken01", "Fresh01"]):
+            stats = self.importer().run()
+
+        self.assertEqual((stats["loaded"], stats["duplicates"]), (1, 0))
+        self.assertEqual(ShortenedURL.objects.get(short_code="Fresh01").long_url, "https://example.com/0")
+
+
+@override_settings(DATABASE_SHARDS=[DEFAULT_DB_ALIAS], DATABASE_REPLICAS=[], URL_LOOKUP_EXPIRED_HOURS=24)
+class ExpiryRetentionTest(TestCase):
+    """
+    Links expired within URL_LOOKUP_EXPIRED_HOURS are kept, so their lookups still answer 403.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="retained", email="retained@example.com", password="secret-pass-1")
+        self.today = ExpiryPartitions.today()
+        resolution_cache.clear()
+        patcher = mock.patch.object(slug_filter, "enabled", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        ExpiryPartitions._partitioned.clear()
+        self.addCleanup(ExpiryPartitions._partitioned.clear)
+
+    def link(self, hours: float = 0) -> ShortenedURL:
+        link = ShortenedURL(long_url="https://example.com/", assigned_user=self.user,
+                            expiry=timezone.now() + timezone.timedelta(hours=hours))
+        link.save()
+        return link
+
+    def test_the_sweep_keeps_links_inside_the_lookup_window(self):
+        recent, old = self.link(hours=-1), self.link(hours=-48)
+
+        self.assertEqual(ShortenedURLUtils.sweep_expired(), 1)
+        self.assertEqual(list(ShortenedURL.objects.values_list("pk", flat=True)), [recent.pk])
+        self.assertEqual(ShortenedURLUtils.get_long_url(short_url=recent.short_code).status_code, 403)
+        self.assertFalse(ShortCodeClaim.objects.filter(short_code=old.short_code).exists())
+
+    def maintain(self, days: list = None) -> dict:
+        existing = {day: ExpiryPartitions.partition_name(day=day) for day in days}
+        with mock.patch.object(ExpiryPartitions, "partitions", return_value=existing), \
+                mock.patch.object(ExpiryPartitions, "detached", return_value=[]):
+            return ExpiryPartitions.maintain(using=DEFAULT_DB_ALIAS, premake_days=0, dry_run=True)
+
+    def test_partitions_inside_the_lookup_window_are_kept(self):
+        days = [self.today - timezone.timedelta(days=3), self.today - timezone.timedelta(days=1), self.today]
+        self.assertEqual(self.maintain(days=days)["dropped"], [ExpiryPartitions.partition_name(day=days[0])])
+
+        with override_settings(URL_LOOKUP_EXPIRED_HOURS=0):
+            self.assertEqual(self.maintain(days=days)["dropped"], [ExpiryPartitions.partition_name(day=day) for day in days[:2]])
+
+    def test_the_partitioned_state_is_looked_up_again_after_its_ttl(self):
+        ExpiryPartitions._partitioned[DEFAULT_DB_ALIAS] = (True, time())
+        self.assertTrue(ExpiryPartitions.is_partitioned(using=DEFAULT_DB_ALIAS))
+
+        ExpiryPartitions._partitioned[DEFAULT_DB_ALIAS] = (True, time() - ExpiryPartitions.STATE_TTL)
+        self.assertFalse(ExpiryPartitions.is_partitioned(using=DEFAULT_DB_ALIAS))
+
+
+@skipUnless(connection.vendor == "postgresql", "Partitioning needs PostgreSQL.")
+@override_settings(DATABASE_SHARDS=[DEFAULT_DB_ALIAS], DATABASE_REPLICAS=[], URL_LOOKUP_EXPIRED_HOURS=24)
+class ExpiryPartitionsTest(TransactionTestCase):
+    """
+    Rebuilds and partition maintenance on a PostgreSQL database; the table is made plain again after each test.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="partitioned", email="partitioned@example.com", password="secret-pass-1")
+        self.today = ExpiryPartitions.today()
+        ExpiryPartitions._partitioned.clear()
+        self.addCleanup(self.unpartition)
+
+    def unpartition(self) -> None:
+        ExpiryPartitions._partitioned.clear()
+        if ExpiryPartitions.is_partitioned(using=DEFAULT_DB_ALIAS):
+            ExpiryPartitions.rebuild(using=DEFAULT_DB_ALIAS, partitioned=False)
+
+    def link(self, days: float = 0) -> ShortenedURL:
+        link = ShortenedURL(long_url=f"https://example.com/{days}", assigned_user=self.user,
+                            expiry=timezone.now() + timezone.timedelta(days=days))
+        link.save()
+        return link
+
+    def partition(self, premake_days: int = 2) -> dict:
+        return ExpiryPartitions.rebuild(using=DEFAULT_DB_ALIAS, premake_days=premake_days, batch_size=2)
+
+    def day(self, offset: int = 0):
+        return self.today + timezone.timedelta(days=offset)
+
+    def index_names(self) -> set:
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            return {name for name, _ in ExpiryPartitions.index_definitions(cursor=cursor, table=ExpiryPartitions.TABLE)}
+
+    def test_rebuild_partitions_the_table_and_keeps_its_rows(self):
+        links = [self.link(days=1), self.link(days=-2), self.link(days=5), self.link(days=1)]
+        ShortenedURL.objects.filter(pk=links[3].pk).update(expiry=None)
+        indexes = self.index_names()
+        stats = self.partition()
+
+        self.assertEqual((stats["copied"], stats["filledExpiries"]), (4, 1))
+        self.assertTrue(ExpiryPartitions.is_partitioned(using=DEFAULT_DB_ALIAS))
+        self.assertEqual(set(ExpiryPartitions.partitions(using=DEFAULT_DB_ALIAS)), {self.day(offset) for offset in range(3)})
+        self.assertEqual(set(ShortenedURL.objects.values_list("pk", flat=True)), {link.pk for link in links})
+        self.assertEqual(self.index_names(), indexes)
+        self.assertEqual(ShortenedURLUtils.lookup(short_code=links[0].short_code)[0], links[0].long_url)
+        ## New links still get their claim and land in their day's partition.
+        self.assertTrue(ShortCodeClaim.objects.filter(link_id=self.link(days=1).pk).exists())
+
+    def test_undo_swaps_back_to_a_plain_table(self):
+        links = [self.link(days=1), self.link(days=5)]
+        self.partition()
+        stats = ExpiryPartitions.rebuild(using=DEFAULT_DB_ALIAS, partitioned=False, batch_size=1)
+
+        self.assertEqual(stats["copied"], 2)
+        self.assertFalse(ExpiryPartitions.is_partitioned(using=DEFAULT_DB_ALIAS))
+        self.assertEqual(ExpiryPartitions.partitions(using=DEFAULT_DB_ALIAS), {})
+        self.assertEqual(set(ShortenedURL.objects.values_list("pk", flat=True)), {link.pk for link in links})
+
+    def test_maintenance_creates_coming_days_and_drops_expired_ones_with_their_rows(self):
+        old, recent = self.link(days=-3), self.link(days=-1)
+        ClickRollup.objects.create(link=old, granularity=RollupChoice.day, bucket=old.expiry, clicks=1, visitors=b"")
+        self.partition(premake_days=1)
+        ExpiryPartitions.create_partition(using=DEFAULT_DB_ALIAS, day=old.expiry.date())
+        ExpiryPartitions.create_partition(using=DEFAULT_DB_ALIAS, day=self.day(-1))
+
+        stats = ExpiryPartitions.maintain(using=DEFAULT_DB_ALIAS, premake_days=3)
+
+        self.assertEqual(stats["created"], [ExpiryPartitions.partition_name(day=self.day(offset)) for offset in (2, 3)])
+        self.assertEqual(stats["dropped"], [ExpiryPartitions.partition_name(day=old.expiry.date())])
+        self.assertIn(self.day(-1), ExpiryPartitions.partitions(using=DEFAULT_DB_ALIAS))
+        self.assertFalse(ShortenedURL.objects.filter(pk=old.pk).exists())
+        self.assertFalse(ShortCodeClaim.objects.filter(link_id=old.pk).exists())
+        self.assertFalse(ClickRollup.objects.filter(link_id=old.pk).exists())
+        self.assertTrue(ShortenedURL.objects.filter(pk=recent.pk).exists())
+
+    def test_maintenance_finishes_interrupted_drops(self):
+        old = self.link(days=-3)
+        self.partition(premake_days=0)
+        ExpiryPartitions.create_partition(using=DEFAULT_DB_ALIAS, day=old.expiry.date())
+        name = ExpiryPartitions.partition_name(day=old.expiry.date())
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {ExpiryPartitions.TABLE} DETACH PARTITION {name}")
+        self.assertEqual(ExpiryPartitions.detached(using=DEFAULT_DB_ALIAS), [name])
+
+        stats = ExpiryPartitions.maintain(using=DEFAULT_DB_ALIAS, premake_days=0)
+
+        self.assertEqual(stats["dropped"], [name])
+        self.assertEqual(ExpiryPartitions.detached(using=DEFAULT_DB_ALIAS), [])
+        self.assertFalse(ShortCodeClaim.objects.filter(link_id=old.pk).exists())
+
+    def test_lookups_skip_the_partitions_of_past_days(self):
+        self.partition(premake_days=1)
+        ExpiryPartitions.create_partition(using=DEFAULT_DB_ALIAS, day=self.day(-3))
+        report = MaintainPartitionsCommand().check_pruning(using=DEFAULT_DB_ALIAS)
+
+        self.assertNotIn(ExpiryPartitions.partition_name(day=self.day(-3)), report["lookup"]["scanned"])
+        self.assertLess(len(report["lookup"]["scanned"]), report["lookup"]["total"])
+        self.assertNotIn(ExpiryPartitions.partition_name(day=self.day(-3)), report["exportLive"]["scanned"])
@@ -1,13 +1,30 @@
-from django.core.paginator import Paginator
+import heapq
+from datetime import datetime
+from hashlib import blake2b
+from http import HTTPStatus
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from django.core.exceptions import ImproperlyConfigured
 from django.conf import settings
 from django.utils import timezone
+from django.utils.encoding import iri_to_uri
+from django.db import connections, router, transaction
+from django.db.models import Q, QuerySet
+from django.utils.http import http_date
 
 from rest_framework import status
 
 from core.boilerplate.template_responses import Resp
+from core import metrics
+from core.db.sharding import ShardHelper
 from user_app.models import User
-from url_app.models import ShortenedURL
-from url_app.serializers import ShortenedUrlSerializer
+from url_app.clicks import HyperLogLog, click_buffer
+from url_app.helpers import CursorHelper, ExportHelper, ShortCodeHelper, URLHelper, resolution_cache, slug_filter
+from url_app.model_choices import RollupChoice
+from url_app.models import ClickRollup, ShortCodeClaim, ShortenedURL
+from url_app.partitions import ExpiryPartitions
+from url_app.serializers import ShortenedUrlReadSerializer, ShortenedUrlSerializer
 
 from url_app import logger
 
@@ -16,14 +33,24 @@ class ShortenedURLUtils:
 
     DEFAULT_EXPIRY: int = 360
     BLANK: str = ""
+    SECURE_HTTP: str = "https://"
+    REDIRECT_STATUS_CODES = (301, 302, 307, 308)
+    COUNT_NONE: str = "none"
+    COUNT_APPROX: str = "approx"
+    COUNT_EXACT: str = "exact"
+    COUNT_MODES = (COUNT_NONE, COUNT_APPROX, COUNT_EXACT)
+    STATE_LIVE: str = "live"
+    STATE_EXPIRED: str = "expired"
+    EXPORT_FIELDS = (
+        "id", "short_code", "short_url", "long_url", "assigned_user_id", "expiry", "clicks", "created", "updated"
+    )
 
     @classmethod
-    def get_expiry(cls, expiry_mins:int=0) -> str:
-        if expiry_mins >= 0 or expiry_mins > 1440:
+    def get_expiry(cls, expiry_mins:int=0) -> datetime:
+        if expiry_mins <= 0 or expiry_mins > 1440:
             expiry_mins = cls.DEFAULT_EXPIRY
 
         expiry = timezone.now() + timezone.timedelta(minutes=expiry_mins)
-        expiry = expiry.strftime('YYYY-MM-dd HH:mm:ss')
 
         return expiry
 
@@ -31,14 +58,22 @@ class ShortenedURLUtils:
     def create_short_url(cls, user: User = None, long_url: str = None, expiry_mins:int=0)->Resp:
         resp = Resp()
 
-        if not user or not long_url or long_url == cls.BLANK:
+        if not user or not long_url or not isinstance(long_url, str) or long_url == cls.BLANK:
             resp.error = "Invalid Parameters"
             resp.message = "Both UserList and LongUrl are required."
             resp.status_code = status.HTTP_400_BAD_REQUEST
 
             logger.warn(resp.message)
             return resp
-        
+
+        url_hash = URLHelper.hash(long_url=long_url)
+        duplicate = cls.get_live_duplicates(user=user, url_hashes=(url_hash,)).get(url_hash)
+        if duplicate:
+            resp.message = "URL already shortened."
+            resp.data = ShortenedUrlReadSerializer.from_instance(duplicate)
+            resp.status_code = status.HTTP_200_OK
+            return resp
+
         expiry = cls.get_expiry(expiry_mins=expiry_mins)
 
         data = {
@@ -66,7 +101,279 @@ class ShortenedURLUtils:
         return resp
 
     @classmethod
-    def get_long_url(cls, short_url: str = None):
+    def live_links(cls, shard: str = None) -> QuerySet:
+        ## A lower bound on expiry lets the planner skip the partitions of past days.
+        return ShortenedURL.objects.using(shard).filter(expiry__gt=timezone.now())
+
+    @classmethod
+    def expired_links(cls, shard: str = None) -> QuerySet:
+        """
+        Links expired more than URL_LOOKUP_EXPIRED_HOURS ago, left for the sweep (younger ones
+        are still answered as expired): on a partitioned table only those outside the day
+        partitions, which go away with their partition.
+        """
+        objs = ShortenedURL.objects.using(shard).filter(expiry__lte=timezone.now() - ExpiryPartitions.retention())
+        using = shard or router.db_for_write(ShortenedURL)
+        if ExpiryPartitions.is_partitioned(using=using):
+            for start, end in ExpiryPartitions.covered(using=using):
+                objs = objs.exclude(expiry__gte=start, expiry__lt=end)
+
+        return objs
+
+    @classmethod
+    def get_live_duplicates(cls, user: User = None, url_hashes: Iterable[str] = None) -> Dict[str, ShortenedURL]:
+        """
+        The user's live links for the given URL hashes, keyed by hash; the one expiring last wins.
+        """
+        ## Links are sharded by code, not by URL, so every shard is asked.
+        objs = []
+        for shard in ShardHelper.databases():
+            objs.extend(cls.live_links(shard=shard).filter(assigned_user=user, url_hash__in=url_hashes))
+
+        duplicates = {}
+        for obj in sorted(objs, key=lambda obj: obj.expiry):
+            duplicates[obj.url_hash] = obj
+
+        return duplicates
+
+    @classmethod
+    def bulk_create_short_urls(cls, user: User = None, items: list = None) -> Resp:
+        """
+        Shorten a batch of {long_url, expiry_mins} items: one validation pass over the batch,
+        then a single bulk insert in one transaction. Invalid items are reported per index
+        and do not stop the valid ones from being created.
+
+        Items whose URL the user already has a live link for are answered with it and marked
+        `existing`; an item repeating an earlier one of the batch gets that item's result and
+        is not counted again.
+        """
+        resp = Resp()
+
+        if not user or not isinstance(items, list) or not items:
+            resp.error = "Invalid Parameters"
+            resp.message = "A user and a non-empty list of items are required."
+            resp.status_code = status.HTTP_400_BAD_REQUEST
+
+            logger.warn(resp.message)
+            return resp
+
+        if len(items) > settings.BULK_SHORTEN_MAX_ITEMS:
+            resp.error = "Batch Too Large"
+            resp.message = f"At most {settings.BULK_SHORTEN_MAX_ITEMS} items can be shortened per request, got {len(items)}."
+            resp.status_code = status.HTTP_400_BAD_REQUEST
+
+            logger.warn(resp.message)
+            return resp
+
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            try:
+                long_url = item.get("long_url", cls.BLANK)
+                expiry_mins = int(item.get("expiry_mins", cls.DEFAULT_EXPIRY))
+            except Exception as ex:
+                results[index] = {"index": index, "error": "Invalid Data", "message": f"{ex}"}
+                continue
+
+            if not isinstance(long_url, str) or long_url == cls.BLANK:
+                results[index] = {"index": index, "error": "Invalid Data", "message": "LongUrl is required."}
+                continue
+
+            valid.append((index, long_url, expiry_mins, URLHelper.hash(long_url=long_url)))
+
+        duplicates = cls.get_live_duplicates(user=user, url_hashes={item[3] for item in valid})
+        ## url_hash -> index of the batch's first item with it; (index, first index) of the repeats.
+        firsts = {}
+        repeats = []
+        existing = []
+        objs = []
+        positions = []
+        for index, long_url, expiry_mins, url_hash in valid:
+            if url_hash in firsts:
+                repeats.append((index, firsts[url_hash]))
+                continue
+
+            firsts[url_hash] = index
+            if url_hash in duplicates:
+                existing.append((index, duplicates[url_hash]))
+                continue
+
+            obj = ShortenedURL(
+                long_url=long_url, url_hash=url_hash, assigned_user=user, expiry=cls.get_expiry(expiry_mins=expiry_mins))
+            objs.append(obj)
+            positions.append(index)
+
+        if objs:
+            ## Codes are random, so re-roll the rare ones already taken (in the table or the batch) before inserting.
+            codes = {}
+            for obj in objs:
+                while obj.short_code in codes:
+                    obj.short_code = ShortCodeHelper.generate()
+                codes[obj.short_code] = obj
+            taken = set()
+            for shard, shard_codes in ShardHelper.group(codes.keys()).items():
+                taken.update(ShortCodeClaim.held(using=shard, codes=shard_codes))
+            for short_code in taken:
+                obj = codes.pop(short_code)
+                while obj.short_code in taken or obj.short_code in codes:
+                    obj.short_code = ShortCodeHelper.generate()
+                codes[obj.short_code] = obj
+
+            for obj in objs:
+                obj.short_url = obj.build_short_url()
+
+            ## One transaction per shard: a batch spread over shards is not created atomically.
+            for shard, shard_objs in ShardHelper.group(objs, key=lambda obj: obj.short_code).items():
+                with transaction.atomic(using=shard):
+                    ShortCodeClaim.claim(using=shard, links=shard_objs)
+                    ShortenedURL.objects.using(shard).bulk_create(shard_objs, batch_size=500)
+
+            ## bulk_create does not send post_save, so the slug filter is updated here.
+            for obj in objs:
+                slug_filter.add(short_code=obj.short_code)
+
+            for index, data in zip(positions, ShortenedUrlReadSerializer.many(objs)):
+                results[index] = {"index": index, "data": data}
+
+        if existing:
+            for (index, _), data in zip(existing, ShortenedUrlReadSerializer.many([obj for _, obj in existing])):
+                results[index] = {"index": index, "data": data, "existing": True}
+
+        for index, first in repeats:
+            results[index] = {**results[first], "index": index}
+
+        failed = len(items) - len(valid)
+        resp.data = {
+            "created": len(objs),
+            "existing": len(existing),
+            "failed": failed,
+            "results": results
+        }
+        if not valid:
+            resp.error = "Invalid Data"
+            resp.message = "None of the items could be shortened."
+            resp.status_code = status.HTTP_400_BAD_REQUEST
+        elif failed:
+            resp.message = f"{len(valid)} of {len(items)} URLs shortened successfully."
+            resp.status_code = status.HTTP_207_MULTI_STATUS
+        else:
+            resp.message = f"{len(valid)} URLs shortened successfully."
+            resp.status_code = status.HTTP_201_CREATED
+
+        return resp
+
+    @classmethod
+    def get_redirect_target(cls, long_url: str = None) -> str:
+        return f"{cls.SECURE_HTTP}{long_url}" if not long_url.startswith(cls.SECURE_HTTP) else long_url
+
+    @classmethod
+    def get_redirect_status(cls) -> Tuple[int, str]:
+        """
+        The configured redirect status code and its WSGI status line.
+        """
+        code = settings.REDIRECT_STATUS_CODE
+        if code not in cls.REDIRECT_STATUS_CODES:
+            raise ImproperlyConfigured(f"REDIRECT_STATUS_CODE must be one of {cls.REDIRECT_STATUS_CODES}, not {code}.")
+
+        return code, f"{code} {HTTPStatus(code).phrase}"
+
+    @classmethod
+    def get_redirect_headers(cls, short_code: str = None, long_url: str = None, expiry: datetime = None) -> List[Tuple[str, str]]:
+        """
+        Location plus caching headers for a redirect. Browsers and shared caches may keep the
+        redirect for the rest of the link's lifetime (capped by settings) and never past its expiry.
+        """
+        remaining = max(0, int((expiry - timezone.now()).total_seconds()))
+        max_age = min(remaining, settings.REDIRECT_MAX_AGE)
+        s_maxage = min(remaining, settings.REDIRECT_S_MAXAGE)
+        etag = blake2b(f"{short_code}|{long_url}|{expiry.isoformat()}".encode(), digest_size=8).hexdigest()
+
+        return [
+            ("Location", iri_to_uri(cls.get_redirect_target(long_url=long_url))),
+            ("Cache-Control", f"public, max-age={max_age}, s-maxage={s_maxage}"),
+            ("Expires", http_date(timezone.now().timestamp() + max_age)),
+            ("ETag", f'"{etag}"'),
+        ]
+
+    @classmethod
+    def record_click(cls, short_code: str = None, visitor: int = None) -> None:
+        click_buffer.record(short_code=short_code, visitor=visitor)
+
+    @classmethod
+    def collect_metrics(cls) -> None:
+        """
+        Mirror this worker's cache, slug filter and click buffer counters into core.metrics.
+        """
+        cache = resolution_cache.stats()
+        metrics.redirect_cache_lookups_total.set_total(cache["hits"], result="hit")
+        metrics.redirect_cache_lookups_total.set_total(cache["misses"], result="miss")
+        metrics.redirect_cache_evictions_total.set_total(cache["evictions"])
+        metrics.redirect_cache_entries.set(cache["size"])
+        metrics.slug_filter_rejections_total.set_total(slug_filter.rejections)
+        metrics.slug_filter_forced_syncs_total.set_total(slug_filter.forced_syncs)
+
+        clicks = click_buffer.stats()
+        metrics.click_buffer_pending.set(clicks["bufferDepth"])
+        metrics.click_flushes_total.set_total(clicks["flushes"], result="ok")
+        metrics.click_flushes_total.set_total(clicks["failedFlushes"], result="failed")
+        metrics.click_dropped_total.set_total(clicks["droppedClicks"])
+
+    @classmethod
+    def lookup(cls, short_code: str = None) -> Tuple[str, datetime]:
+        """
+        Cache-first lookup of the (long_url, expiry) pair for a short code.
+        Returns None for malformed or unknown codes; links expired within the last
+        URL_LOOKUP_EXPIRED_HOURS are returned so that the caller can decide what to do with them.
+        """
+        ## Malformed slugs can never match a short code, so they are rejected without a query.
+        if not ShortCodeHelper.is_valid(short_code=short_code):
+            return None
+
+        cached = resolution_cache.get(slug=short_code)
+        if cached:
+            return cached
+
+        if not slug_filter.might_contain(short_code=short_code):
+            return None
+
+        ## The code alone names its shard, so a lookup is a single query on a single database.
+        row = cls.lookup_links(shard=ShardHelper.for_key(short_code)).filter(
+            short_code=short_code).values_list("long_url", "expiry").first()
+        if not row and settings.DATABASE_SHARD_REBALANCING:
+            row = cls.lookup_elsewhere(short_code=short_code)
+        if row:
+            resolution_cache.set(slug=short_code, long_url=row[0], expiry=row[1])
+
+        return row
+
+    @classmethod
+    def lookup_links(cls, shard: str = None) -> QuerySet:
+        ## Links expired longer ago count as unknown: the bound lets the planner skip the partitions of past days.
+        return ShortenedURL.objects.using(shard).filter(
+            expiry__gt=timezone.now() - timezone.timedelta(hours=settings.URL_LOOKUP_EXPIRED_HOURS))
+
+    @classmethod
+    def lookup_elsewhere(cls, short_code: str = None) -> Tuple[str, datetime]:
+        """
+        Look for a code on the shards that do not own it, where it may wait to be moved by
+        `manage.py rebalance_shards` after a shard was added.
+        """
+        owner = ShardHelper.for_key(short_code)
+        for shard in ShardHelper.databases():
+            if shard == owner:
+                continue
+
+            row = cls.lookup_links(shard=shard).filter(short_code=short_code).values_list("long_url", "expiry").first()
+            if row:
+                return row
+
+        return None
+
+    @classmethod
+    def get_long_url(cls, short_url: str = None, visitor: int = None, resolved: Tuple[str, Tuple[str, datetime]] = None):
+        """
+        `resolved` is the (short code, row) pair RedirectFastPath already looked up, if any.
+        """
         resp = Resp()
         if not short_url:
             resp.error = "Invalid Parameter"
@@ -76,37 +383,167 @@ class ShortenedURLUtils:
             logger.warn(resp.message)
             return resp
 
-        url_obj = ShortenedURL.objects.filter(pk=short_url).first()
-        if not url_obj:
+        if resolved and resolved[0] == short_url:
+            row = resolved[1]
+        else:
+            row = cls.lookup(short_code=short_url)
+        if not row:
             resp.error = "Not Found"
             resp.message = "Invalid short url."
             resp.data = {
                 "shortUrl": short_url
             }
             resp.status_code = status.HTTP_404_NOT_FOUND
+
+            metrics.redirects_total.inc(outcome="not_found")
             return resp
 
-        if url_obj.expiry <= timezone.now():
+        long_url, expiry = row
+        if expiry <= timezone.now():
             resp.error = "Link Expired"
-            resp.message = f"The shortlink: {url_obj.short_url} expired at {url_obj.expiry.strftime('YYYY-MM-dd HH:mm:ss')}."
+            resp.message = f"The shortlink: {short_url} expired at {expiry.strftime('YYYY-MM-dd HH:mm:ss')}."
             resp.data = {
                 "shortUrl": short_url
             }
             resp.status_code = status.HTTP_403_FORBIDDEN
 
-            url_obj.delete()
+            metrics.redirects_total.inc(outcome="expired")
+            ## Expired rows are left for the sweeper (manage.py sweep_expired_urls); reads never write.
             return resp
 
-        serialized = ShortenedUrlSerializer(url_obj).data
+        cls.record_click(short_code=short_url, visitor=visitor)
+        metrics.redirects_total.inc(outcome="redirect")
 
         resp.message = "Url retrieved successfully."
-        resp.data = serialized
+        resp.data = {
+            "long_url": long_url,
+            "expiry": expiry
+        }
         resp.status_code = status.HTTP_200_OK
 
         return resp
 
     @classmethod
-    def get_all_urls(cls, page:int=1, user:User=None):
+    def move_links(cls, source: str = None, target: str = None, pks: List = None) -> int:
+        """
+        Copy links (and their click rollups) to `target`, then delete them from `source`.
+        A move interrupted in between is completed by running it again: the copy skips rows
+        already present.
+        """
+        links = list(ShortenedURL.objects.using(source).filter(pk__in=pks))
+        rollups = list(ClickRollup.objects.using(source).filter(link_id__in=pks))
+        with transaction.atomic(using=target):
+            ShortCodeClaim.claim(using=target, links=links, ignore_conflicts=True)
+            ShortenedURL.objects.using(target).bulk_create(links, ignore_conflicts=True)
+            ClickRollup.objects.using(target).bulk_create(rollups, ignore_conflicts=True)
+
+        with transaction.atomic(using=source):
+            ShortenedURL.objects.using(source).filter(pk__in=pks).delete()
+
+        return len(links)
+
+    @classmethod
+    def rebalance_shards(cls, batch_size: int = 1000, dry_run: bool = False, progress=None) -> dict:
+        """
+        Walk every shard in primary key order and move the links whose code belongs to
+        another shard there, `batch_size` rows at a time.
+        """
+        stats = {"scanned": 0, "misplaced": 0, "moved": 0, "routes": {}}
+        if not ShardHelper.sharded():
+            return stats
+
+        for source in ShardHelper.databases():
+            last_pk = None
+            while True:
+                objs = ShortenedURL.objects.using(source).order_by("pk")
+                if last_pk:
+                    objs = objs.filter(pk__gt=last_pk)
+                rows = list(objs.values_list("pk", "short_code")[:batch_size])
+                if not rows:
+                    break
+
+                last_pk = rows[-1][0]
+                stats["scanned"] += len(rows)
+                for target, misplaced in ShardHelper.group(rows, key=lambda row: row[1]).items():
+                    if target == source:
+                        continue
+
+                    route = f"{source}->{target}"
+                    stats["misplaced"] += len(misplaced)
+                    stats["routes"][route] = stats["routes"].get(route, 0) + len(misplaced)
+                    if not dry_run:
+                        stats["moved"] += cls.move_links(source=source, target=target, pks=[row[0] for row in misplaced])
+
+                if progress:
+                    progress(stats)
+
+        logger.info(f"Shard rebalance{' (dry run)' if dry_run else ''}: {stats}")
+        return stats
+
+    @classmethod
+    def sweep_expired(cls, batch_size: int = None, max_batches: int = None) -> int:
+        """
+        Delete expired links in bounded batches, each one its own short transaction,
+        walking the expiry index. Returns the number of links deleted. Links of day partitions
+        are left to `manage.py maintain_url_partitions`, which drops them a partition at a time.
+        """
+        batch_size = batch_size or settings.EXPIRY_SWEEP_BATCH_SIZE
+        deleted = 0
+        batches = 0
+
+        for shard in ShardHelper.databases():
+            while max_batches is None or batches < max_batches:
+                pks = list(cls.expired_links(shard=shard).order_by("expiry").values_list("pk", flat=True)[:batch_size])
+                if not pks:
+                    break
+
+                count, _ = ShortenedURL.objects.using(shard).filter(pk__in=pks).delete()
+                deleted += count
+                batches += 1
+
+        if deleted:
+            logger.info(f"Swept {deleted} expired links in {batches} batches.")
+
+        return deleted
+
+    @classmethod
+    def count_urls(cls, mode: str = COUNT_NONE) -> int:
+        """
+        Total number of links: exact, estimated from the planner statistics, or not at all.
+        """
+        if mode == cls.COUNT_NONE:
+            return None
+
+        return sum(cls.count_shard_urls(mode=mode, shard=shard) for shard in ShardHelper.databases())
+
+    @classmethod
+    def count_shard_urls(cls, mode: str = COUNT_EXACT, shard: str = None) -> int:
+        connection = connections[shard or router.db_for_read(ShortenedURL)]
+        if mode == cls.COUNT_APPROX and connection.vendor == "postgresql":
+            if ExpiryPartitions.is_partitioned(using=connection.alias):
+                estimate = ExpiryPartitions.estimated_rows(using=connection.alias)
+            else:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                        [ShortenedURL._meta.db_table]
+                    )
+                    row = cursor.fetchone()
+                estimate = row[0] if row else None
+            ## reltuples is -1 (or 0 on older servers) until the table is first analysed.
+            if estimate and estimate > 0:
+                return estimate
+
+        return ShortenedURL.objects.using(connection.alias).count()
+
+    @classmethod
+    def get_all_urls(cls, cursor: str = None, limit: int = None, count: str = COUNT_NONE, user: User = None) -> Resp:
+        """
+        One page of links, newest first, using keyset pagination on (created, id).
+
+        `cursor` is the `nextCursor` of the previous page; rows inserted while paging never
+        shift or repeat rows on later pages.
+        """
         resp = Resp()
         
         if not user or not (user.is_superuser or user.is_staff):
@@ -115,23 +552,177 @@ class ShortenedURLUtils:
             resp.status_code = status.HTTP_401_UNAUTHORIZED
             return resp
 
-        objs = ShortenedURL.objects.all()
+        if count not in cls.COUNT_MODES:
+            resp.error = "Invalid Parameter"
+            resp.message = f"Count must be one of: {', '.join(cls.COUNT_MODES)}."
+            resp.status_code = status.HTTP_400_BAD_REQUEST
+            return resp
 
-        ## Of course we paginate this, I have no intention to blow up the instance with a virtual torrent of data.
-        paginator = Paginator(objs, per_page=settings.ITEMS_PER_PAGE)
-        objs = paginator.get(page)
+        limit = min(limit, settings.ITEMS_PER_PAGE) if limit and limit > 0 else settings.ITEMS_PER_PAGE
 
-        serialized = ShortenedUrlSerializer(objs, many=True).data
+        ## Of course we paginate this, I have no intention to blow up the instance with a virtual torrent of data.
+        keyset = Q()
+        if cursor:
+            try:
+                created, pk = CursorHelper.decode(cursor=cursor)
+            except ValueError as ex:
+                resp.error = "Invalid Parameter"
+                resp.message = f"{ex}"
+                resp.status_code = status.HTTP_400_BAD_REQUEST
+                return resp
+
+            keyset = Q(created__lt=created) | Q(created=created, id__lt=pk)
+
+        ## One extra row tells whether there is a next page without a COUNT(*). Every shard returns
+        ## its own first limit + 1 rows after the cursor and the sorted pages are merged.
+        pages = [
+            ShortenedURL.objects.using(shard).filter(keyset).order_by("-created", "-id").values_list(
+                *ShortenedUrlReadSerializer.COLUMNS)[:limit + 1]
+            for shard in ShardHelper.databases()
+        ]
+        rows = list(islice(heapq.merge(*pages, key=lambda row: (row[1], row[0]), reverse=True), limit + 1))
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = CursorHelper.encode(created=rows[-1][1], pk=rows[-1][0])
+
+        tz = ShortenedUrlReadSerializer.current_timezone()
+        serialized = [ShortenedUrlReadSerializer.from_row(row, tz) for row in rows]
 
         data = {
             "hits": len(serialized),
             "results": serialized,
-            "page": page
+            "nextCursor": next_cursor,
+            "total": cls.count_urls(mode=count)
         }
 
         resp.data = data
-        resp.message = f"Items in page #{page} retrieved successfully."
+        resp.message = f"{len(serialized)} items retrieved successfully."
+        resp.status_code = status.HTTP_200_OK
+
+        return resp
+
+    @classmethod
+    def get_export_rows(cls, assigned_user=None, created_from: datetime = None, created_to: datetime = None,
+                        state: str = None) -> Iterator[dict]:
+        """
+        Matching links as plain dicts, read through a server-side cursor in EXPORT_CHUNK_SIZE rows
+        (one per shard, merged in (created, id) order).
+        """
+        filters = Q()
+        if assigned_user:
+            filters &= Q(assigned_user_id=assigned_user)
+        if created_from:
+            filters &= Q(created__gte=created_from)
+        if created_to:
+            filters &= Q(created__lt=created_to)
+        if state == cls.STATE_LIVE:
+            filters &= Q(expiry__gt=timezone.now())
+        elif state == cls.STATE_EXPIRED:
+            filters &= Q(expiry__lte=timezone.now())
+
+        shards = [
+            ShortenedURL.objects.using(shard).filter(filters).order_by("created", "id").values(
+                *cls.EXPORT_FIELDS).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+            for shard in ShardHelper.databases()
+        ]
+        if len(shards) == 1:
+            return shards[0]
+
+        return heapq.merge(*shards, key=lambda row: (row["created"], row["id"]))
+
+    @classmethod
+    def export_urls(cls, user: User = None, fmt: str = ExportHelper.NDJSON, assigned_user=None,
+                    created_from: datetime = None, created_to: datetime = None, state: str = None) -> Resp:
+        """
+        Full dump of the links matching the filters; `data` is a lazy iterator of encoded chunks.
+        """
+        resp = Resp()
+
+        if not user or not (user.is_superuser or user.is_staff):
+            resp.error = "Permission Denied"
+            resp.message = "Only admins are allowed to access this data."
+            resp.status_code = status.HTTP_401_UNAUTHORIZED
+            return resp
+
+        if fmt not in ExportHelper.CONTENT_TYPES:
+            resp.error = "Invalid Parameter"
+            resp.message = f"Format must be one of: {', '.join(ExportHelper.CONTENT_TYPES)}."
+            resp.status_code = status.HTTP_400_BAD_REQUEST
+            return resp
+
+        if state and state not in (cls.STATE_LIVE, cls.STATE_EXPIRED):
+            resp.error = "Invalid Parameter"
+            resp.message = f"State must be one of: {cls.STATE_LIVE}, {cls.STATE_EXPIRED}."
+            resp.status_code = status.HTTP_400_BAD_REQUEST
+            return resp
+
+        rows = cls.get_export_rows(
+            assigned_user=assigned_user, created_from=created_from, created_to=created_to, state=state)
+        resp.data = ExportHelper.stream(
+            rows=rows, fmt=fmt, fields=cls.EXPORT_FIELDS, batch_size=settings.EXPORT_CHUNK_SIZE)
+        resp.message = "Export started."
+        resp.status_code = status.HTTP_200_OK
+
+        return resp
+
+    @classmethod
+    def get_link_stats(cls, user: User = None, short_code: str = None, granularity: str = RollupChoice.hour,
+                       start: datetime = None, end: datetime = None) -> Resp:
+        """
+        Click statistics for a link, read from the click rollups only.
+        """
+        resp = Resp()
+
+        if granularity not in dict(RollupChoice.GRANULARITY_CHOICES):
+            resp.error = "Invalid Parameter"
+            resp.message = f"Granularity must be one of: {', '.join(dict(RollupChoice.GRANULARITY_CHOICES))}."
+            resp.status_code = status.HTTP_400_BAD_REQUEST
+            return resp
+
+        shard = ShardHelper.for_key(short_code)
+        link = ShortenedURL.objects.using(shard).filter(short_code=short_code).values_list("pk", "assigned_user_id").first()
+        if not link:
+            resp.error = "Not Found"
+            resp.message = "Invalid short url."
+            resp.data = {
+                "shortUrl": short_code
+            }
+            resp.status_code = status.HTTP_404_NOT_FOUND
+            return resp
+
+        if not user or not (user.is_superuser or user.is_staff or link[1] == user.id):
+            resp.error = "Permission Denied"
+            resp.message = "Only the owner of the link or admins are allowed to access this data."
+            resp.status_code = status.HTTP_401_UNAUTHORIZED
+            return resp
+
+        rollups = ClickRollup.objects.using(shard).filter(link_id=link[0], granularity=granularity)
+        if start:
+            rollups = rollups.filter(bucket__gte=start)
+        if end:
+            rollups = rollups.filter(bucket__lt=end)
+
+        ## Unique visitors over the whole range come from merging the bucket sketches, not summing them.
+        visitors = HyperLogLog()
+        buckets = []
+        for bucket, clicks, unique_visitors, registers in rollups.order_by("bucket").values_list(
+                "bucket", "clicks", "unique_visitors", "visitors"):
+            visitors.merge(HyperLogLog(registers=registers))
+            buckets.append({
+                "bucket": bucket,
+                "clicks": clicks,
+                "uniqueVisitors": unique_visitors
+            })
+
+        resp.message = "Link statistics retrieved successfully."
+        resp.data = {
+            "shortCode": short_code,
+            "granularity": granularity,
+            "totalClicks": sum(bucket["clicks"] for bucket in buckets),
+            "uniqueVisitors": visitors.count() if buckets else 0,
+            "buckets": buckets
+        }
         resp.status_code = status.HTTP_200_OK
 
         return resp
-        
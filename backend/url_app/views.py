@@ -1,3 +1,78 @@
-from django.shortcuts import render
+import json
 
-# Create your views here.
+from django.http import HttpRequest, HttpResponseNotAllowed, JsonResponse
+
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from core.boilerplate.template_responses import Resp
+from core.db.threads import database_sync_to_async
+from url_app.utils import ShortenedURLUtils
+from user_app.authentication import CachedJWTAuthentication
+
+from url_app import logger
+
+
+## Plain async Django views: under ASGI they run on the event loop and only hop to a
+## worker thread for ORM work, instead of running the whole DRF APIView in one. Those hops
+## may use any executor thread, so concurrent requests do not queue for a single one.
+
+
+async def authenticate_async(request: HttpRequest = None):
+    """
+    JWT authentication for async views: the token is validated on the event loop and
+    only the user fetch is handed to a worker thread.
+    """
+    authenticator = CachedJWTAuthentication()
+    header = authenticator.get_header(request)
+    if header is None:
+        return None
+
+    raw_token = authenticator.get_raw_token(header)
+    if raw_token is None:
+        return None
+
+    validated_token = authenticator.get_validated_token(raw_token)
+    return await database_sync_to_async(authenticator.get_user)(validated_token)
+
+
+async def create_short_url_async(request: HttpRequest, *args, **kwargs):
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+
+    resp = Resp()
+
+    try:
+        user = await authenticate_async(request=request)
+    except (AuthenticationFailed, InvalidToken, TokenError) as ex:
+        user = None
+        logger.warn(f"{ex}")
+
+    if not user:
+        resp.error = "Not Authenticated"
+        resp.message = "Authentication credentials were not provided or are invalid."
+        resp.status_code = status.HTTP_401_UNAUTHORIZED
+        return JsonResponse(resp.to_json(), status=resp.status_code)
+
+    try:
+        data = json.loads(request.body or b"{}")
+        long_url = data.get("long_url", "")
+        expiry_mins = int(data.get("expiry_mins", 360))
+    except Exception as ex:
+        resp.error = "Invalid Data"
+        resp.message = f"{ex}"
+        resp.status_code = status.HTTP_400_BAD_REQUEST
+
+        logger.warn(f"{resp.message} | User: {user.email}")
+        return JsonResponse(resp.to_json(), status=resp.status_code)
+
+    resp = await database_sync_to_async(ShortenedURLUtils.create_short_url)(
+        user=user, long_url=long_url, expiry_mins=expiry_mins)
+
+    return JsonResponse(resp.to_json(), status=resp.status_code)
+
+
+## Django 3.2's csrf_exempt/require_POST wrap views in sync functions, which would turn these
+## views back into sync ones; the flags are set directly instead. JWT auth is header based.
+create_short_url_async.csrf_exempt = True
@@ -0,0 +1,37 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from user_app.constants import TokenClaim
+from user_app.helpers import UserCache
+from user_app.models import User
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication resolving the token's user through UserCache, so authenticated requests
+    only query the User table on a cache miss. user_app.signals invalidates a user's entry
+    when the user is saved (deactivated, blocked, ...) or deleted.
+
+    Tokens whose version claim is older than the user's token_version (bumped by password
+    changes and deactivation) are rejected; tokens issued without the claim count as version 0.
+    """
+
+    def get_user(self, validated_token) -> User:
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        version = validated_token.get(TokenClaim.VERSION, 0)
+        user = UserCache.get(user_id=user_id, version=version)
+        if user is None:
+            ## Raises for unknown and inactive users, which are never cached.
+            user = super().get_user(validated_token)
+            UserCache.set(user=user)
+
+        if version != user.token_version:
+            raise AuthenticationFailed(_("Token has been revoked"), code="token_revoked")
+
+        return user
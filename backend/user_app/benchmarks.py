@@ -0,0 +1,51 @@
+from typing import Callable
+
+from django.test import Client
+
+from user_app.models import User
+from url_app.benchmarks import ApiBenchmark, BenchmarkHelper
+
+
+class LoginBenchmark:
+    """
+    UserPasswordLoginAPI through the Django test client. Latency is dominated by the
+    password hasher, so it runs a fraction of the other scenarios' iterations.
+    """
+
+    USERNAME: str = "benchmark-login"
+    PASSWORD: str = "benchmark-password"
+
+    @classmethod
+    def seed(cls) -> User:
+        user = User.objects.filter(username=cls.USERNAME).first()
+        if not user:
+            user = User.objects.create_user(
+                username=cls.USERNAME, email="benchmark-login@mslate.ai", phone="9000000001", password=cls.PASSWORD
+            )
+        return user
+
+    @classmethod
+    def login(cls) -> Callable:
+        def factory():
+            client = Client()
+            body = {"username": cls.USERNAME, "password": cls.PASSWORD}
+            return lambda: ApiBenchmark.client_call(
+                client, "post", "/api/user/login/v1/", 200, data=body, content_type="application/json")
+
+        return factory
+
+    @classmethod
+    def run(cls, iterations: int = 1000, concurrency: int = 50) -> dict:
+        cls.seed()
+        calls = max(1, iterations // 50)
+
+        return {
+            "UserPasswordLoginAPI": {
+                "serial": BenchmarkHelper.summarise(
+                    BenchmarkHelper.time_calls(cls.login()(), iterations=calls, warmup=min(5, calls))
+                ),
+                "concurrent": BenchmarkHelper.run_concurrent(
+                    cls.login(), requests=calls, concurrency=min(concurrency, calls)
+                ),
+            }
+        }
@@ -14,4 +14,13 @@ class UserRegex:
     PHONE_REGEX_US = re.compile(r'^\([0-9]{3}\)[0-9]{3}-[0-9]{4}$')
     # 1 UC char, 1 LC char, 1 NUM char; between 8 to 15 chars
     PASSWORD_REGEX = re.compile(
-        r'^(?=.*[a-z])(?=.*[A-Z])(?=.*\d)(?=.*[@$!%*?&])[A-Za-z\d@$!%*?&]{8,}$')
\ No newline at end of file
+        r'^(?=.*[a-z])(?=.*[A-Z])(?=.*\d)(?=.*[@$!%*?&])[A-Za-z\d@$!%*?&]{8,}$')
+
+
+class TokenClaim:
+    """
+    Custom claims of the JWTs issued by JWTUtils.
+    """
+
+    # User.token_version when the token was issued; tokens of older versions are rejected.
+    VERSION = "token_version"
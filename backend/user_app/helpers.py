@@ -1,7 +1,9 @@
 from secrets import token_hex, token_urlsafe, choice
-from typing import List
+from typing import List, Tuple
 
+from django.conf import settings
 from django.contrib.auth.hashers import make_password, check_password
+from django.core.cache import caches
 from django.db.models import Q, QuerySet
 from django.utils import timezone
 
@@ -91,3 +93,67 @@ class OTPHelper:
         resp.status_code = status.HTTP_200_OK
 
         return resp
+
+
+class UserCache:
+    """
+    Users resolved from access tokens, kept for USER_AUTH_CACHE_TTL seconds in the
+    USER_AUTH_CACHE_ALIAS cache under their id and token_version: a token looks its user up
+    under the version it carries, so tokens revoked by a version bump never reach a cached user.
+
+    Only used when that cache is shared by every worker: with a per-process one (local memory,
+    the default), a user changed through one worker would be served unchanged by the others
+    until the TTL runs out, so users are read from the database on every request instead.
+
+    Saving or deleting a user replaces its entries (of its current and previous version) with
+    tombstones for a TTL. Entries are only ever added, so a request that fetched the user before
+    the change cannot cache it afterwards.
+    """
+
+    PREFIX: str = "auth-user"
+    TOMBSTONE: str = "changed"
+    PER_PROCESS_BACKENDS: Tuple[str, ...] = (
+        "django.core.cache.backends.locmem.LocMemCache",
+        "django.core.cache.backends.dummy.DummyCache",
+    )
+
+    @classmethod
+    def cache(cls):
+        return caches[settings.USER_AUTH_CACHE_ALIAS]
+
+    @classmethod
+    def enabled(cls) -> bool:
+        return (settings.USER_AUTH_CACHE_TTL > 0
+                and settings.CACHES[settings.USER_AUTH_CACHE_ALIAS]["BACKEND"] not in cls.PER_PROCESS_BACKENDS)
+
+    @classmethod
+    def key(cls, user_id=None, version: int = 0) -> str:
+        return f"{cls.PREFIX}:{user_id}:{version}"
+
+    @classmethod
+    def get(cls, user_id=None, version: int = 0) -> User:
+        """
+        The cached user at that token_version, None on a miss.
+        """
+        if not cls.enabled():
+            return None
+
+        user = cls.cache().get(cls.key(user_id=user_id, version=version))
+        return user if isinstance(user, User) else None
+
+    @classmethod
+    def set(cls, user: User = None) -> None:
+        if cls.enabled():
+            cls.cache().add(
+                cls.key(user_id=user.pk, version=user.token_version), user, timeout=settings.USER_AUTH_CACHE_TTL)
+
+    @classmethod
+    def invalidate(cls, user_id=None, version: int = 0) -> None:
+        """
+        `version` is the user's token_version after the change; the save may just have bumped it.
+        """
+        if cls.enabled():
+            cls.cache().set_many(
+                {cls.key(user_id=user_id, version=stale): cls.TOMBSTONE for stale in {max(0, version - 1), version}},
+                timeout=settings.USER_AUTH_CACHE_TTL
+            )
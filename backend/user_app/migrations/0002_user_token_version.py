@@ -0,0 +1,18 @@
+# Generated by Django 3.2.6 on 2026-10-18 09:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='token_version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Bumped on password changes and deactivation to revoke the tokens issued so far'),
+        ),
+    ]
@@ -79,11 +79,32 @@ class User(AbstractUser):
         null=True,
         help_text="Blocked until"
     )
+    token_version = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text="Bumped on password changes and deactivation to revoke the tokens issued so far"
+    )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(User, cls).from_db(db, field_names, values)
+        ## Lets save() tell a deactivation from saves of users that were inactive already.
+        instance._loaded_is_active = instance.__dict__.get("is_active")
+        return instance
+
+    def set_password(self, raw_password):
+        super(User, self).set_password(raw_password)
+        self.token_version += 1
 
     def save(self, *args, **kwargs):
         '''
-        Extended save() method to create a slug for the user.
+        Extended save() method to create a slug for the user and to revoke its tokens on deactivation.
         '''
+        if not self.is_active and getattr(self, "_loaded_is_active", False):
+            self.token_version += 1
+        if kwargs.get("update_fields") is not None and {"password", "is_active"} & set(kwargs["update_fields"]):
+            kwargs["update_fields"] = {*kwargs["update_fields"], "token_version"}
+
         if not self.username:
             self.username = self.phone
         self.username = self.username.lower()
@@ -98,6 +119,7 @@ class User(AbstractUser):
 
         self.user_slug = slugify(f"{self.username}")
         super(User, self).save(*args, **kwargs)
+        self._loaded_is_active = self.is_active
 
     def __str__(self):
         return self.username
@@ -0,0 +1,19 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from user_app.helpers import UserCache
+from user_app.models import User
+
+
+@receiver(post_save, sender=User)
+def invalidate_cached_user_on_save(sender, instance: User = None, *args, **kwargs):
+    ## After the commit, so a request cannot cache the row as it was before this save.
+    user_id, version = instance.pk, instance.token_version
+    transaction.on_commit(lambda: UserCache.invalidate(user_id=user_id, version=version), using=kwargs.get("using"))
+
+
+@receiver(post_delete, sender=User)
+def invalidate_cached_user_on_delete(sender, instance: User = None, *args, **kwargs):
+    user_id, version = instance.pk, instance.token_version
+    transaction.on_commit(lambda: UserCache.invalidate(user_id=user_id, version=version), using=kwargs.get("using"))
@@ -1,3 +1,278 @@
-from django.test import TestCase
+from tempfile import TemporaryDirectory
+from unittest import skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, router, transaction
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.db.routers import PrimaryReplicaRouter, ReplicaStickinessMiddleware
+from user_app.authentication import CachedJWTAuthentication
+from user_app.constants import TokenClaim
+from user_app.helpers import UserCache
+from user_app.models import User
+from user_app.utils import JWTUtils
+
+REPLICA = "replica_1"
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA])
+class PrimaryReplicaRouterTest(SimpleTestCase):
+    """
+    Routing decisions only: no query is run, so the replica alias does not need to exist.
+    """
+
+    def test_reads_go_to_a_replica(self):
+        self.assertEqual(router.db_for_read(User), REPLICA)
+
+    def test_writes_go_to_the_primary(self):
+        self.assertEqual(router.db_for_write(User), DEFAULT_DB_ALIAS)
+
+    def test_unrouted_models_stay_on_the_primary(self):
+        self.assertEqual(router.db_for_read(ContentType), DEFAULT_DB_ALIAS)
+
+    def test_use_primary_pins_reads(self):
+        with PrimaryReplicaRouter.use_primary():
+            self.assertEqual(router.db_for_read(User), DEFAULT_DB_ALIAS)
+
+        self.assertEqual(router.db_for_read(User), REPLICA)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_reads_use_the_primary(self):
+        self.assertEqual(router.db_for_read(User), DEFAULT_DB_ALIAS)
+
+    def test_writes_outside_requests_do_not_pin(self):
+        router.db_for_write(User)
+        self.assertEqual(router.db_for_read(User), REPLICA)
+
+
+@skipUnless(REPLICA in settings.DATABASES, "Needs a replica alias: run the tests with DB_REPLICA_HOSTS set.")
+class ReplicaRoutingTest(TransactionTestCase):
+    """
+    Against a primary and a replica mirroring it. Not a TestCase: its wrapping transaction
+    would keep every read on the primary.
+    """
+
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="reader", email="reader@example.com", password="secret-pass-1")
+        self.factory = RequestFactory()
+
+    def read_user(self) -> str:
+        ## The alias a routed read of the user was answered from.
+        return User.objects.get(pk=self.user.pk)._state.db
+
+    def respond(self, write: bool = False, cookies: dict = None):
+        """
+        Run a request through ReplicaStickinessMiddleware; the view optionally writes the user,
+        then reads it, and answers with the aliases read from before and after the write.
+        """
+        def view(request):
+            before = self.read_user()
+            if write:
+                User.objects.filter(pk=self.user.pk).update(first_name="Written")
+            return HttpResponse(f"{before},{self.read_user()}")
+
+        request = self.factory.get("/")
+        request.COOKIES.update(cookies or {})
+        return ReplicaStickinessMiddleware(get_response=view)(request)
+
+    def test_reads_are_served_by_the_replica(self):
+        self.assertEqual(self.read_user(), REPLICA)
+
+    def test_reads_in_transactions_use_the_primary(self):
+        with transaction.atomic():
+            self.assertEqual(self.read_user(), DEFAULT_DB_ALIAS)
+
+    def test_a_write_pins_the_rest_of_its_request(self):
+        response = self.respond(write=True)
+
+        self.assertEqual(response.content.decode(), f"{REPLICA},{DEFAULT_DB_ALIAS}")
+        self.assertIn(settings.DB_STICKY_COOKIE, response.cookies)
+
+    def test_a_writing_client_reads_its_writes_on_the_next_request(self):
+        cookie = self.respond(write=True).cookies[settings.DB_STICKY_COOKIE].value
+        response = self.respond(cookies={settings.DB_STICKY_COOKIE: cookie})
+
+        self.assertEqual(response.content.decode(), f"{DEFAULT_DB_ALIAS},{DEFAULT_DB_ALIAS}")
+        self.assertNotIn(settings.DB_STICKY_COOKIE, response.cookies)
+
+    def test_other_clients_keep_reading_replicas(self):
+        self.respond(write=True)
+        response = self.respond()
+
+        self.assertEqual(response.content.decode(), f"{REPLICA},{REPLICA}")
+        self.assertNotIn(settings.DB_STICKY_COOKIE, response.cookies)
+
+    def test_forged_cookies_do_not_pin(self):
+        response = self.respond(cookies={settings.DB_STICKY_COOKIE: "1"})
+
+        self.assertEqual(response.content.decode(), f"{REPLICA},{REPLICA}")
+
+    @override_settings(DB_STICKY_SECONDS=-1)
+    def test_stale_cookies_do_not_pin(self):
+        cookie = self.respond(write=True).cookies[settings.DB_STICKY_COOKIE].value
+        response = self.respond(cookies={settings.DB_STICKY_COOKIE: cookie})
+
+        self.assertEqual(response.content.decode(), f"{REPLICA},{REPLICA}")
+
+
+class TokenRevocationTest(TestCase):
+    """
+    Tokens carry the user's token_version; CachedJWTAuthentication rejects older ones.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="holder", email="holder@example.com", password="secret-pass-1")
+        self.token = self.issue()
+
+    def issue(self) -> AccessToken:
+        return AccessToken(JWTUtils.get_tokens_for_user(user=self.user)["accessToken"])
+
+    def authenticate(self, token: AccessToken = None) -> User:
+        with self.captureOnCommitCallbacks(execute=True):
+            return CachedJWTAuthentication().get_user(token)
+
+    def test_tokens_carry_the_users_version(self):
+        self.assertEqual(self.token[TokenClaim.VERSION], self.user.token_version)
+        self.assertEqual(self.authenticate(self.token), self.user)
+
+    def test_a_password_change_revokes_earlier_tokens(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password("secret-pass-2")
+            self.user.save(update_fields=["password"])
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(self.token)
+        self.assertEqual(self.authenticate(self.issue()), self.user)
+
+    def test_deactivation_revokes_tokens(self):
+        version = self.user.token_version
+        user = User.objects.get(pk=self.user.pk)
+        user.is_active = False
+        user.save()
+        user.save()
+
+        self.assertEqual(User.objects.get(pk=self.user.pk).token_version, version + 1)
+
+    def test_other_saves_keep_tokens(self):
+        self.user.first_name = "Renamed"
+        self.user.save()
+
+        self.assertEqual(self.authenticate(self.token), self.user)
+
+    def test_tokens_without_the_claim_are_version_0(self):
+        token = self.issue()
+        del token[TokenClaim.VERSION]
+        User.objects.filter(pk=self.user.pk).update(token_version=0)
+
+        self.assertEqual(self.authenticate(token).pk, self.user.pk)
+
+
+class UserCacheTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="cached", email="cached@example.com", password="secret-pass-1")
+
+    def cached(self, version: int = 0) -> User:
+        return UserCache.get(user_id=self.user.pk, version=version)
+
+    def share(self) -> None:
+        ## A file cache stands in for Redis or Memcached: every process reaches the same entries.
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        shared = {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": directory.name}
+        override = override_settings(CACHES={**settings.CACHES, settings.USER_AUTH_CACHE_ALIAS: shared})
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(caches[settings.USER_AUTH_CACHE_ALIAS].clear)
+
+    def test_per_process_caches_are_not_used(self):
+        UserCache.set(user=self.user)
+        self.assertIsNone(self.cached())
+
+    def test_users_are_cached_in_the_shared_alias(self):
+        self.assertIn(settings.USER_AUTH_CACHE_ALIAS, settings.CACHES)
+        self.assertNotEqual(settings.USER_AUTH_CACHE_ALIAS, "default")
+
+    def test_shared_caches_hold_users_until_they_change(self):
+        self.share()
+        token = AccessToken(JWTUtils.get_tokens_for_user(user=self.user)["accessToken"])
+        CachedJWTAuthentication().get_user(token)
+        self.assertEqual(self.cached(), self.user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password("secret-pass-2")
+            self.user.save()
+        self.assertIsNone(self.cached(version=0))
+        self.assertIsNone(self.cached(version=1))
+
+        ## A request that read the user before the change cannot put it back.
+        UserCache.set(user=self.user)
+        self.assertIsNone(self.cached(version=1))
+        with self.assertRaises(AuthenticationFailed):
+            CachedJWTAuthentication().get_user(token)
+
+    def test_entries_are_kept_per_token_version(self):
+        self.share()
+        User.objects.filter(pk=self.user.pk).update(token_version=1)
+        self.user.refresh_from_db()
+        CachedJWTAuthentication().get_user(AccessToken(JWTUtils.get_tokens_for_user(user=self.user)["accessToken"]))
+
+        self.assertEqual(self.cached(version=1), self.user)
+        self.assertIsNone(self.cached(version=0))
+
+
+@override_settings(RATE_LIMIT_ENABLED=True, RATE_LIMIT_STORE="memory",
+                   RATE_LIMITS={"user-password-login": {"ip": "3/60", "user": "2/60"}})
+class LoginRateLimitTest(TestCase):
+    """
+    RateLimitMiddleware on the login route. One client throughout: its handler holds the buckets.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="target", email="target@example.com", password="secret-pass-1")
+        self.client = Client()
+
+    def login(self, ip: str = "10.0.0.1", **body):
+        return self.client.post(reverse("user-password-login"), data={"password": "wrong", **body},
+                                content_type="application/json", REMOTE_ADDR=ip)
+
+    def test_rejections_carry_retry_after(self):
+        for index in range(3):
+            self.assertNotEqual(self.login(username=f"someone{index}").status_code, 429)
+        response = self.login(username="someone")
+
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response["Retry-After"]), 1)
+        self.assertEqual(response.json()["error"], "Too Many Requests")
+
+    def test_an_account_is_limited_across_addresses(self):
+        for index in range(2):
+            self.assertNotEqual(self.login(ip=f"10.0.1.{index}", username="Target").status_code, 429)
+
+        self.assertEqual(self.login(ip="10.0.1.9", username=" target ").status_code, 429)
+        self.assertNotEqual(self.login(ip="10.0.1.9", username="other").status_code, 429)
+
+    def test_rejected_requests_cost_no_query(self):
+        for _ in range(3):
+            self.login(username="someone")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.login(username="someone").status_code, 429)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.login(ip="10.0.2.1", username="someone").status_code, 429)
+
+    def test_requests_rejected_by_ip_leave_the_account_bucket_alone(self):
+        for index in range(3):
+            self.login(username=f"spray{index}")
+        for _ in range(3):
+            self.assertEqual(self.login(username="target").status_code, 429)
+
+        self.assertNotEqual(self.login(ip="10.0.3.1", username="target").status_code, 429)
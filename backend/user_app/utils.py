@@ -10,7 +10,7 @@ from django.db.models import Q, QuerySet
 from django.utils import timezone
 
 from core.boilerplate.template_responses import Resp
-from user_app.constants import UserRegex
+from user_app.constants import TokenClaim, UserRegex
 from user_app.helpers import OTPHelper
 from user_app.models import User, UserOTP
 from user_app.serializers import UserOutputSerializer, UserRegisterSerializer, UserOTPSerializer, UserPasswordResetTokenSerializer
@@ -25,6 +25,8 @@ class JWTUtils:
     @classmethod
     def get_tokens_for_user(cls, user: User = None):
         refresh = RefreshToken.for_user(user)
+        ## Copied into the access token too; see CachedJWTAuthentication.
+        refresh[TokenClaim.VERSION] = user.token_version
 
         return {
             'refreshToken': str(refresh),